@@ -8,6 +8,15 @@
 #
 
 from .kyototycoon import KyotoTycoon
+from .kt_pool import KyotoTycoonPool
+from .kt_cache import LocalCache, NearCache
+from .kt_batch import GetBatcher
+from .kt_coalesce import SingleFlight
+from .kt_writebehind import WriteBehind
+from .kt_counter import CounterAggregator
+from .kt_sharded import ShardedKyotoTycoon
+from .kt_replicated import ReplicatedKyotoTycoon
+from .kt_migrate import Migration
 
 from .kt_common import KT_PACKER_CUSTOM, \
                        KT_PACKER_PICKLE, \
@@ -19,4 +28,10 @@ from .kt_error import KyotoTycoonException
 
 from .kyotoslave import KyotoSlave, OP_SET, OP_REMOVE, OP_CLEAR
 
+try:
+    from .asynckyototycoon import AsyncKyotoTycoon
+    from .kt_batch_async import AsyncGetBatcher
+except (ImportError, SyntaxError):
+    pass  # ...requires Python 3.5 or later.
+
 # EOF - __init__.py
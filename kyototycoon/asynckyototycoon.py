@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Requires Python 3.5 or later (asyncio with "async/await" syntax).
+#
+
+from . import kt_binary_async
+from . import kt_http_async
+
+from .kt_common import KT_PACKER_PICKLE
+
+class AsyncKyotoTycoon(object):
+    def __init__(self, binary=False, pack_type=KT_PACKER_PICKLE, custom_packer=None, connections=None):
+        '''
+        Initialize an asyncio "Binary Protocol" or "HTTP Protocol" KyotoTycoon object.
+
+        With the binary protocol, requests are pipelined over (at most) "connections" connections
+        to the server. With HTTP, each request takes one of (at most) "connections" keep-alive
+        connections for itself. Either way, any number of coroutines can share the same object
+        with requests in flight at the same time.
+
+        '''
+
+        if binary:
+            self.atomic = False  # The binary protocol does not support atomic operations.
+            self.core = kt_binary_async.ProtocolHandler(pack_type, custom_packer,
+                                                        connections or kt_binary_async.DEFAULT_CONNECTIONS)
+        else:
+            self.atomic = True
+            self.core = kt_http_async.ProtocolHandler(pack_type, custom_packer,
+                                                      connections or kt_http_async.DEFAULT_CONNECTIONS)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    async def open(self, host='127.0.0.1', port=1978, timeout=30):
+        '''Open new connections to a KT server.'''
+
+        return True if await self.core.open(host, port, timeout) else False
+
+    async def connect(self, *args, **kwargs):
+        '''
+        Open new connections to a KT server.
+
+        The same as "open()" but returning "self" instead of a boolean, allowing
+        AsyncKyotoTycoon objects to be used in "async with" statements.
+
+        '''
+
+        return self if await self.open(*args, **kwargs) else None
+
+    async def close(self):
+        '''Close all open connections to the KT server.'''
+
+        return await self.core.close()
+
+    async def echo(self):
+        '''Check that the server is alive and responding.'''
+
+        return await self.core.echo()
+
+    async def report(self):
+        '''Get a server information report.'''
+
+        return await self.core.report()
+
+    async def status(self, db=0):
+        '''Get status information for the database.'''
+
+        return await self.core.status(db)
+
+    async def clear(self, db=0):
+        '''Remove all records in the database.'''
+
+        return await self.core.clear(db)
+
+    async def count(self, db=0):
+        '''Number of records in the database.'''
+
+        return await self.core.count(db)
+
+    async def size(self, db=0):
+        '''Current database size (in bytes).'''
+
+        return await self.core.size(db)
+
+    async def set(self, key, value, expire=None, db=0):
+        '''Set the value for a record.'''
+
+        return await self.core.set(key, value, expire, db)
+
+    async def add(self, key, value, expire=None, db=0):
+        '''Set the value for a record (does nothing if the record already exists).'''
+
+        return await self.core.add(key, value, expire, db)
+
+    async def replace(self, key, value, expire=None, db=0):
+        '''Replace the value of an existing record.'''
+
+        return await self.core.replace(key, value, expire, db)
+
+    async def append(self, key, value, expire=None, db=0):
+        '''Append "value" to the string value of a record.'''
+
+        return await self.core.append(key, value, expire, db)
+
+    async def increment(self, key, delta, expire=None, db=0):
+        '''Add "delta" to the numeric integer value of a record.'''
+
+        return await self.core.increment(key, delta, expire, db)
+
+    async def increment_double(self, key, delta, expire=None, db=0):
+        '''Add "delta" to the numeric double value of a record.'''
+
+        return await self.core.increment_double(key, delta, expire, db)
+
+    async def cas(self, key, old_val=None, new_val=None, expire=None, db=0):
+        '''If the old value of a record is "old_val", replace it with "new_val".'''
+
+        return await self.core.cas(key, old_val, new_val, expire, db)
+
+    async def remove(self, key, db=0):
+        '''Remove a record.'''
+
+        return await self.core.remove(key, db)
+
+    async def get(self, key, db=0):
+        '''Retrieve the value for a record.'''
+
+        return await self.core.get(key, db)
+
+    async def check(self, key, db=0):
+        '''Check that a record exists in the database.'''
+
+        return await self.core.check(key, db)
+
+    async def seize(self, key, db=0):
+        '''Retrieve the value for a record and immediately remove it.'''
+
+        return await self.core.seize(key, db)
+
+    async def get_int(self, key, db=0):
+        '''Retrieve the numeric integer value for a record.'''
+
+        return await self.core.get_int(key, db)
+
+    async def set_bulk(self, kv_dict, expire=None, atomic=None, db=0, noreply=False):
+        '''Set the values for several records at once.'''
+
+        return await self.core.set_bulk(kv_dict, expire, self.atomic if atomic is None else atomic, db, noreply)
+
+    async def remove_bulk(self, keys, atomic=None, db=0, noreply=False):
+        '''Remove several records at once.'''
+
+        return await self.core.remove_bulk(keys, self.atomic if atomic is None else atomic, db, noreply)
+
+    async def get_bulk(self, keys, atomic=None, db=0):
+        '''Retrieve the values for several records at once.'''
+
+        return await self.core.get_bulk(keys, self.atomic if atomic is None else atomic, db)
+
+    async def set_bulk_records(self, records, atomic=None, noreply=False):
+        '''Set several records at once, given as "(db, key, value, expire)" tuples.'''
+
+        return await self.core.set_bulk_records(records, self.atomic if atomic is None else atomic, noreply)
+
+    async def remove_bulk_records(self, records, atomic=None, noreply=False):
+        '''Remove several records at once, given as "(db, key)" tuples.'''
+
+        return await self.core.remove_bulk_records(records, self.atomic if atomic is None else atomic, noreply)
+
+    async def get_bulk_records(self, records, atomic=None):
+        '''Retrieve several records at once, given as "(db, key)" tuples.'''
+
+        return await self.core.get_bulk_records(records, self.atomic if atomic is None else atomic)
+
+    async def vacuum(self, db=0):
+        '''Scan the database and eliminate regions of expired records.'''
+
+        return await self.core.vacuum(db)
+
+    async def match_prefix(self, prefix, limit=None, db=0):
+        '''Get keys matching a prefix string.'''
+
+        return await self.core.match_prefix(prefix, limit, db)
+
+    async def match_regex(self, regex, limit=None, db=0):
+        '''Get keys matching a ragular expression string.'''
+
+        return await self.core.match_regex(regex, limit, db)
+
+    async def match_similar(self, origin, distance=0, limit=None, db=0):
+        '''Get keys similar to the origin string, based on the levenshtein distance.'''
+
+        return await self.core.match_similar(origin, distance, limit, db)
+
+    def cursor(self):
+        '''
+        Obtain a new (uninitialized) record cursor (HTTP protocol only).
+
+        The cursor holds one of the connections until it's deleted, so use it in an "async with"
+        statement or call "delete()" when done. It can be used with "async for" to iterate over
+        all (key,value) pairs in the database.
+
+        '''
+
+        return self.core.cursor()
+
+    async def play_script(self, name, kv_dict=None, noreply=False):
+        '''
+        Call a procedure of the scripting language extension.
+
+        As with "KyotoTycoon.play_script()", no implicit packing/unpacking is done.
+
+        '''
+
+        return await self.core.play_script(name, kv_dict, noreply)
+
+# EOF - asynckyototycoon.py
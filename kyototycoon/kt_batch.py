@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+import time
+
+from collections import deque
+
+from .kt_error import KyotoTycoonException
+
+# How long (in seconds) to wait for more requests before sending a batch, by default...
+DEFAULT_BATCH_WINDOW = 0.0002
+
+# Maximum number of requests in a single batch, by default...
+DEFAULT_BATCH_KEYS = 100
+
+class BatchedRequest(object):
+    '''A single "get" or "check" request, answered when its batch completes.'''
+
+    def __init__(self, key, db):
+        self.key = key
+        self.db = db
+
+        self.done = threading.Event()
+        self.found = False
+        self.value = None
+        self.error = None
+
+    def result(self, timeout=None):
+        '''Wait for the "(found, value)" pair for the request, raising its error if it failed.'''
+
+        if not self.done.wait(timeout):
+            raise KyotoTycoonException('timed out waiting for batched request')
+
+        if self.error is not None:
+            raise self.error
+
+        return self.found, self.value
+
+    def _set_result(self, found, value):
+        self.found = found
+        self.value = value
+        self.done.set()
+
+    def _set_error(self, error):
+        self.error = error
+        self.done.set()
+
+
+class GetBatcher(object):
+    def __init__(self, kt, window=DEFAULT_BATCH_WINDOW, max_keys=DEFAULT_BATCH_KEYS, timeout=None):
+        '''
+        Initialize a front end turning concurrent "get()" and "check()" calls into "get_bulk()".
+
+        Calls made from any number of threads are queued, and a background thread sends them
+        as a single "get_bulk()" (per database) once "window" seconds have passed since the
+        first one arrived, or as soon as "max_keys" are waiting. While a batch is in flight,
+        new calls keep accumulating for the next one. Callers block until their own result
+        is ready (or "timeout" seconds have passed).
+
+        Only the background thread uses "kt", so a plain KyotoTycoon object can be used here.
+
+        '''
+
+        if max_keys < 1:
+            raise ValueError('batches must allow at least one key')
+
+        self.kt = kt
+        self.window = window
+        self.max_keys = max_keys
+        self.timeout = timeout
+
+        self.queue = deque()
+        self.lock = threading.Condition()
+        self.closed = False
+
+        self.batches = 0
+        self.requests = 0
+
+        self.thread = threading.Thread(target=self._run, name='GetBatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def get(self, key, db=0):
+        '''Retrieve the value for a record (batched with other concurrent calls).'''
+
+        return self.submit(key, db).result(self.timeout)[1]
+
+    def check(self, key, db=0):
+        '''Check that a record exists in the database (batched with other concurrent calls).'''
+
+        return self.submit(key, db).result(self.timeout)[0]
+
+    def submit(self, key, db=0):
+        '''Queue a request for a record without waiting, returning a "BatchedRequest" for it.'''
+
+        request = BatchedRequest(key, db)
+
+        with self.lock:
+            if self.closed:
+                raise KyotoTycoonException('batcher is closed')
+
+            self.queue.append(request)
+            self.requests += 1
+
+            if len(self.queue) == 1 or len(self.queue) >= self.max_keys:
+                self.lock.notify()
+
+        return request
+
+    def close(self):
+        '''Stop the background thread, once any queued requests have been sent.'''
+
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+
+        self.thread.join()
+        return True
+
+    def stats(self):
+        '''Return the number of requests received and batches sent so far.'''
+
+        with self.lock:
+            return {'requests': self.requests, 'batches': self.batches, 'queued': len(self.queue)}
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.lock.wait()
+
+                if not self.queue:  # ...closed.
+                    return
+
+                # Give other requests a chance to join the batch...
+                deadline = time.time() + self.window
+                while len(self.queue) < self.max_keys and not self.closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+
+                    self.lock.wait(remaining)
+
+                batch = [self.queue.popleft() for i in range(min(len(self.queue), self.max_keys))]
+                self.batches += 1
+
+            self._execute(batch)
+
+    def _execute(self, batch):
+        by_db = {}
+        for request in batch:
+            by_db.setdefault(request.db, {}).setdefault(request.key, []).append(request)
+
+        for db, requests in by_db.items():
+            try:
+                values = self.kt.get_bulk(list(requests.keys()), db=db)
+            except Exception as e:
+                for key_requests in requests.values():
+                    for request in key_requests:
+                        request._set_error(e)
+                continue
+
+            for key, key_requests in requests.items():
+                found = key in values
+                for request in key_requests:
+                    request._set_result(found, values.get(key))
+
+# EOF - kt_batch.py
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Requires Python 3.5 or later (asyncio with "async/await" syntax).
+#
+
+import asyncio
+
+from .kt_batch import DEFAULT_BATCH_WINDOW, \
+                      DEFAULT_BATCH_KEYS
+
+# Only called from coroutines and loop callbacks ("get_running_loop()" is new in Python 3.7)...
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+class AsyncGetBatcher(object):
+    def __init__(self, kt, window=DEFAULT_BATCH_WINDOW, max_keys=DEFAULT_BATCH_KEYS):
+        '''
+        Initialize a front end turning concurrent "get()" and "check()" coroutine calls on an
+        AsyncKyotoTycoon object into "get_bulk()" calls.
+
+        Calls are sent as a single "get_bulk()" (per database) once "window" seconds have passed
+        since the first one arrived, or as soon as "max_keys" are waiting. Unlike "GetBatcher",
+        batches don't wait for each other, since the asyncio client supports concurrent requests.
+
+        '''
+
+        if max_keys < 1:
+            raise ValueError('batches must allow at least one key')
+
+        self.kt = kt
+        self.window = window
+        self.max_keys = max_keys
+
+        self.pending = {}  # ...waiting futures, by database and key.
+        self.num_pending = 0
+        self.flush_handle = None
+        self.fetches = set()  # ...the loop only keeps weak references to tasks.
+
+        self.batches = 0
+        self.requests = 0
+
+    async def get(self, key, db=0):
+        '''Retrieve the value for a record (batched with other concurrent calls).'''
+
+        found, value = await self._submit(key, db)
+        return value
+
+    async def check(self, key, db=0):
+        '''Check that a record exists in the database (batched with other concurrent calls).'''
+
+        found, value = await self._submit(key, db)
+        return found
+
+    def flush(self):
+        '''Send all waiting calls right away.'''
+
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        pending, self.pending = self.pending, {}
+        self.num_pending = 0
+
+        for db, waiters in pending.items():
+            self.batches += 1
+            task = asyncio.ensure_future(self._fetch(db, waiters))
+            self.fetches.add(task)
+            task.add_done_callback(self.fetches.discard)
+
+    def stats(self):
+        '''Return the number of requests received and batches sent so far.'''
+
+        return {'requests': self.requests, 'batches': self.batches, 'queued': self.num_pending}
+
+    def _submit(self, key, db):
+        future = _running_loop().create_future()
+
+        self.pending.setdefault(db, {}).setdefault(key, []).append(future)
+        self.num_pending += 1
+        self.requests += 1
+
+        if self.num_pending >= self.max_keys:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = _running_loop().call_later(self.window, self.flush)
+
+        return future
+
+    async def _fetch(self, db, waiters):
+        try:
+            values = await self.kt.get_bulk(list(waiters.keys()), db=db)
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():  # ...may have been cancelled.
+                        future.set_exception(e)
+            return
+
+        for key, futures in waiters.items():
+            result = (key in values, values.get(key))
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+
+# EOF - kt_batch_async.py
@@ -12,13 +12,20 @@
 import socket
 import struct
 
+from collections import deque
+
 from .kt_error import KyotoTycoonException
+from .kt_socket import BufferedReader
 
 from .kt_common import KT_PACKER_CUSTOM, \
                        KT_PACKER_PICKLE, \
                        KT_PACKER_JSON, \
                        KT_PACKER_STRING, \
-                       KT_PACKER_BYTES
+                       KT_PACKER_BYTES, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES, \
+                       chunked, \
+                       key_size
 
 try:
     import cPickle as pickle
@@ -32,12 +39,254 @@ MB_GET_BULK = 0xba
 MB_REMOVE_BULK = 0xb9
 MB_PLAY_SCRIPT = 0xb4
 
+# The server doesn't send any reply when this flag is set...
+MB_FLAG_NOREPLY = 0x01
+
 # Maximum signed 64bit integer...
 DEFAULT_EXPIRE = 0x7fffffffffffffff
 
+# Precompiled reply fields...
+_MAGIC = struct.Struct('!B')
+_COUNT = struct.Struct('!I')
+_BULK_RECORD = struct.Struct('!HIIq')
+_SCRIPT_RECORD = struct.Struct('!II')
+
+class PendingReply(object):
+    '''Future-like handle for the reply to a request sent through a pipeline.'''
+
+    def __init__(self, pipeline, reader=None, transform=None):
+        self.pipeline = pipeline
+        self.reader = reader
+        self.transform = transform
+
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def result(self):
+        '''Return the reply, reading any outstanding replies that precede it.'''
+
+        if not self.done:
+            self.pipeline._resolve(self)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+    def _set_result(self, value):
+        self.value = value if self.transform is None else self.transform(value)
+        self.done = True
+
+    def _set_error(self, error):
+        self.error = error
+        self.done = True
+
+
+class Pipeline(object):
+    '''
+    Queue several requests on the same connection and read the replies afterwards, in order.
+
+    Requests are written to the socket when the pipeline is flushed (which happens automatically
+    once "max_pending" replies are outstanding), so the round trip is paid once per batch instead
+    of once per request. Each call returns a "PendingReply" handle whose "result()" method gives
+    the same value the equivalent (non-pipelined) call would have returned.
+
+    '''
+
+    def __init__(self, protocol_handler, max_pending=64):
+        if max_pending < 1:
+            raise ValueError('at least one pending request must be allowed')
+
+        self.protocol_handler = protocol_handler
+        self.max_pending = max_pending
+
+        self.requests = []  # ...encoded, but not yet written.
+        self.pending = deque()  # ...written (or about to), awaiting replies.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.execute()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get(self, key, db=0):
+        def transform(values):
+            # This should never occur, but it does. What's happening?
+            if values and key not in values:
+                raise KyotoTycoonException('key mismatch: ' + repr(values))
+
+            return values[key] if values else None
+
+        return self._queue(self.protocol_handler._get_bulk_request([key], db),
+                           self.protocol_handler._get_bulk_reply, transform)
+
+    def set(self, key, value, expire=None, db=0):
+        return self._queue(self.protocol_handler._set_bulk_request({key: value}, expire, db),
+                           self.protocol_handler._set_bulk_reply, lambda numitems: numitems > 0)
+
+    def remove(self, key, db=0):
+        return self._queue(self.protocol_handler._remove_bulk_request([key], db),
+                           self.protocol_handler._remove_bulk_reply, lambda numitems: numitems > 0)
+
+    def get_bulk(self, keys, atomic=False, db=0):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(keys) < 1:
+            return self._resolved({})
+
+        return self._queue(self.protocol_handler._get_bulk_request(keys, db),
+                           self.protocol_handler._get_bulk_reply)
+
+    def set_bulk(self, kv_dict, expire=None, atomic=False, db=0, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if isinstance(kv_dict, dict) and len(kv_dict) < 1:
+            return self._resolved(None if noreply else 0)
+
+        if noreply:
+            return self._queue_noreply(self.protocol_handler._set_bulk_request(kv_dict, expire, db,
+                                                                               MB_FLAG_NOREPLY))
+
+        return self._queue(self.protocol_handler._set_bulk_request(kv_dict, expire, db),
+                           self.protocol_handler._set_bulk_reply)
+
+    def remove_bulk(self, keys, atomic=False, db=0, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(keys) < 1:
+            return self._resolved(None if noreply else 0)
+
+        if noreply:
+            return self._queue_noreply(self.protocol_handler._remove_bulk_request(keys, db,
+                                                                                  MB_FLAG_NOREPLY))
+
+        return self._queue(self.protocol_handler._remove_bulk_request(keys, db),
+                           self.protocol_handler._remove_bulk_reply)
+
+    def set_bulk_records(self, records, atomic=False, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        pack = self.protocol_handler.pack
+        records = [(db, key, pack(value), expire) for db, key, value, expire in records]
+        if len(records) < 1:
+            return self._resolved(None if noreply else 0)
+
+        if noreply:
+            return self._queue_noreply(self.protocol_handler._set_records_request(records, MB_FLAG_NOREPLY))
+
+        return self._queue(self.protocol_handler._set_records_request(records),
+                           self.protocol_handler._set_bulk_reply)
+
+    def remove_bulk_records(self, records, atomic=False, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(records) < 1:
+            return self._resolved(None if noreply else 0)
+
+        if noreply:
+            return self._queue_noreply(self.protocol_handler._keys_request(MB_REMOVE_BULK, records,
+                                                                           MB_FLAG_NOREPLY))
+
+        return self._queue(self.protocol_handler._keys_request(MB_REMOVE_BULK, records),
+                           self.protocol_handler._remove_bulk_reply)
+
+    def get_bulk_records(self, records, atomic=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(records) < 1:
+            return self._resolved([])
+
+        return self._queue(self.protocol_handler._keys_request(MB_GET_BULK, records),
+                           self.protocol_handler._get_records_reply)
+
+    def play_script(self, name, kv_dict=None, noreply=False):
+        if noreply:
+            return self._queue_noreply(self.protocol_handler._play_script_request(name, kv_dict,
+                                                                                  MB_FLAG_NOREPLY))
+
+        return self._queue(self.protocol_handler._play_script_request(name, kv_dict),
+                           self.protocol_handler._play_script_reply)
+
+    def flush(self):
+        '''Write all queued requests to the server (in a single system call).'''
+
+        if self.requests:
+            request = b''.join(self.requests)
+            self.requests = []
+            self.protocol_handler._write(request)
+
+    def execute(self):
+        '''
+        Flush the pipeline and return the results for all outstanding requests, in order.
+
+        Requests that failed are represented in the results by their exception objects.
+
+        '''
+
+        handles = list(self.pending)
+        if handles:
+            self._resolve(handles[-1])
+
+        results = []
+        for handle in handles:
+            results.append(handle.error if handle.error is not None else handle.value)
+
+        return results
+
+    def _queue(self, request, reader, transform=None):
+        # Bound the number of unanswered requests, otherwise both ends
+        # could block writing to each other with full socket buffers...
+        if len(self.pending) >= self.max_pending:
+            self._resolve(self.pending[0])
+
+        handle = PendingReply(self, reader, transform)
+        self.requests.append(request)
+        self.pending.append(handle)
+
+        return handle
+
+    def _queue_noreply(self, request):
+        # Nothing will come back, so there's nothing to wait for either...
+        self.requests.append(request)
+        return self._resolved(None)
+
+    def _resolved(self, value):
+        handle = PendingReply(self)
+        handle._set_result(value)
+        return handle
+
+    def _resolve(self, handle):
+        self.flush()
+
+        while self.pending and not handle.done:
+            current = self.pending.popleft()
+
+            try:
+                current._set_result(current.reader())
+            except KyotoTycoonException as e:
+                current._set_error(e)
+            except Exception as e:
+                # The connection is no longer usable, fail everything that's still pending...
+                current._set_error(e)
+                while self.pending:
+                    self.pending.popleft()._set_error(e)
+
+
 class ProtocolHandler(object):
     def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None):
         self.socket = None
+        self.reader = None
 
         if pack_type != KT_PACKER_CUSTOM and custom_packer is not None:
             raise KyotoTycoonException('custom packer object supported for "KT_PACKER_CUSTOM" only')
@@ -74,6 +323,7 @@ class ProtocolHandler(object):
 
     def open(self, host, port, timeout):
         self.socket = socket.create_connection((host, port), timeout)
+        self.reader = BufferedReader(self.socket)
         return True
 
     def close(self):
@@ -81,6 +331,13 @@ class ProtocolHandler(object):
         self.socket.close()
         return True
 
+    def echo(self):
+        # There's no "echo" in the binary protocol, but an empty "get_bulk" is just as cheap...
+        self._write(self._keys_request(MB_GET_BULK, []))
+        self._get_bulk_reply()
+
+        return True
+
     def get(self, key, db=0):
         values = self.get_bulk([key], False, db)
 
@@ -96,82 +353,122 @@ class ProtocolHandler(object):
     def seize(self, key, db=0):
         raise NotImplementedError('supported under the HTTP procotol only')
 
-    def set_bulk(self, kv_dict, expire, atomic, db=0):
+    def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
         if atomic:
             raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
         if isinstance(kv_dict, dict) and len(kv_dict) < 1:
-            return 0  # ...done
+            return None if noreply else 0  # ...done
 
-        if expire is None:
-            expire = DEFAULT_EXPIRE
+        if noreply:
+            self._write(self._set_bulk_request(kv_dict, expire, db, MB_FLAG_NOREPLY))
+            return None
 
-        request = [struct.pack('!BII', MB_SET_BULK, 0, len(kv_dict))]
+        self._write(self._set_bulk_request(kv_dict, expire, db))
+        return self._set_bulk_reply()
 
-        for key, value in kv_dict.items():
-            key = key.encode('utf-8')
-            value = self.pack(value)
-            request.extend([struct.pack('!HIIq', db, len(key), len(value), expire), key, value])
+    def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
-        self._write(b''.join(request))
+        if len(keys) < 1:
+            return None if noreply else 0  # ...done
 
-        magic, = struct.unpack('!B', self._read(1))
-        if magic != MB_SET_BULK:
-            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+        if noreply:
+            self._write(self._remove_bulk_request(keys, db, MB_FLAG_NOREPLY))
+            return None
 
-        # Number of items set...
-        return struct.unpack('!I', self._read(4))[0]
+        self._write(self._remove_bulk_request(keys, db))
+        return self._remove_bulk_reply()
 
-    def remove_bulk(self, keys, atomic, db=0):
+    def get_bulk(self, keys, atomic, db=0):
         if atomic:
             raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
         if len(keys) < 1:
-            return 0  # ...done
+            return {}  # ...done
 
-        request = [struct.pack('!BII', MB_REMOVE_BULK, 0, len(keys))]
+        self._write(self._get_bulk_request(keys, db))
+        return self._get_bulk_reply()
 
-        for key in keys:
-            key = key.encode('utf-8')
-            request.extend([struct.pack('!HI', db, len(key)), key])
+    def set_bulk_records(self, records, atomic, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
-        self._write(b''.join(request))
+        records = [(db, key, self.pack(value), expire) for db, key, value, expire in records]
+        if len(records) < 1:
+            return None if noreply else 0  # ...done
 
-        magic, = struct.unpack('!B', self._read(1))
-        if magic != MB_REMOVE_BULK:
-            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+        if noreply:
+            self._write(self._set_records_request(records, MB_FLAG_NOREPLY))
+            return None
 
-        # Number of items removed...
-        return struct.unpack('!I', self._read(4))[0]
+        self._write(self._set_records_request(records))
+        return self._set_bulk_reply()
 
-    def get_bulk(self, keys, atomic, db=0):
+    def remove_bulk_records(self, records, atomic, noreply=False):
         if atomic:
             raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
-        if len(keys) < 1:
-            return {}  # ...done
+        if len(records) < 1:
+            return None if noreply else 0  # ...done
 
-        request = [struct.pack('!BII', MB_GET_BULK, 0, len(keys))]
+        if noreply:
+            self._write(self._keys_request(MB_REMOVE_BULK, records, MB_FLAG_NOREPLY))
+            return None
 
-        for key in keys:
-            key = key.encode('utf-8')
-            request.extend([struct.pack('!HI', db, len(key)), key])
+        self._write(self._keys_request(MB_REMOVE_BULK, records))
+        return self._remove_bulk_reply()
 
-        self._write(b''.join(request))
+    def get_bulk_records(self, records, atomic):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
 
-        magic, = struct.unpack('!B', self._read(1))
-        if magic != MB_GET_BULK:
-            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+        if len(records) < 1:
+            return []  # ...done
 
-        num_items, = struct.unpack('!I', self._read(4))
-        items = {}
-        for i in range(num_items):
-            key_db, key_length, value_length, key_expire = struct.unpack('!HIIq', self._read(18))
-            key = self._read(key_length)
-            value = self._read(value_length)
-            items[key.decode('utf-8')] = self.unpack(value)
+        self._write(self._keys_request(MB_GET_BULK, records))
+        return self._get_records_reply()
 
-        return items
+    def iter_get_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                            in_flight=2):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        replies = self._iter_chunks(chunked(keys, chunk_keys, chunk_bytes),
+                                    lambda pipe, chunk: pipe.get_bulk(chunk, False, db),
+                                    in_flight)
+
+        return (item for items in replies for item in items.items())
+
+    def iter_set_bulk(self, kv_items, expire, atomic, db=0, chunk_keys=KT_CHUNK_KEYS,
+                            chunk_bytes=KT_CHUNK_BYTES, in_flight=2, on_chunk=None):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if isinstance(kv_items, dict):
+            kv_items = kv_items.items()
+
+        packed_items = ((key, self.pack(value)) for key, value in kv_items)
+        chunks = chunked(packed_items, chunk_keys, chunk_bytes, lambda kv: key_size(kv[0]) + len(kv[1]))
+
+        def queue(pipe, chunk):
+            return pipe._queue(self._set_bulk_packed_request(chunk, expire, db), self._set_bulk_reply)
+
+        if on_chunk is not None:
+            keys_done = on_chunk
+            on_chunk = lambda chunk: keys_done([key for key, value in chunk])
+
+        return self._iter_chunks(chunks, queue, in_flight, on_chunk)
+
+    def iter_remove_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                               in_flight=2, on_chunk=None):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        return self._iter_chunks(chunked(keys, chunk_keys, chunk_bytes),
+                                 lambda pipe, chunk: pipe.remove_bulk(chunk, False, db),
+                                 in_flight, on_chunk)
 
     def get_int(self, key, db=0):
         raise NotImplementedError('supported under the HTTP procotol only')
@@ -188,6 +485,17 @@ class ProtocolHandler(object):
     def match_similar(self, origin, distance, limit, db=0):
         raise NotImplementedError('supported under the HTTP procotol only')
 
+    def get_with_expire(self, key, db=0):
+        records = self.get_bulk_records([(db, key)], False)
+        if not records:
+            return None, None
+
+        return records[0][2], records[0][3]
+
+    def get_bulk_with_expire(self, keys, atomic, db=0):
+        records = self.get_bulk_records([(db, key) for key in keys], atomic)
+        return dict((key, (value, expire)) for key_db, key, value, expire in records)
+
     def set(self, key, value, expire, db=0):
         numitems = self.set_bulk({key: value}, expire, False, db)
         return numitems > 0
@@ -229,12 +537,150 @@ class ProtocolHandler(object):
     def size(self, db=0):
         raise NotImplementedError('supported under the HTTP procotol only')
 
-    def play_script(self, name, kv_dict=None):
+    def play_script(self, name, kv_dict=None, noreply=False):
+        if noreply:
+            self._write(self._play_script_request(name, kv_dict, MB_FLAG_NOREPLY))
+            return None
+
+        self._write(self._play_script_request(name, kv_dict))
+        return self._play_script_reply()
+
+    def pipeline(self, max_pending=64):
+        return Pipeline(self, max_pending)
+
+    def _iter_chunks(self, chunks, queue, in_flight, on_chunk=None):
+        '''
+        Send one request per chunk, keeping up to "in_flight" of them unanswered. When given,
+        "on_chunk(chunk)" is called for each chunk sent, once its request is done (or failed,
+        or was abandoned along with the generator).
+
+        '''
+
+        if in_flight < 1:
+            raise ValueError('at least one request must be allowed in flight')
+
+        pipe = self.pipeline(in_flight)
+        pending = deque()
+
+        def done(reply, chunk):
+            try:
+                return reply.result()
+            finally:
+                if on_chunk is not None:
+                    on_chunk(chunk)
+
+        try:
+            for chunk in chunks:
+                pending.append((queue(pipe, chunk), chunk))
+                pipe.flush()
+
+                if len(pending) >= in_flight:
+                    yield done(*pending.popleft())
+
+            while pending:
+                yield done(*pending.popleft())
+        finally:
+            try:
+                # Replies must always be read, otherwise the connection is left out of sync...
+                pipe.execute()
+            finally:
+                if on_chunk is not None:
+                    for reply, chunk in pending:
+                        on_chunk(chunk)
+
+    def _set_bulk_request(self, kv_dict, expire, db, flags=0):
+        return self._set_bulk_packed_request([(key, self.pack(value)) for key, value in kv_dict.items()],
+                                             expire, db, flags)
+
+    def _set_bulk_packed_request(self, kv_items, expire, db, flags=0):
+        return self._set_records_request([(db, key, value, expire) for key, value in kv_items], flags)
+
+    def _set_records_request(self, records, flags=0):
+        request = [struct.pack('!BII', MB_SET_BULK, flags, len(records))]
+
+        for db, key, value, expire in records:
+            if expire is None:
+                expire = DEFAULT_EXPIRE
+
+            key = key.encode('utf-8')
+            request.extend([struct.pack('!HIIq', db, len(key), len(value), expire), key, value])
+
+        return b''.join(request)
+
+    def _set_bulk_reply(self):
+        magic, = self.reader.unpack(_MAGIC)
+        if magic != MB_SET_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        # Number of items set...
+        return self.reader.unpack(_COUNT)[0]
+
+    def _remove_bulk_request(self, keys, db, flags=0):
+        return self._keys_request(MB_REMOVE_BULK, [(db, key) for key in keys], flags)
+
+    def _keys_request(self, magic, records, flags=0):
+        request = [struct.pack('!BII', magic, flags, len(records))]
+
+        for db, key in records:
+            key = key.encode('utf-8')
+            request.extend([struct.pack('!HI', db, len(key)), key])
+
+        return b''.join(request)
+
+    def _remove_bulk_reply(self):
+        magic, = self.reader.unpack(_MAGIC)
+        if magic != MB_REMOVE_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        # Number of items removed...
+        return self.reader.unpack(_COUNT)[0]
+
+    def _get_bulk_request(self, keys, db):
+        return self._keys_request(MB_GET_BULK, [(db, key) for key in keys])
+
+    def _get_bulk_reply(self):
+        magic, = self.reader.unpack(_MAGIC)
+        if magic != MB_GET_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        read = self.reader.read
+        unpack_record = self.reader.unpack
+
+        num_items, = unpack_record(_COUNT)
+        items = {}
+        for i in range(num_items):
+            key_db, key_length, value_length, key_expire = unpack_record(_BULK_RECORD)
+            key = read(key_length)
+            value = read(value_length)
+            items[key.decode('utf-8')] = self.unpack(value)
+
+        return items
+
+    def _get_records_reply(self):
+        magic, = self.reader.unpack(_MAGIC)
+        if magic != MB_GET_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        read = self.reader.read
+        unpack_record = self.reader.unpack
+
+        num_items, = unpack_record(_COUNT)
+        records = []
+        for i in range(num_items):
+            key_db, key_length, value_length, key_expire = unpack_record(_BULK_RECORD)
+            key = read(key_length)
+            value = read(value_length)
+            records.append((key_db, key.decode('utf-8'), self.unpack(value),
+                            None if key_expire >= DEFAULT_EXPIRE else key_expire))
+
+        return records
+
+    def _play_script_request(self, name, kv_dict, flags=0):
         if kv_dict is None:
             kv_dict = {}
 
         name = name.encode('utf-8')
-        request = [struct.pack('!BIII', MB_PLAY_SCRIPT, 0, len(name), len(kv_dict)), name]
+        request = [struct.pack('!BIII', MB_PLAY_SCRIPT, flags, len(name), len(kv_dict)), name]
 
         for key, value in kv_dict.items():
             if not isinstance(value, bytes):
@@ -243,18 +689,22 @@ class ProtocolHandler(object):
             key = key.encode('utf-8')
             request.extend([struct.pack('!II', len(key), len(value)), key, value])
 
-        self._write(b''.join(request))
+        return b''.join(request)
 
-        magic, = struct.unpack('!B', self._read(1))
+    def _play_script_reply(self):
+        magic, = self.reader.unpack(_MAGIC)
         if magic != MB_PLAY_SCRIPT:
             raise KyotoTycoonException('bad response [%s]' % hex(magic))
 
-        num_items, = struct.unpack('!I', self._read(4))
+        read = self.reader.read
+        unpack_record = self.reader.unpack
+
+        num_items, = unpack_record(_COUNT)
         items = {}
         for i in range(num_items):
-            key_length, value_length = struct.unpack('!II', self._read(8))
-            key = self._read(key_length)
-            value = self._read(value_length)
+            key_length, value_length = unpack_record(_SCRIPT_RECORD)
+            key = read(key_length)
+            value = read(value_length)
             items[key.decode('utf-8')] = value
 
         return items
@@ -263,16 +713,6 @@ class ProtocolHandler(object):
         self.socket.sendall(data)
 
     def _read(self, bytecnt):
-        buf = []
-        read = 0
-        while read < bytecnt:
-            recv = self.socket.recv(bytecnt - read)
-            if not recv:
-                raise IOError('no data while reading')
-
-            buf.append(recv)
-            read += len(recv)
-
-        return b''.join(buf)
+        return self.reader.read(bytecnt)
 
 # EOF - kt_binary.py
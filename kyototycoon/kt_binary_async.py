@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Requires Python 3.5 or later (asyncio with "async/await" syntax).
+#
+
+import asyncio
+import collections
+
+from . import kt_binary
+
+from .kt_error import KyotoTycoonException
+
+from .kt_binary import MB_SET_BULK, \
+                       MB_GET_BULK, \
+                       MB_REMOVE_BULK, \
+                       MB_PLAY_SCRIPT, \
+                       MB_FLAG_NOREPLY, \
+                       DEFAULT_EXPIRE
+
+from .kt_common import KT_PACKER_PICKLE
+
+_MAGIC = kt_binary._MAGIC
+_COUNT = kt_binary._COUNT
+_BULK_RECORD = kt_binary._BULK_RECORD
+_SCRIPT_RECORD = kt_binary._SCRIPT_RECORD
+
+# Number of connections requests are spread over, by default...
+DEFAULT_CONNECTIONS = 2
+
+class Connection(object):
+    '''
+    A single connection to the server, with any number of requests in flight.
+
+    Requests are written as soon as they're made, and a background task reads the replies
+    back in the same order, handing each one to the future waiting for it.
+
+    '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+        self.pending = collections.deque()
+        self.has_pending = asyncio.Event()
+        self.error = None
+
+        self.task = asyncio.ensure_future(self._read_replies())
+
+    def send(self, request, decoder):
+        '''Write a request and return a future for its reply ("decoder" is "None" with no-reply).'''
+
+        if self.error is not None:
+            raise self.error
+
+        future = asyncio.get_event_loop().create_future() if decoder is not None else None
+
+        # There's no "await" between queueing and writing, so requests never get reordered...
+        if future is not None:
+            self.pending.append((future, decoder))
+            self.has_pending.set()
+
+        self.writer.write(request)
+
+        return future
+
+    async def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+        self._fail(KyotoTycoonException('connection closed'))
+
+    async def read(self, bytecnt):
+        try:
+            return await self.reader.readexactly(bytecnt)
+        except asyncio.IncompleteReadError:
+            raise IOError('no data while reading')
+
+    async def unpack(self, fmt):
+        return fmt.unpack(await self.read(fmt.size))
+
+    async def _read_replies(self):
+        try:
+            while True:
+                if not self.pending:
+                    self.has_pending.clear()
+                    await self.has_pending.wait()
+                    continue
+
+                future, decoder = self.pending[0]
+
+                try:
+                    result = await decoder(self)
+                except KyotoTycoonException as e:
+                    # An error reply, but the connection can still be used...
+                    self.pending.popleft()
+                    if not future.done():
+                        # Drop the traceback, which would keep this (still running) task's frame...
+                        future.set_exception(e.with_traceback(None))
+                    continue
+
+                self.pending.popleft()
+                if not future.done():  # ...may have been cancelled on timeout.
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+            self.writer.close()
+
+    def _fail(self, error):
+        self.error = error
+
+        while self.pending:
+            future, decoder = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+
+class ProtocolHandler(kt_binary.ProtocolHandler):
+    '''
+    Binary protocol handler for asyncio, multiplexing requests over a few connections.
+
+    Request encoding and packing are shared with the blocking handler it derives from, but
+    all methods supported by the binary protocol are coroutines here.
+
+    '''
+
+    def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None, connections=DEFAULT_CONNECTIONS):
+        kt_binary.ProtocolHandler.__init__(self, pack_type, custom_packer)
+
+        if connections < 1:
+            raise ValueError('at least one connection is required')
+
+        self.num_connections = connections
+        self.connections = []
+        self.timeout = None
+
+    def pipeline(self, max_pending=64):
+        raise NotImplementedError('not needed with asyncio, since requests are always pipelined')
+
+    def iter_get_bulk(self, *args, **kwargs):
+        raise NotImplementedError('not supported by the asyncio client')
+
+    iter_set_bulk = iter_remove_bulk = iter_get_bulk
+
+    async def open(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        for i in range(self.num_connections):
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            self.connections.append(Connection(reader, writer))
+
+        return True
+
+    async def close(self):
+        connections, self.connections = self.connections, []
+
+        for conn in connections:
+            await conn.close()
+
+        return True
+
+    async def echo(self):
+        # There's no "echo" in the binary protocol, but an empty "get_bulk" is just as cheap...
+        await self._request(self._keys_request(MB_GET_BULK, []), self._get_bulk_reply)
+        return True
+
+    async def get(self, key, db=0):
+        values = await self.get_bulk([key], False, db)
+
+        # This should never occur, but it does. What's happening?
+        if values and key not in values:
+            raise KyotoTycoonException('key mismatch: ' + repr(values))
+
+        return values[key] if values else None
+
+    async def set(self, key, value, expire, db=0):
+        numitems = await self.set_bulk({key: value}, expire, False, db)
+        return numitems > 0
+
+    async def remove(self, key, db=0):
+        numitems = await self.remove_bulk([key], False, db)
+        return numitems > 0
+
+    async def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if isinstance(kv_dict, dict) and len(kv_dict) < 1:
+            return None if noreply else 0  # ...done
+
+        flags = MB_FLAG_NOREPLY if noreply else 0
+        return await self._request(self._set_bulk_request(kv_dict, expire, db, flags),
+                                   None if noreply else self._count_reply(MB_SET_BULK))
+
+    async def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(keys) < 1:
+            return None if noreply else 0  # ...done
+
+        flags = MB_FLAG_NOREPLY if noreply else 0
+        return await self._request(self._remove_bulk_request(keys, db, flags),
+                                   None if noreply else self._count_reply(MB_REMOVE_BULK))
+
+    async def get_bulk(self, keys, atomic, db=0):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(keys) < 1:
+            return {}  # ...done
+
+        return await self._request(self._get_bulk_request(keys, db), self._get_bulk_reply)
+
+    async def set_bulk_records(self, records, atomic, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        records = [(db, key, self.pack(value), expire) for db, key, value, expire in records]
+        if len(records) < 1:
+            return None if noreply else 0  # ...done
+
+        flags = MB_FLAG_NOREPLY if noreply else 0
+        return await self._request(self._set_records_request(records, flags),
+                                   None if noreply else self._count_reply(MB_SET_BULK))
+
+    async def remove_bulk_records(self, records, atomic, noreply=False):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(records) < 1:
+            return None if noreply else 0  # ...done
+
+        flags = MB_FLAG_NOREPLY if noreply else 0
+        return await self._request(self._keys_request(MB_REMOVE_BULK, records, flags),
+                                   None if noreply else self._count_reply(MB_REMOVE_BULK))
+
+    async def get_bulk_records(self, records, atomic):
+        if atomic:
+            raise KyotoTycoonException('atomic supported under the HTTP procotol only')
+
+        if len(records) < 1:
+            return []  # ...done
+
+        return await self._request(self._keys_request(MB_GET_BULK, records), self._get_records_reply)
+
+    async def play_script(self, name, kv_dict=None, noreply=False):
+        flags = MB_FLAG_NOREPLY if noreply else 0
+        return await self._request(self._play_script_request(name, kv_dict, flags),
+                                   None if noreply else self._play_script_reply)
+
+    async def _request(self, request, decoder):
+        conn = await self._connection()
+
+        future = conn.send(request, decoder)
+        await conn.writer.drain()
+
+        if future is None:
+            return None
+
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def _connection(self):
+        '''Return the connection with the fewest replies outstanding, replacing broken ones.'''
+
+        if not self.connections:
+            raise KyotoTycoonException('not connected')
+
+        index, conn = min(enumerate(self.connections), key=lambda ic: len(ic[1].pending))
+
+        if conn.error is not None:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                    self.timeout)
+            conn = self.connections[index] = Connection(reader, writer)
+
+        return conn
+
+    def _count_reply(self, expected_magic):
+        async def decoder(conn):
+            magic, = await conn.unpack(_MAGIC)
+            if magic != expected_magic:
+                raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+            return (await conn.unpack(_COUNT))[0]
+
+        return decoder
+
+    async def _get_bulk_reply(self, conn):
+        magic, = await conn.unpack(_MAGIC)
+        if magic != MB_GET_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        num_items, = await conn.unpack(_COUNT)
+        items = {}
+        for i in range(num_items):
+            key_db, key_length, value_length, key_expire = await conn.unpack(_BULK_RECORD)
+            key = await conn.read(key_length)
+            value = await conn.read(value_length)
+            items[key.decode('utf-8')] = self.unpack(value)
+
+        return items
+
+    async def _get_records_reply(self, conn):
+        magic, = await conn.unpack(_MAGIC)
+        if magic != MB_GET_BULK:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        num_items, = await conn.unpack(_COUNT)
+        records = []
+        for i in range(num_items):
+            key_db, key_length, value_length, key_expire = await conn.unpack(_BULK_RECORD)
+            key = await conn.read(key_length)
+            value = await conn.read(value_length)
+            records.append((key_db, key.decode('utf-8'), self.unpack(value),
+                            None if key_expire >= DEFAULT_EXPIRE else key_expire))
+
+        return records
+
+    async def _play_script_reply(self, conn):
+        magic, = await conn.unpack(_MAGIC)
+        if magic != MB_PLAY_SCRIPT:
+            raise KyotoTycoonException('bad response [%s]' % hex(magic))
+
+        num_items, = await conn.unpack(_COUNT)
+        items = {}
+        for i in range(num_items):
+            key_length, value_length = await conn.unpack(_SCRIPT_RECORD)
+            key = await conn.read(key_length)
+            value = await conn.read(value_length)
+            items[key.decode('utf-8')] = value
+
+        return items
+
+# EOF - kt_binary_async.py
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from .kt_common import KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES
+
+from .kyotoslave import KyotoSlave, OP_CLEAR
+
+# Maximum number of records held by a cache, by default...
+DEFAULT_CACHE_ITEMS = 10000
+
+class LocalCache(object):
+    def __init__(self, max_items=DEFAULT_CACHE_ITEMS, ttl=None):
+        '''
+        Initialize an in-process LRU cache for (at most "max_items") records.
+
+        Records are kept until they expire on the server, but never for more than "ttl" seconds
+        when specified. Since changes made by other clients aren't seen by the cache, the "ttl"
+        bounds how stale cached values can get. It also applies to records read in bulk over
+        HTTP, for which the server doesn't report expiration times.
+
+        The cache is thread-safe, and may be shared by several KyotoTycoon objects.
+
+        '''
+
+        if max_items < 1:
+            raise ValueError('the cache must hold at least one record')
+
+        self.max_items = max_items
+        self.ttl = ttl
+
+        self.entries = OrderedDict()  # ...least recently used first.
+        self.lock = threading.Lock()
+
+        # Reads racing with invalidations must not put stale records back into the cache, so
+        # recently invalidated records are remembered along with when (in "version" terms)...
+        self.version = 0
+        self.invalidated = OrderedDict()
+        self.floor = 0  # ...reads started before this can't be checked against anything.
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, db=0):
+        '''Return a "(found, value, expire)" tuple for a record.'''
+
+        with self.lock:
+            entry = self.entries.pop((db, key), None)
+
+            if entry is None:
+                self.misses += 1
+                return False, None, None
+
+            value, expire, cache_expire = entry
+            if cache_expire is not None and cache_expire <= time.time():
+                self.expirations += 1
+                self.misses += 1
+                return False, None, None
+
+            self.entries[(db, key)] = entry  # ...now the most recently used.
+            self.hits += 1
+
+            return True, value, expire
+
+    def put(self, key, value, expire=None, db=0, since=None):
+        '''
+        Cache a record expiring at "expire" (epoch seconds) on the server. If "since" is given
+        (the cache's "version" from before reading the record), the record is only cached if it
+        hasn't been invalidated in the meantime.
+
+        '''
+
+        cache_expire = expire
+        if self.ttl is not None:
+            ttl_expire = time.time() + self.ttl
+            cache_expire = ttl_expire if expire is None else min(expire, ttl_expire)
+
+        with self.lock:
+            if since is not None and (since < self.floor or self.invalidated.get((db, key), 0) > since):
+                return
+
+            self.entries.pop((db, key), None)
+            self.entries[(db, key)] = (value, expire, cache_expire)
+
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key, db=0):
+        '''Drop a record from the cache.'''
+
+        with self.lock:
+            if self.entries.pop((db, key), None) is not None:
+                self.invalidations += 1
+
+            self.version += 1
+            self.invalidated.pop((db, key), None)
+            self.invalidated[(db, key)] = self.version
+
+            if len(self.invalidated) > self.max_items:
+                self.floor = self.invalidated.popitem(last=False)[1]
+
+    def clear(self, db=None):
+        '''Drop all records from the cache (only those for "db" if specified).'''
+
+        with self.lock:
+            self.version += 1
+            self.floor = self.version
+
+            if db is None:
+                self.invalidations += len(self.entries)
+                self.entries.clear()
+                return
+
+            for entry_key in [k for k in self.entries if k[0] == db]:
+                del self.entries[entry_key]
+                self.invalidations += 1
+
+    def stats(self):
+        '''Return the cache's hit/miss/eviction counters.'''
+
+        with self.lock:
+            return {'items': len(self.entries), 'max_items': self.max_items, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations,
+                    'invalidations': self.invalidations}
+
+
+class NearCache(LocalCache):
+    def __init__(self, sid, host='127.0.0.1', port=1978, timeout=30, max_items=DEFAULT_CACHE_ITEMS,
+                       ttl=None, max_lag=None, retry_interval=1.0):
+        '''
+        Initialize an in-process LRU cache kept coherent by the server's replication stream.
+
+        A background thread follows the transaction log as replication slave "sid" (the server
+        must be running with "-ulog" and "-sid"), dropping cached records as soon as they're
+        set or removed by any client. Records are only cached while the stream is followed
+        and (if "max_lag" is specified) no more than "max_lag" seconds behind. Should the
+        stream be interrupted, the whole cache is dropped and the stream is resumed after
+        "retry_interval" seconds.
+
+        Note: Databases must be referenced by index (not name) when using this cache, as
+              that's how they're identified in the transaction log.
+
+        '''
+
+        LocalCache.__init__(self, max_items, ttl)
+
+        self.sid = sid
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.max_lag = max_lag
+        self.retry_interval = retry_interval
+
+        self.slave = None  # ...while following the stream.
+        self.log_entries = 0
+        self.stream_errors = 0
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._follow, name='NearCache-%d' % sid)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def lag(self):
+        '''Return how far (in seconds) the stream is behind the server, or "None" if not following it.'''
+
+        slave = self.slave
+        last_ts = None if slave is None else slave.last_ts
+
+        # The difference between client and server clocks adds up here...
+        return None if last_ts is None else max(0.0, time.time() - last_ts)
+
+    def coherent(self):
+        '''Check whether records can be served from (and added to) the cache right now.'''
+
+        lag = self.lag()
+        return lag is not None and (self.max_lag is None or lag <= self.max_lag)
+
+    def get(self, key, db=0):
+        if not self.coherent():
+            with self.lock:
+                self.misses += 1
+
+            return False, None, None
+
+        return LocalCache.get(self, key, db)
+
+    def put(self, key, value, expire=None, db=0, since=None):
+        if self.coherent():
+            LocalCache.put(self, key, value, expire, db, since)
+
+    def stats(self):
+        stats = LocalCache.stats(self)
+        stats.update({'lag': self.lag(), 'log_entries': self.log_entries, 'stream_errors': self.stream_errors})
+
+        return stats
+
+    def close(self):
+        '''Stop following the replication stream.'''
+
+        self.stopped.set()
+
+        slave = self.slave
+        if slave is not None:
+            try:
+                slave.close()  # ...interrupts the background thread.
+            except Exception:
+                pass
+
+        self.thread.join(self.timeout)
+        return True
+
+    def _follow(self):
+        timestamp = time.time()
+
+        while not self.stopped.is_set():
+            slave = KyotoSlave(self.sid, self.host, self.port, self.timeout)
+
+            try:
+                self.slave = slave
+
+                for entry in slave.consume(timestamp):
+                    self._apply(entry)
+                    timestamp = entry['ts']
+
+                    if self.stopped.is_set():
+                        break
+            except Exception:
+                if not self.stopped.is_set():
+                    self.stream_errors += 1
+            finally:
+                self.slave = None
+                self.clear()  # ...changes might be missed until resuming.
+
+            try:
+                slave.close()
+            except Exception:
+                pass  # ...it's gone anyway.
+
+            self.stopped.wait(self.retry_interval)
+
+    def _apply(self, entry):
+        self.log_entries += 1
+
+        if entry['op'] == OP_CLEAR:
+            self.clear(entry['db'])
+            return
+
+        try:
+            key = entry['key'].decode('utf-8')
+        except UnicodeDecodeError:
+            return  # ...can't have been cached anyway.
+
+        self.invalidate(key, entry['db'])
+
+
+class ProtocolHandler(object):
+    '''
+    Read-through caching for another protocol handler.
+
+    Reads are served from the cache whenever possible, with only the missing records being
+    requested from the server. Writes made through this handler invalidate the records they
+    touch. Anything else is passed through to the wrapped handler untouched.
+
+    '''
+
+    def __init__(self, core, cache):
+        self.core = core
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.core, name)
+
+    def get(self, key, db=0):
+        return self.get_with_expire(key, db)[0]
+
+    def get_with_expire(self, key, db=0):
+        found, value, expire = self.cache.get(key, db)
+        if found:
+            return value, expire
+
+        version = self.cache.version
+        value, expire = self.core.get_with_expire(key, db)
+        if value is not None:
+            self.cache.put(key, value, expire, db, version)
+
+        return value, expire
+
+    def get_bulk(self, keys, atomic, db=0):
+        return dict((key, value) for key, (value, expire) in self.get_bulk_with_expire(keys, atomic, db).items())
+
+    def get_bulk_with_expire(self, keys, atomic, db=0):
+        # Records come from the cache and the server at different times, so "atomic" only
+        # applies to the part of the request that actually reaches the server...
+        rv = {}
+        missing = []
+
+        for key in keys:
+            found, value, expire = self.cache.get(key, db)
+            if found:
+                rv[key] = (value, expire)
+            else:
+                missing.append(key)
+
+        if missing:
+            version = self.cache.version
+            records = self.core.get_bulk_with_expire(missing, atomic, db)
+
+            for key, (value, expire) in records.items():
+                self.cache.put(key, value, expire, db, version)
+
+            rv.update(records)
+
+        return rv
+
+    def set(self, key, value, expire, db=0):
+        try:
+            return self.core.set(key, value, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def add(self, key, value, expire, db=0):
+        try:
+            return self.core.add(key, value, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def replace(self, key, value, expire, db=0):
+        try:
+            return self.core.replace(key, value, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def append(self, key, value, expire, db=0):
+        try:
+            return self.core.append(key, value, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def cas(self, key, old_val, new_val, expire, db=0):
+        try:
+            return self.core.cas(key, old_val, new_val, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def increment(self, key, delta, expire, db=0):
+        try:
+            return self.core.increment(key, delta, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def increment_double(self, key, delta, expire, db=0):
+        try:
+            return self.core.increment_double(key, delta, expire, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def remove(self, key, db=0):
+        try:
+            return self.core.remove(key, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def seize(self, key, db=0):
+        try:
+            return self.core.seize(key, db)
+        finally:
+            self.cache.invalidate(key, db)
+
+    def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
+        if isinstance(kv_dict, dict):
+            keys = list(kv_dict.keys())
+        else:
+            kv_dict = list(kv_dict)
+            keys = [key for key, value in kv_dict]
+
+        try:
+            return self.core.set_bulk(kv_dict, expire, atomic, db, noreply)
+        finally:
+            for key in keys:
+                self.cache.invalidate(key, db)
+
+    def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        try:
+            return self.core.remove_bulk(keys, atomic, db, noreply)
+        finally:
+            for key in keys:
+                self.cache.invalidate(key, db)
+
+    def set_bulk_records(self, records, atomic, noreply=False):
+        records = list(records)
+
+        try:
+            return self.core.set_bulk_records(records, atomic, noreply)
+        finally:
+            for db, key, value, expire in records:
+                self.cache.invalidate(key, db)
+
+    def remove_bulk_records(self, records, atomic, noreply=False):
+        records = list(records)
+
+        try:
+            return self.core.remove_bulk_records(records, atomic, noreply)
+        finally:
+            for db, key in records:
+                self.cache.invalidate(key, db)
+
+    def iter_set_bulk(self, kv_items, expire, atomic, db=0, chunk_keys=KT_CHUNK_KEYS,
+                            chunk_bytes=KT_CHUNK_BYTES, in_flight=2, on_chunk=None):
+        return self.core.iter_set_bulk(kv_items, expire, atomic, db, chunk_keys, chunk_bytes, in_flight,
+                                       self._invalidating(db, on_chunk))
+
+    def iter_remove_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                               in_flight=2, on_chunk=None):
+        return self.core.iter_remove_bulk(keys, atomic, db, chunk_keys, chunk_bytes, in_flight,
+                                          self._invalidating(db, on_chunk))
+
+    def _invalidating(self, db, on_chunk):
+        '''Return an "on_chunk" callback invalidating the keys of each chunk written (see "iter_set_bulk()").'''
+
+        def invalidate(keys):
+            for key in keys:
+                self.cache.invalidate(key, db)
+
+            if on_chunk is not None:
+                on_chunk(keys)
+
+        return invalidate
+
+    def clear(self, db=0):
+        try:
+            return self.core.clear(db)
+        finally:
+            self.cache.clear(db)
+
+# EOF - kt_cache.py
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+
+# Operations that share a single request among identical concurrent calls...
+_COALESCED_METHODS = frozenset(['get', 'get_with_expire', 'get_int',
+                                'match_prefix', 'match_regex', 'match_similar'])
+
+# Operations that don't change any records, and so don't affect reads in flight...
+_READ_ONLY_METHODS = frozenset(['pack', 'unpack', 'echo', 'report', 'status', 'count', 'size', 'check',
+                                'get_bulk', 'get_bulk_with_expire', 'get_bulk_records', 'iter_get_bulk'])
+
+# Operations returning objects whose writes aren't seen here (see "ProtocolHandler")...
+_UNTRACKED_METHODS = frozenset(['cursor', 'pipeline'])
+
+# Operations returning generators that write records as they're consumed...
+_ITER_WRITE_METHODS = frozenset(['iter_set_bulk', 'iter_remove_bulk'])
+
+class Flight(object):
+    '''A request in flight, whose result is shared by all identical calls made meanwhile.'''
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class SingleFlight(object):
+    def __init__(self):
+        '''
+        Initialize a registry of requests in flight, so that identical concurrent calls can
+        share a single request (and a single result). Several KyotoTycoon objects (e.g. those
+        in a pool) may share the same registry, as it's thread-safe.
+
+        '''
+
+        self.lock = threading.Lock()
+        self.flights = {}
+
+        # Bumped by writes, so that later calls don't join reads started before them...
+        self.generation = 0
+
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        '''Call "function(*args)", unless a call for "key" is already in flight to share the result of.'''
+
+        with self.lock:
+            self.calls += 1
+
+            flight = self.flights.get(key)
+            if flight is not None and flight.generation == self.generation:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self.flights[key] = Flight(self.generation)
+                leader = True
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            flight.result = function(*args)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+
+            flight.done.set()
+
+        return flight.result
+
+    def invalidate(self):
+        '''Make calls from now on start new requests, instead of joining those in flight.'''
+
+        with self.lock:
+            self.generation += 1
+
+    def stats(self):
+        '''Return how many calls were made, and how many of those were coalesced.'''
+
+        with self.lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self.flights)}
+
+
+class ProtocolHandler(object):
+    '''
+    Request coalescing for another protocol handler.
+
+    Identical concurrent reads share a single request and result. Any other operation made
+    through this handler (except those that are known not to change any records) stops new
+    reads from joining those started before it completed, as does each request made by the
+    "iter_set_bulk()" and "iter_remove_bulk()" generators.
+
+    Note: Writes made through cursors and pipelines aren't seen here, so reads made after them
+          may still join reads started before them (and get older values). Use a handler
+          without coalescing for those when it matters.
+
+    '''
+
+    def __init__(self, core, flight):
+        self.core = core
+        self.flight = flight
+
+    def __getattr__(self, name):
+        function = getattr(self.core, name)
+
+        if name in _COALESCED_METHODS:
+            def coalesced_call(*args, **kwargs):
+                key = (name,) + args + tuple(sorted(kwargs.items()))
+                return self.flight.do(key, lambda: function(*args, **kwargs))
+
+            return coalesced_call
+
+        if name in _READ_ONLY_METHODS or name in _UNTRACKED_METHODS or not callable(function):
+            return function
+
+        if name in _ITER_WRITE_METHODS:
+            def iter_invalidating_call(*args, **kwargs):
+                return self._invalidating(function(*args, **kwargs))
+
+            return iter_invalidating_call
+
+        def invalidating_call(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.flight.invalidate()
+
+        return invalidating_call
+
+    def _invalidating(self, results):
+        '''Yield the results of a chunked write, invalidating reads in flight after each request.'''
+
+        try:
+            for result in results:
+                self.flight.invalidate()
+                yield result
+        finally:
+            results.close()
+            self.flight.invalidate()
+
+# EOF - kt_coalesce.py
@@ -13,4 +13,42 @@ KT_PACKER_JSON   = 2
 KT_PACKER_STRING = 3
 KT_PACKER_BYTES  = 4
 
+# Default limits for each request made by the streaming bulk operations...
+KT_CHUNK_KEYS  = 1000
+KT_CHUNK_BYTES = 1048576
+
+def key_size(key):
+    '''Return the size of a key as sent to the server (UTF-8 encoded), in bytes.'''
+
+    return len(key) if isinstance(key, bytes) else len(key.encode('utf-8'))
+
+def chunked(items, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES, size=key_size):
+    '''
+    Split an iterable into lists of at most "chunk_keys" items, where the sum of "size(item)"
+    (by default, the encoded size of keys) doesn't exceed "chunk_bytes" (unless a single item
+    is larger than that by itself).
+
+    '''
+
+    if chunk_keys is not None and chunk_keys < 1:
+        raise ValueError('chunks must allow at least one key')
+
+    chunk = []
+    chunk_size = 0
+
+    for item in items:
+        item_size = size(item) if chunk_bytes else 0
+
+        if chunk and ((chunk_keys and len(chunk) >= chunk_keys) or
+                      (chunk_bytes and chunk_size + item_size > chunk_bytes)):
+            yield chunk
+            chunk = []
+            chunk_size = 0
+
+        chunk.append(item)
+        chunk_size += item_size
+
+    if chunk:
+        yield chunk
+
 # EOF - kt_common.py
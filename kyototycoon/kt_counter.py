@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+
+from .kt_error import KyotoTycoonException
+
+# Name of the server-side procedure used to send all deltas at once, by default...
+DEFAULT_COUNTER_SCRIPT = 'increment_bulk'
+
+# The procedure above, to be included in the script given to "ktserver -scr"...
+COUNTER_SCRIPT = '''
+-- add deltas to several counters at once, with input records named
+-- "i<db>:<key>" (integer) or "d<db>:<key>" (double), returning the
+-- new totals for those counters that could be updated
+function increment_bulk(inmap, outmap)
+   local kt = __kyototycoon__
+   for name, num in pairs(inmap) do
+      local kind, idx, key = string.match(name, "^([id])(%d+):(.*)$")
+      local cdb = kind and kt.dbs[tonumber(idx) + 1]
+      if cdb and kind == "i" then
+         local total = cdb:increment(key, tonumber(num))
+         if total then
+            outmap[name] = string.format("%d", total)
+         end
+      elseif cdb then
+         local total = cdb:increment_double(key, tonumber(num))
+         if total then
+            outmap[name] = string.format("%.17g", total)
+         end
+      end
+   end
+   return kt.RVSUCCESS
+end
+'''
+
+class CounterAggregator(object):
+    def __init__(self, kt, max_age=1.0, max_unsent=10000, script=DEFAULT_COUNTER_SCRIPT, on_error=None):
+        '''
+        Initialize a local accumulator for "increment()" and "increment_double()" calls on "kt".
+
+        Deltas are summed in memory for each counter, and sent to the server every "max_age"
+        seconds (from a background thread), or as soon as "max_unsent" calls are waiting, or
+        on "flush()". This is also the bound on what's lost if the process dies: at most the
+        "max_unsent" calls made during the last "max_age" seconds (plus a batch in flight).
+
+        All deltas are sent with a single "play_script()" call to the "script" procedure (see
+        "COUNTER_SCRIPT"), which only supports databases given by index. With "script=None"
+        they're sent with one "increment()" call per counter instead (HTTP protocol only).
+
+        Deltas that can't be sent are dropped (never retried, to avoid counting them twice),
+        with "on_error(exception, counters)" being called for them if specified, where
+        "counters" is a list of "(db, key)" pairs.
+
+        Note: Both the background thread and callers use "kt", but never at the same time. It
+              must not be used for anything else concurrently (unless it's a pool).
+
+        '''
+
+        if max_unsent < 1:
+            raise ValueError('at least one call must be allowed to wait')
+
+        self.kt = kt
+        self.max_age = max_age
+        self.max_unsent = max_unsent
+        self.script = script
+        self.on_error = on_error
+
+        self.pending = {}  # ...deltas by "(db, key)", as "[double, delta, calls]".
+        self.unsent = 0
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.closed = threading.Event()
+
+        self.increments = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.last_error = None
+
+        self.thread = threading.Thread(target=self._run, name='CounterAggregator')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def increment(self, key, delta=1, db=0):
+        '''Add "delta" to the numeric integer value of a record (eventually).'''
+
+        self._add(key, int(delta), db, False)
+
+    def increment_double(self, key, delta, db=0):
+        '''Add "delta" to the numeric double value of a record (eventually).'''
+
+        self._add(key, float(delta), db, True)
+
+    def get(self, key, db=0, double=False):
+        '''
+        Retrieve the server total for a counter, after sending any pending delta for it (the
+        record is created with a zero value if it doesn't exist). The "double" argument tells
+        the kind of counter when nothing is pending for it.
+
+        '''
+
+        with self.flush_lock:
+            with self.lock:
+                entry = self.pending.pop((db, key), None)
+                if entry is not None:
+                    self.unsent -= entry[2]
+                    double = entry[0]
+
+            if entry is None:
+                entry = [double, 0.0 if double else 0, 0]
+
+            totals, errors = self._send({(db, key): entry})
+            if (db, key) not in totals:
+                raise errors[(db, key)]
+
+            return totals[(db, key)]
+
+    def flush(self):
+        '''
+        Send all pending deltas, returning the new server totals for the counters that were
+        updated, as a dictionary by "(db, key)".
+
+        '''
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                self.unsent = 0
+
+            return self._send(batch)[0] if batch else {}
+
+    def close(self):
+        '''Stop the background thread and send all pending deltas.'''
+
+        self.closed.set()
+        self.thread.join()
+
+        self.flush()
+        return True
+
+    def stats(self):
+        '''Return counters for received, flushed and dropped increments.'''
+
+        with self.lock:
+            return {'increments': self.increments, 'pending': len(self.pending), 'unsent': self.unsent,
+                    'flushes': self.flushes, 'flushed': self.flushed, 'dropped': self.dropped}
+
+    def _add(self, key, delta, db, double):
+        with self.lock:
+            if self.closed.is_set():
+                raise KyotoTycoonException('counter aggregator is closed')
+
+            entry = self.pending.get((db, key))
+            if entry is None:
+                entry = self.pending[(db, key)] = [double, 0.0 if double else 0, 0]
+            elif entry[0] != double:
+                raise ValueError('counter is pending as a different numeric type')
+
+            entry[1] += delta
+            entry[2] += 1
+
+            self.increments += 1
+            self.unsent += 1
+            due = self.unsent >= self.max_unsent
+
+        if due:
+            self.flush()
+
+    def _run(self):
+        while not self.closed.wait(self.max_age):
+            self.flush()
+
+    def _send(self, batch):
+        '''Send "batch", returning the new totals and the errors for the dropped counters.'''
+
+        if self.script is None:
+            return self._increment_each(batch)
+
+        return self._increment_script(batch)
+
+    def _increment_script(self, batch):
+        names = {}
+        kv_dict = {}
+
+        for (db, key), (double, delta, calls) in batch.items():
+            name = '%s%d:%s' % ('d' if double else 'i', db, key)
+            names[name] = (db, key)
+            kv_dict[name] = (repr(delta) if double else str(delta)).encode('ascii')
+
+        errors = {}
+
+        try:
+            out = self.kt.play_script(self.script, kv_dict)
+        except Exception as e:
+            self._drop(e, batch, errors)
+            return {}, errors
+
+        totals = {}
+        failed = {}
+        for name, counter in names.items():
+            if name not in out:
+                failed[counter] = batch[counter]
+                continue
+
+            total = out[name].decode('ascii')
+            totals[counter] = float(total) if batch[counter][0] else int(total)
+
+        with self.lock:
+            self.flushes += 1
+            self.flushed += len(totals)
+
+        if failed:
+            self._drop(KyotoTycoonException('counters not updated by script'), failed, errors)
+
+        return totals, errors
+
+    def _increment_each(self, batch):
+        totals = {}
+        errors = {}
+
+        for (db, key), entry in batch.items():
+            double, delta, calls = entry
+
+            try:
+                if double:
+                    totals[(db, key)] = self.kt.increment_double(key, delta, db=db)
+                else:
+                    totals[(db, key)] = self.kt.increment(key, delta, db=db)
+            except Exception as e:
+                self._drop(e, {(db, key): entry}, errors)
+
+        with self.lock:
+            self.flushes += 1
+            self.flushed += len(totals)
+
+        return totals, errors
+
+    def _drop(self, error, entries, errors):
+        lost = [counter for counter, entry in entries.items() if entry[2] > 0]
+        errors.update((counter, error) for counter in entries)
+
+        with self.lock:
+            self.dropped += sum(entry[2] for entry in entries.values())
+            self.last_error = error
+
+        if self.on_error is not None and lost:
+            self.on_error(error, lost)
+
+# EOF - kt_counter.py
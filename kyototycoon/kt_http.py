@@ -8,35 +8,36 @@
 # the BSD license. See COPYING file for license description.
 #
 
-import base64
+import binascii
+import re
 import struct
 import time
 import sys
 
+from email.utils import parsedate_tz, mktime_tz
+
 from .kt_error import KyotoTycoonException
+from .kt_scan import DEFAULT_SCAN_BATCH, prefetched, script_batches
+from .kt_http_socket import HTTPConnection
 
 from .kt_common import KT_PACKER_CUSTOM, \
                        KT_PACKER_PICKLE, \
                        KT_PACKER_JSON, \
                        KT_PACKER_STRING, \
-                       KT_PACKER_BYTES
-
-try:
-    import httplib
-except ImportError:
-    import http.client as httplib
+                       KT_PACKER_BYTES, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES, \
+                       chunked, \
+                       key_size
 
 try:
     from urllib import quote as _quote
-    from urllib import quote as _quote_from_bytes
     from urllib import unquote as unquote_to_bytes
 except ImportError:
     from urllib.parse import quote as _quote
-    from urllib.parse import quote_from_bytes as _quote_from_bytes
     from urllib.parse import unquote_to_bytes
 
 quote = lambda s: _quote(s, safe='')
-quote_from_bytes = lambda s: _quote_from_bytes(s, safe='')
 
 try:
     import cPickle as pickle
@@ -47,24 +48,83 @@ import json
 
 KT_HTTP_HEADER = {'Content-Type' : 'text/tab-separated-values; colenc=U'}
 
-def _dict_to_tsv(kv_dict):
-    lines = []
-    for k, v in kv_dict.items():
-        quoted = quote_from_bytes(v) if isinstance(v, bytes) else quote(str(v))
-        lines.append('%s\t%s' % (quote(k.encode('utf-8')), quoted))
-    return '\n'.join(lines)
+# Size of the chunks read from responses decoded as they arrive (see "_iter_tsv()")...
+_TSV_CHUNK_SIZE = 65536
+
+# Request headers for each column encoding ("None" meaning unencoded)...
+_TSV_HEADERS = {None: {'Content-Type': 'text/tab-separated-values'},
+                'U': KT_HTTP_HEADER,
+                'B': {'Content-Type': 'text/tab-separated-values; colenc=B'}}
+
+# Bytes escaped by URL encoding (besides these, the server only decodes "%" and "+")...
+_URL_UNSAFE = bytes(bytearray(list(range(0x00, 0x20)) + [0x25, 0x2b, 0x7f]))
+_URL_UNSAFE_RE = re.compile(b'[\\x00-\\x1f%+\\x7f]')
+_URL_ESCAPES = [('%%%02X' % i).encode('ascii') for i in range(256)]
+
+_url_escape = lambda match: _URL_ESCAPES[ord(match.group())]
+
+def _url_encode(data):
+    '''URL-encode bytes, escaping only what the server needs escaped.'''
+
+    return _URL_UNSAFE_RE.sub(_url_escape, data)
+
+def _b64_encode(data):
+    return binascii.b2a_base64(data)[:-1]  # ...without the trailing newline.
+
+def _tsv_request(rows):
+    '''
+    Return a TSV request body for a list of "(name, value)" rows (as bytes), along with the
+    request headers for the column encoding it uses. Columns are sent unencoded when none
+    contain tabs or line breaks, otherwise URL-encoded or Base64-encoded (whichever is
+    shorter, i.e. URL encoding unless more than about one in six bytes need escaping).
+
+    '''
+
+    body = b''.join([name + b'\t' + value + b'\n' for name, value in rows])
+
+    # Only the separators themselves are allowed...
+    if body.count(b'\t') == len(rows) and body.count(b'\n') == len(rows) and b'\r' not in body:
+        return body, _TSV_HEADERS[None]
+
+    size = len(body) - 2 * len(rows)
+    unsafe = len(body) - len(body.translate(None, _URL_UNSAFE)) - 2 * len(rows)  # ...not the separators.
+
+    if unsafe * 6 <= size:
+        encode, colenc = _url_encode, 'U'
+    else:
+        encode, colenc = _b64_encode, 'B'
+
+    return b''.join([encode(name) + b'\t' + encode(value) + b'\n' for name, value in rows]), _TSV_HEADERS[colenc]
+
+def _dict_to_request(kv_dict):
+    '''Return a TSV request body (and its headers) for a dictionary of parameters.'''
+
+    return _tsv_request([(k.encode('utf-8'), v if isinstance(v, bytes) else str(v).encode('utf-8'))
+                         for k, v in kv_dict.items()])
 
 def _content_type_decoder(content_type):
     '''Select the appropriate decoding function to use based on the response headers.'''
 
     if content_type.endswith('colenc=B'):
-        return base64.decodestring
+        return binascii.a2b_base64
 
     if content_type.endswith('colenc=U'):
         return unquote_to_bytes
 
     return lambda x: x
 
+def _parse_xt(xt):
+    '''Convert an "X-Kt-Xt" header (an HTTP date or epoch seconds) into epoch seconds.'''
+
+    if xt.isdigit():
+        return int(xt)
+
+    date = parsedate_tz(xt)
+    if date is None:
+        raise KyotoTycoonException('bad expiration time [%s]' % xt)
+
+    return mktime_tz(date)
+
 def _tsv_to_dict(tsv_str, content_type):
     decode = _content_type_decoder(content_type)
     rv = {}
@@ -75,6 +135,40 @@ def _tsv_to_dict(tsv_str, content_type):
             rv[decode(kv[0])] = decode(kv[1])
     return rv
 
+def _iter_tsv(res, content_type, chunk_size=_TSV_CHUNK_SIZE):
+    '''
+    Yield decoded "(name, value)" pairs from a TSV response body, reading it from "res" (an
+    "HTTPResponse") in chunks of "chunk_size" bytes as it arrives, so that only about a chunk
+    (or a single longer row) is held in memory at a time.
+
+    '''
+
+    decode = _content_type_decoder(content_type)
+    partial = []  # ...the pieces of a row not yet ended.
+
+    while True:
+        chunk = res.read(chunk_size)
+        if not chunk:
+            break
+
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            partial.append(chunk)
+            continue
+
+        partial.append(chunk[:end])
+        rows = b''.join(partial).split(b'\n')
+        partial = [chunk[end + 1:]]
+
+        for row in rows:
+            kv = row.split(b'\t')
+            if len(kv) == 2:
+                yield decode(kv[0]), decode(kv[1])
+
+    kv = b''.join(partial).split(b'\t')
+    if len(kv) == 2:
+        yield decode(kv[0]), decode(kv[1])
+
 def _tsv_to_list(tsv_str, content_type):
     decode = _content_type_decoder(content_type)
     rv = []
@@ -116,6 +210,47 @@ class Cursor(object):
             if not self.step():
                 return
 
+    def iter_batches(self, batch_size=DEFAULT_SCAN_BATCH, key=None, db=0, prefetch=True, with_expire=False,
+                           script=None):
+        '''
+        Yield lists of up to "batch_size" (key,value) pairs, starting at a record (first record
+        if "None") in forward scan order, or (key,value,expire) tuples with "with_expire".
+
+        With a "script" procedure (see "SCAN_SCRIPT") each batch takes a single request, and
+        the cursor itself isn't moved. Without one, this falls back to reading with the cursor,
+        where each record still takes a request ("cur_get" with "step", unlike "__iter__()").
+        With "prefetch" the next batch is fetched in a background thread while the current one
+        is being used, so the connection must not be used for anything else until it's done.
+
+        '''
+
+        if script is not None:
+            batches = script_batches(self.protocol_handler, script, key, batch_size, db, with_expire)
+        else:
+            batches = self._iter_batches(batch_size, key, db, with_expire)
+
+        return prefetched(batches) if prefetch else batches
+
+    def _iter_batches(self, batch_size, key, db, with_expire):
+        if not self.jump(key, db):
+            return
+
+        while True:
+            batch = []
+
+            while len(batch) < batch_size:
+                record = self.get_with_expire(step=True)
+                if record[0] is None:
+                    break
+
+                batch.append(record if with_expire else record[:2])
+
+            if batch:
+                yield batch
+
+            if len(batch) < batch_size:
+                return
+
     def jump(self, key=None, db=0):
         '''Jump the cursor to a record (first record if "None") for forward scan.'''
 
@@ -126,8 +261,8 @@ class Cursor(object):
         if key:
             request_dict['key'] = key.encode('utf-8')
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status == 450:
@@ -149,8 +284,8 @@ class Cursor(object):
         if key:
             request_dict['key'] = key.encode('utf-8')
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status == 450:
@@ -167,8 +302,8 @@ class Cursor(object):
 
         path = '/rpc/cur_step'
         request_dict = {'CUR': self.cursor_id}
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status == 450:
@@ -185,8 +320,8 @@ class Cursor(object):
 
         path = '/rpc/cur_step_back'
         request_dict = {'CUR': self.cursor_id}
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status == 450:
@@ -210,8 +345,8 @@ class Cursor(object):
         if expire:
             request_dict['xt'] = expire
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status != 200:
@@ -224,8 +359,8 @@ class Cursor(object):
 
         path = '/rpc/cur_remove'
         request_dict = {'CUR': self.cursor_id}
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status != 200:
@@ -234,7 +369,7 @@ class Cursor(object):
         return True
 
     def get_key(self, step=False):
-        '''Get the key for the current record.'''
+        '''Get the key for the current record ("None" past the last record).'''
 
         path = '/rpc/cur_get_key'
         request_dict = {'CUR': self.cursor_id}
@@ -242,10 +377,13 @@ class Cursor(object):
         if step:
             request_dict['step'] = True
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
+        if res.status in (404, 450):
+            return None
+
         if res.status != 200:
             raise KyotoTycoonException('protocol error [%d]' % res.status)
 
@@ -260,8 +398,8 @@ class Cursor(object):
         if step:
             request_dict['step'] = True
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status != 200:
@@ -278,8 +416,8 @@ class Cursor(object):
         if step:
             request_dict['step'] = True
 
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status == 404:
@@ -294,13 +432,39 @@ class Cursor(object):
 
         return key, value
 
+    def get_with_expire(self, step=False):
+        '''Get a (key,value,expire) tuple for the current record, with the absolute expiration time (or "None").'''
+
+        path = '/rpc/cur_get'
+        request_dict = {'CUR': self.cursor_id}
+
+        if step:
+            request_dict['step'] = True
+
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
+
+        res, body = self.protocol_handler.getresponse()
+        if res.status in (404, 450):  # ...past the last record.
+            return None, None, None
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        key = res_dict[b'key'].decode('utf-8')
+        value = self.unpack(res_dict[b'value'])
+        expire = int(res_dict[b'xt']) if b'xt' in res_dict else None
+
+        return key, value, expire
+
     def seize(self):
         '''Get a (key,value) pair for the current record, and remove it atomically.'''
 
         path = '/rpc/cur_seize'
         request_dict = {'CUR': self.cursor_id}
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status != 200:
@@ -317,8 +481,8 @@ class Cursor(object):
 
         path = '/rpc/cur_delete'
         request_dict = {'CUR': self.cursor_id}
-        request_body = _dict_to_tsv(request_dict)
-        self.protocol_handler.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.protocol_handler.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.protocol_handler.getresponse()
         if res.status != 200:
@@ -328,9 +492,12 @@ class Cursor(object):
 
 
 class ProtocolHandler(object):
-    def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None):
+    def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None, connection_class=HTTPConnection):
         self.pack_type = pack_type
 
+        # Anything with the interface of "httplib.HTTPConnection" will do...
+        self.connection_class = connection_class
+
         if pack_type != KT_PACKER_CUSTOM and custom_packer is not None:
             raise KyotoTycoonException('custom packer object supported for "KT_PACKER_CUSTOM" only')
 
@@ -364,6 +531,9 @@ class ProtocolHandler(object):
     def cursor(self):
         return Cursor(self)
 
+    def pipeline(self, max_pending=64):
+        raise NotImplementedError('supported under the binary protocol only')
+
     def open(self, host, port, timeout):
         # Save connection parameters so the connection can be
         # re-established on a "Connection: close" response...
@@ -371,7 +541,7 @@ class ProtocolHandler(object):
         self.port = port
         self.timeout = timeout
 
-        self.conn = httplib.HTTPConnection(host, port, timeout=timeout)
+        self.conn = self.connection_class(host, port, timeout=timeout)
         return True
 
     def close(self):
@@ -382,12 +552,39 @@ class ProtocolHandler(object):
         res = self.conn.getresponse()
         body = res.read()
 
+        self._reopen_if_closing(res)
+        return res, body
+
+    def getresponse_rows(self):
+        '''
+        Return the response and a generator for the "(name, value)" pairs in its TSV body, which
+        is decoded as it's read (see "_iter_tsv()"). For errors, the body is read at once and the
+        generator is "None". The generator must be exhausted (or closed) before the next request.
+
+        '''
+
+        res = self.conn.getresponse()
+
+        if res.status != 200:
+            res.read()
+            self._reopen_if_closing(res)
+            return res, None
+
+        return res, self._response_rows(res)
+
+    def _response_rows(self, res):
+        try:
+            for row in _iter_tsv(res, res.getheader('Content-Type', '')):
+                yield row
+        finally:
+            res.read()  # ...whatever wasn't consumed, leaving the connection ready for reuse.
+            self._reopen_if_closing(res)
+
+    def _reopen_if_closing(self, res):
         if res.will_close:
             self.conn.close()
             self.open(self.host, self.port, self.timeout)
 
-        return res, body
-
     def echo(self):
         self.conn.request('POST', '/rpc/echo')
 
@@ -412,13 +609,29 @@ class ProtocolHandler(object):
 
         return self.unpack(body)
 
+    def get_with_expire(self, key, db=0):
+        db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
+        path = '/%s/%s' % (db, quote(key.encode('utf-8')))
+
+        self.conn.request('GET', path)
+        res, body = self.getresponse()
+
+        if res.status == 404:
+            return None, None
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        xt = res.getheader('X-Kt-Xt')
+        return self.unpack(body), (None if xt is None else _parse_xt(xt))
+
     def check(self, key, db=0):
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
         path = '/rpc/check?DB=' + db
 
         request_dict = {'key': key.encode('utf-8')}
-        request_body = _dict_to_tsv(request_dict)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status == 450:  # ...no record was found
@@ -434,8 +647,8 @@ class ProtocolHandler(object):
         path = '/rpc/seize?DB=' + db
 
         request_dict = {'key': key.encode('utf-8')}
-        request_body = _dict_to_tsv(request_dict)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _dict_to_request(request_dict)
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status == 450:  # ...no record was found
@@ -447,45 +660,31 @@ class ProtocolHandler(object):
         res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
         return self.unpack(res_dict[b'value'])
 
-    def set_bulk(self, kv_dict, expire, atomic, db=0):
+    def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
+
         if isinstance(kv_dict, dict) and len(kv_dict) < 1:
             return 0  # ...done
 
-        db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
-        path = '/rpc/set_bulk?DB=' + db
-
-        request_body = ['atomic\t\n' if atomic else '']
-
-        if expire is not None:
-            request_body.append('xt\t%d\n' % expire)
-
-        for key, value in kv_dict.items():
-            key = quote(key.encode('utf-8'))
-            value = quote(self.pack(value))
-            request_body.append('_%s\t%s\n' % (key, value))
-
-        self.conn.request('POST', path, body=''.join(request_body), headers=KT_HTTP_HEADER)
+        return self._set_bulk_packed([(key, self.pack(value)) for key, value in kv_dict.items()],
+                                     expire, atomic, db)
 
-        res, body = self.getresponse()
-        if res.status != 200:
-            raise KyotoTycoonException('protocol error [%d]' % res.status)
-
-        # Number of items set...
-        return int(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
+    def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
 
-    def remove_bulk(self, keys, atomic, db=0):
         if len(keys) < 1:
             return 0  # ...done
 
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
         path = '/rpc/remove_bulk?DB=' + db
 
-        request_body = ['atomic\t\n' if atomic else '']
+        rows = [(b'atomic', b'')] if atomic else []
+        rows.extend((b'_' + key.encode('utf-8'), b'') for key in keys)
 
-        for key in keys:
-            request_body.append('_%s\t\n' % quote(key.encode('utf-8')))
-
-        self.conn.request('POST', path, body=''.join(request_body), headers=KT_HTTP_HEADER)
+        request_body, headers = _tsv_request(rows)
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status != 200:
@@ -498,32 +697,62 @@ class ProtocolHandler(object):
         if len(keys) < 1:
             return {}  # ...done
 
-        db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
-        path = '/rpc/get_bulk?DB=' + db
+        return dict((key, self.unpack(value)) for key, value in self._get_bulk_rows(keys, atomic, db))
 
-        request_body = ['atomic\t\n' if atomic else '']
+    def get_bulk_with_expire(self, keys, atomic, db=0):
+        # The "get_bulk" procedure doesn't return expiration times...
+        return dict((key, (value, None)) for key, value in self.get_bulk(keys, atomic, db).items())
 
-        for key in keys:
-            request_body.append('_%s\t\n' % quote(key.encode('utf-8')))
+    def set_bulk_records(self, records, atomic, noreply=False):
+        raise NotImplementedError('supported under the binary protocol only')
 
-        self.conn.request('POST', path, body=''.join(request_body), headers=KT_HTTP_HEADER)
+    def remove_bulk_records(self, records, atomic, noreply=False):
+        raise NotImplementedError('supported under the binary protocol only')
 
-        res, body = self.getresponse()
-        if res.status != 200:
-            raise KyotoTycoonException('protocol error [%d]' % res.status)
+    def get_bulk_records(self, records, atomic):
+        raise NotImplementedError('supported under the binary protocol only')
 
-        rv = {}
-        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
-        n = res_dict.pop(b'num')
+    def iter_get_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                            in_flight=2):
+        # There's no pipelining with HTTP, so chunks are always requested one at a time...
+        for chunk in chunked(keys, chunk_keys, chunk_bytes):
+            for key, value in self._get_bulk_rows(chunk, atomic, db):
+                yield key, self.unpack(value)
 
-        if n == '0':
-            return {}
+    def iter_set_bulk(self, kv_items, expire, atomic, db=0, chunk_keys=KT_CHUNK_KEYS,
+                            chunk_bytes=KT_CHUNK_BYTES, in_flight=2, on_chunk=None):
+        if isinstance(kv_items, dict):
+            kv_items = kv_items.items()
 
-        for k, v in res_dict.items():
-            if v is not None:
-                rv[k.decode('utf-8')[1:]] = self.unpack(v)
+        packed_items = ((key, self.pack(value)) for key, value in kv_items)
+        chunks = chunked(packed_items, chunk_keys, chunk_bytes, lambda kv: key_size(kv[0]) + len(kv[1]))
 
-        return rv
+        if on_chunk is not None:
+            keys_done = on_chunk
+            on_chunk = lambda chunk: keys_done([key for key, value in chunk])
+
+        return self._iter_writes(chunks, lambda chunk: self._set_bulk_packed(chunk, expire, atomic, db), on_chunk)
+
+    def iter_remove_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                               in_flight=2, on_chunk=None):
+        return self._iter_writes(chunked(keys, chunk_keys, chunk_bytes),
+                                 lambda chunk: self.remove_bulk(chunk, atomic, db), on_chunk)
+
+    def _iter_writes(self, chunks, write, on_chunk=None):
+        '''
+        Make one request per chunk (there's no pipelining with HTTP). When given, "on_chunk(chunk)"
+        is called for each chunk sent, once its request is done (or failed).
+
+        '''
+
+        for chunk in chunks:
+            try:
+                result = write(chunk)
+            finally:
+                if on_chunk is not None:
+                    on_chunk(chunk)
+
+            yield result
 
     def get_int(self, key, db=0):
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
@@ -560,26 +789,7 @@ class ProtocolHandler(object):
         if limit:
             request_dict['max'] = limit
 
-        request_body = _dict_to_tsv(request_dict)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
-
-        res, body = self.getresponse()
-        if res.status != 200:
-            raise KyotoTycoonException('protocol error [%d]' % res.status)
-
-        rv = []
-        res_list = _tsv_to_list(body, res.getheader('Content-Type', ''))
-        if len(res_list) == 0 or res_list[-1][0] != b'num':
-            raise KyotoTycoonException('server returned no data')
-
-        num_key, num = res_list.pop()
-        if num == '0':
-            return []
-
-        for k, v in res_list:
-            rv.append(k.decode('utf-8')[1:])
-
-        return rv
+        return self._match(path, request_dict)
 
     def match_regex(self, regex, limit, db=0):
         if regex is None:
@@ -592,26 +802,7 @@ class ProtocolHandler(object):
         if limit:
             request_dict['max'] = limit
 
-        request_body = _dict_to_tsv(request_dict)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
-
-        res, body = self.getresponse()
-        if res.status != 200:
-            raise KyotoTycoonException('protocol error [%d]' % res.status)
-
-        rv = []
-        res_list = _tsv_to_list(body, res.getheader('Content-Type', ''))
-        if len(res_list) == 0 or res_list[-1][0] != b'num':
-            raise KyotoTycoonException('server returned no data')
-
-        num_key, num = res_list.pop()
-        if num == '0':
-            return []
-
-        for k, v in res_list:
-            rv.append(k.decode('utf-8')[1:])
-
-        return rv
+        return self._match(path, request_dict)
 
     def match_similar(self, origin, distance, limit, db=0):
         if origin is None:
@@ -628,26 +819,7 @@ class ProtocolHandler(object):
         if limit:
             request_dict['max'] = limit
 
-        request_body = _dict_to_tsv(request_dict)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
-
-        res, body = self.getresponse()
-        if res.status != 200:
-            raise KyotoTycoonException('protocol error [%d]' % res.status)
-
-        rv = []
-        res_list = _tsv_to_list(body, res.getheader('Content-Type', ''))
-        if len(res_list) == 0 or res_list[-1][0] != b'num':
-            raise KyotoTycoonException('server returned no data')
-
-        num_key, num = res_list.pop()
-        if num == '0':
-            return []
-
-        for k, v in res_list:
-            rv.append(k.decode('utf-8')[1:])
-
-        return rv
+        return self._match(path, request_dict)
 
     def set(self, key, value, expire, db=0):
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
@@ -689,9 +861,9 @@ class ProtocolHandler(object):
         if expire:
             request_dict['xt'] = expire
 
-        request_body = _dict_to_tsv(request_dict)
+        request_body, headers = _dict_to_request(request_dict)
 
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status != 200:
@@ -760,8 +932,8 @@ class ProtocolHandler(object):
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
         path = '/rpc/increment?DB=' + db
 
-        request_body = 'key\t%s\nnum\t%d\n' % (key, delta)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _tsv_request([(b'key', key.encode('utf-8')), (b'num', ('%d' % delta).encode('ascii'))])
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status != 200:
@@ -776,8 +948,8 @@ class ProtocolHandler(object):
         db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
         path = '/rpc/increment_double?DB=' + db
 
-        request_body = 'key\t%s\nnum\t%f\n' % (key, delta)
-        self.conn.request('POST', path, body=request_body, headers=KT_HTTP_HEADER)
+        request_body, headers = _tsv_request([(b'key', key.encode('utf-8')), (b'num', ('%f' % delta).encode('ascii'))])
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status != 200:
@@ -833,36 +1005,98 @@ class ProtocolHandler(object):
         st = self.status(db)
         return None if st is None else int(st['size'])
 
-    def play_script(self, name, kv_dict=None):
+    def play_script(self, name, kv_dict=None, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
+
         if kv_dict is None:
             kv_dict = {}
 
         path = '/rpc/play_script?name=' + quote(name.encode('utf-8'))
 
-        request_body = []
+        rows = []
         for k, v in kv_dict.items():
             if not isinstance(v, bytes):
                 raise ValueError('value must be a byte sequence')
 
-            k = quote(k.encode('utf-8'))
-            v = quote(v)
-            request_body.append('_%s\t%s\n' % (k, v))
+            rows.append((b'_' + k.encode('utf-8'), v))
+
+        request_body, headers = _tsv_request(rows)
+        self.conn.request('POST', path, body=request_body, headers=headers)
+
+        res, res_rows = self.getresponse_rows()
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return dict((k[1:].decode('utf-8'), v) for k, v in res_rows)
+
+    def _set_bulk_packed(self, kv_items, expire, atomic, db):
+        db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
+        path = '/rpc/set_bulk?DB=' + db
+
+        rows = [(b'atomic', b'')] if atomic else []
+
+        if expire is not None:
+            rows.append((b'xt', str(expire).encode('ascii')))
 
-        self.conn.request('POST', path, body=''.join(request_body), headers=KT_HTTP_HEADER)
+        rows.extend((b'_' + key.encode('utf-8'), value) for key, value in kv_items)
+
+        request_body, headers = _tsv_request(rows)
+        self.conn.request('POST', path, body=request_body, headers=headers)
 
         res, body = self.getresponse()
         if res.status != 200:
             raise KyotoTycoonException('protocol error [%d]' % res.status)
 
-        rv = {}
-        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        # Number of items set...
+        return int(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
 
-        for k, v in res_dict.items():
-            if v is not None:
-                rv[k.decode('utf-8')[1:]] = v
+    def _match(self, path, request_dict):
+        request_body, headers = _dict_to_request(request_dict)
+        self.conn.request('POST', path, body=request_body, headers=headers)
+
+        res, res_rows = self.getresponse_rows()
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        # Matching keys come first, then their number...
+        rv = []
+        num = None
+
+        for k, v in res_rows:
+            if k == b'num':
+                num = v
+            elif num is None:
+                rv.append(k[1:].decode('utf-8'))
+
+        if num is None:
+            raise KyotoTycoonException('server returned no data')
 
         return rv
 
+    def _get_bulk_rows(self, keys, atomic, db):
+        '''Yield the "(key, value)" pairs (with packed values) found for a "get_bulk" request, as they're read.'''
+
+        db = str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
+        path = '/rpc/get_bulk?DB=' + db
+
+        rows = [(b'atomic', b'')] if atomic else []
+        rows.extend((b'_' + key.encode('utf-8'), b'') for key in keys)
+
+        request_body, headers = _tsv_request(rows)
+        self.conn.request('POST', path, body=request_body, headers=headers)
+
+        res, res_rows = self.getresponse_rows()
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        try:
+            for k, v in res_rows:
+                if k.startswith(b'_'):  # ...and not the number of records found.
+                    yield k[1:].decode('utf-8'), v
+        finally:
+            res_rows.close()
+
     def _rest_put(self, operation, key, value, expire):
         headers = {b'X-Kt-Mode' : operation}
         if expire is not None:
@@ -0,0 +1,727 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Requires Python 3.5 or later (asyncio with "async/await" syntax).
+#
+
+import asyncio
+import struct
+import time
+
+from . import kt_http
+
+from .kt_error import KyotoTycoonException
+
+from .kt_http import quote, \
+                     _tsv_request, \
+                     _dict_to_request, \
+                     _tsv_to_dict, \
+                     _tsv_to_list
+
+from .kt_common import KT_PACKER_PICKLE
+
+# Maximum number of (keep-alive) connections kept by each handler, by default...
+DEFAULT_CONNECTIONS = 4
+
+def _db_path(db):
+    return str(db) if isinstance(db, int) else quote(db.encode('utf-8'))
+
+def _header_str(value):
+    return value.decode('latin-1') if isinstance(value, bytes) else str(value)
+
+
+class Response(object):
+    '''The status and headers of an HTTP response (the body is returned separately).'''
+
+    def __init__(self, status, headers, will_close):
+        self.status = status
+        self.headers = headers
+        self.will_close = will_close
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class HTTPConnection(object):
+    '''A minimal keep-alive HTTP/1.1 client connection, enough to talk to a KT server.'''
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                          self.timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        '''Send a request and return the "(response, body)" pair for it.'''
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.host, self.port)]
+
+        if headers:
+            for name, value in headers.items():
+                lines.append('%s: %s' % (_header_str(name), _header_str(value)))
+
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+
+        lines.append('\r\n')
+        self.writer.write('\r\n'.join(lines).encode('latin-1') + (body or b''))
+
+        return await asyncio.wait_for(self._getresponse(), self.timeout)
+
+    async def _getresponse(self):
+        try:
+            status_line = await self.reader.readline()
+            version, status = status_line.split(None, 2)[:2]
+
+            headers = {}
+            while True:
+                line = await self.reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+                name, value = line.decode('latin-1').split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        except (ValueError, asyncio.IncompleteReadError):
+            raise IOError('bad or incomplete response')
+
+        will_close = version == b'HTTP/1.0' or headers.get('connection', '').lower() == 'close'
+
+        return Response(int(status), headers, will_close), body
+
+
+class ConnectionPool(object):
+    '''Keep-alive connections shared by all requests of a handler, up to "size" at once.'''
+
+    def __init__(self, host, port, timeout, size):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def acquire(self):
+        await self.slots.acquire()
+
+        if self.idle:
+            return self.idle.pop()
+
+        conn = HTTPConnection(self.host, self.port, self.timeout)
+
+        try:
+            await conn.connect()
+        except Exception:
+            self.slots.release()
+            raise
+
+        return conn
+
+    def release(self, conn, reuse=True):
+        if reuse:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+        self.slots.release()
+
+    def close(self):
+        idle, self.idle = self.idle, []
+
+        for conn in idle:
+            conn.close()
+
+
+class Cursor(object):
+    '''
+    An asyncio record cursor. Cursors live in the server session for a connection, so each
+    cursor keeps one of the handler's connections to itself until it's deleted.
+
+    '''
+
+    cursor_id_counter = 1
+
+    def __init__(self, protocol_handler):
+        self.protocol_handler = protocol_handler
+        self.cursor_id = Cursor.cursor_id_counter
+        Cursor.cursor_id_counter += 1
+
+        self.pack = self.protocol_handler.pack
+        self.unpack = self.protocol_handler.unpack
+
+        self.conn = None
+        self.iterating = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        # Cleanup the cursor when leaving "async with" blocks...
+        await self.delete()
+
+    def __aiter__(self):
+        '''Return all (key,value) pairs for the cursor, in forward scan order.'''
+
+        self.iterating = False
+        return self
+
+    async def __anext__(self):
+        if not (await self.step() if self.iterating else await self.jump()):
+            raise StopAsyncIteration
+
+        self.iterating = True
+        return await self.get()
+
+    async def jump(self, key=None, db=0):
+        '''Jump the cursor to a record (first record if "None") for forward scan.'''
+
+        return await self._jump('/rpc/cur_jump?DB=' + _db_path(db), key)
+
+    async def jump_back(self, key=None, db=0):
+        '''Jump the cursor to a record (last record if "None") for forward scan.'''
+
+        return await self._jump('/rpc/cur_jump_back?DB=' + _db_path(db), key)
+
+    async def step(self):
+        '''Step the cursor to the next record.'''
+
+        return await self._step('/rpc/cur_step')
+
+    async def step_back(self):
+        '''Step the cursor to the previous record.'''
+
+        return await self._step('/rpc/cur_step_back')
+
+    async def set_value(self, value, step=False, expire=None):
+        '''Set the value for the current record.'''
+
+        request_dict = {'CUR': self.cursor_id, 'value': self.pack(value)}
+
+        if step:
+            request_dict['step'] = True
+
+        if expire:
+            request_dict['xt'] = expire
+
+        res, body = await self._post('/rpc/cur_set_value', request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def remove(self):
+        '''Remove the current record.'''
+
+        res, body = await self._post('/rpc/cur_remove', {'CUR': self.cursor_id})
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def get_key(self, step=False):
+        '''Get the key for the current record.'''
+
+        res_dict = await self._get('/rpc/cur_get_key', step)
+        return res_dict[b'key'].decode('utf-8')
+
+    async def get_value(self, step=False):
+        '''Get the value for the current record.'''
+
+        res_dict = await self._get('/rpc/cur_get_value', step)
+        return self.unpack(res_dict[b'value'])
+
+    async def get(self, step=False):
+        '''Get a (key,value) pair for the current record.'''
+
+        request_dict = {'CUR': self.cursor_id}
+
+        if step:
+            request_dict['step'] = True
+
+        res, body = await self._post('/rpc/cur_get', request_dict)
+        if res.status == 404:
+            return None, None
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        return res_dict[b'key'].decode('utf-8'), self.unpack(res_dict[b'value'])
+
+    async def seize(self):
+        '''Get a (key,value) pair for the current record, and remove it atomically.'''
+
+        res, body = await self._post('/rpc/cur_seize', {'CUR': self.cursor_id})
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        return {'key': res_dict[b'key'].decode('utf-8'), 'value': self.unpack(res_dict[b'value'])}
+
+    async def delete(self):
+        '''Delete the cursor (giving its connection back to the handler).'''
+
+        if self.conn is None:
+            return True
+
+        try:
+            res, body = await self._post('/rpc/cur_delete', {'CUR': self.cursor_id})
+        finally:
+            conn, self.conn = self.conn, None
+            self.protocol_handler.pool.release(conn, conn.reader is not None)
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def _jump(self, path, key):
+        request_dict = {'CUR': self.cursor_id}
+        if key:
+            request_dict['key'] = key.encode('utf-8')
+
+        res, body = await self._post(path, request_dict)
+        if res.status == 450:
+            # Since this is normal while iterating, do not raise an exception...
+            return False
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def _step(self, path):
+        res, body = await self._post(path, {'CUR': self.cursor_id})
+        if res.status == 450:
+            # Since this is normal while iterating, do not raise an exception...
+            return False
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def _get(self, path, step):
+        request_dict = {'CUR': self.cursor_id}
+
+        if step:
+            request_dict['step'] = True
+
+        res, body = await self._post(path, request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return _tsv_to_dict(body, res.getheader('Content-Type', ''))
+
+    async def _post(self, path, request_dict):
+        if self.conn is None:
+            self.conn = await self.protocol_handler.pool.acquire()
+
+        try:
+            res, body = await self.conn.request('POST', path, *_dict_to_request(request_dict))
+        except Exception:
+            self.conn.close()  # ...the cursor is lost along with the session.
+            raise
+
+        if res.will_close:
+            self.conn.close()
+            await self.conn.connect()
+
+        return res, body
+
+
+class ProtocolHandler(kt_http.ProtocolHandler):
+    '''
+    HTTP protocol handler for asyncio, with requests spread over a pool of keep-alive connections.
+
+    Packing and the TSV helpers are shared with the blocking handler it derives from, but all
+    methods that talk to the server are coroutines here.
+
+    '''
+
+    def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None, connections=DEFAULT_CONNECTIONS):
+        kt_http.ProtocolHandler.__init__(self, pack_type, custom_packer)
+
+        if connections < 1:
+            raise ValueError('at least one connection is required')
+
+        self.num_connections = connections
+        self.pool = None
+
+    def cursor(self):
+        return Cursor(self)
+
+    def iter_get_bulk(self, *args, **kwargs):
+        raise NotImplementedError('not supported by the asyncio client')
+
+    iter_set_bulk = iter_remove_bulk = iter_get_bulk
+
+    async def open(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.pool = ConnectionPool(host, port, timeout, self.num_connections)
+
+        # Fail early if the server can't be reached...
+        self.pool.release(await self.pool.acquire())
+        return True
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+        return True
+
+    async def echo(self):
+        res, body = await self._request('POST', '/rpc/echo')
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def get(self, key, db=0):
+        res, body = await self._request('GET', '/%s/%s' % (_db_path(db), quote(key.encode('utf-8'))))
+
+        if res.status == 404:
+            return None
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return self.unpack(body)
+
+    async def check(self, key, db=0):
+        res, body = await self._post('/rpc/check?DB=' + _db_path(db), {'key': key.encode('utf-8')})
+        if res.status == 450:  # ...no record was found
+            return False
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def seize(self, key, db=0):
+        res, body = await self._post('/rpc/seize?DB=' + _db_path(db), {'key': key.encode('utf-8')})
+        if res.status == 450:  # ...no record was found
+            return None
+
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        return self.unpack(res_dict[b'value'])
+
+    async def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
+
+        if isinstance(kv_dict, dict) and len(kv_dict) < 1:
+            return 0  # ...done
+
+        rows = [(b'atomic', b'')] if atomic else []
+
+        if expire is not None:
+            rows.append((b'xt', str(expire).encode('ascii')))
+
+        rows.extend((b'_' + key.encode('utf-8'), self.pack(value)) for key, value in kv_dict.items())
+
+        res, body = await self._request('POST', '/rpc/set_bulk?DB=' + _db_path(db), *_tsv_request(rows))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        # Number of items set...
+        return int(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
+
+    async def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
+
+        if len(keys) < 1:
+            return 0  # ...done
+
+        res, body = await self._keys_request('/rpc/remove_bulk?DB=' + _db_path(db), keys, atomic)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        # Number of items removed...
+        return int(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
+
+    async def get_bulk(self, keys, atomic, db=0):
+        if len(keys) < 1:
+            return {}  # ...done
+
+        res, body = await self._keys_request('/rpc/get_bulk?DB=' + _db_path(db), keys, atomic)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        rv = {}
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        res_dict.pop(b'num')
+
+        for k, v in res_dict.items():
+            if v is not None:
+                rv[k.decode('utf-8')[1:]] = self.unpack(v)
+
+        return rv
+
+    async def get_int(self, key, db=0):
+        res, body = await self._request('GET', '/%s/%s' % (_db_path(db), quote(key.encode('utf-8'))))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return struct.unpack('>q', body)[0]
+
+    async def vacuum(self, db=0):
+        res, body = await self._request('GET', '/rpc/vacuum?DB=' + _db_path(db))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def match_prefix(self, prefix, limit, db=0):
+        if prefix is None:
+            raise ValueError('no key prefix specified')
+
+        request_dict = {'prefix': prefix.encode('utf-8')}
+        if limit:
+            request_dict['max'] = limit
+
+        return await self._match('/rpc/match_prefix?DB=' + _db_path(db), request_dict)
+
+    async def match_regex(self, regex, limit, db=0):
+        if regex is None:
+            raise ValueError('no regular expression specified')
+
+        request_dict = {'regex': regex.encode('utf-8')}
+        if limit:
+            request_dict['max'] = limit
+
+        return await self._match('/rpc/match_regex?DB=' + _db_path(db), request_dict)
+
+    async def match_similar(self, origin, distance, limit, db=0):
+        if origin is None:
+            raise ValueError('no origin string specified')
+
+        request_dict = {'origin': origin.encode('utf-8'), 'utf': ''}
+
+        if distance is not None and distance >= 0:
+            request_dict['range'] = distance
+
+        if limit:
+            request_dict['max'] = limit
+
+        return await self._match('/rpc/match_similar?DB=' + _db_path(db), request_dict)
+
+    async def set(self, key, value, expire, db=0):
+        status = await self._rest_put(b'set', key, value, expire, db)
+        if status != 201:
+            raise KyotoTycoonException('protocol error [%d]' % status)
+
+        return True
+
+    async def add(self, key, value, expire, db=0):
+        status = await self._rest_put(b'add', key, value, expire, db)
+        if status != 201:
+            raise KyotoTycoonException('protocol error [%d]' % status)
+
+        return True
+
+    async def replace(self, key, value, expire, db=0):
+        status = await self._rest_put(b'replace', key, value, expire, db)
+        return status == 201
+
+    async def cas(self, key, old_val, new_val, expire, db=0):
+        if old_val is None and new_val is None:
+            raise ValueError('old value and/or new value must be specified')
+
+        request_dict = {'key': key.encode('utf-8')}
+
+        if old_val is not None:
+            request_dict['oval'] = self.pack(old_val)
+
+        if new_val is not None:
+            request_dict['nval'] = self.pack(new_val)
+
+        if expire:
+            request_dict['xt'] = expire
+
+        res, body = await self._post('/rpc/cas?DB=' + _db_path(db), request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def remove(self, key, db=0):
+        res, body = await self._request('DELETE', '/%s/%s' % (_db_path(db), quote(key.encode('utf-8'))))
+        return res.status == 204
+
+    async def append(self, key, value, expire, db=0):
+        if not isinstance(value, (bytes, str)):
+            raise ValueError('value is not a string or bytes type')
+
+        old_data = await self.get(key, db)
+        data = type(value)() if old_data is None else old_data
+
+        if not isinstance(data, (bytes, str)):
+            raise KyotoTycoonException('stored value is not a string or bytes type')
+
+        if type(data) != type(value):
+            value = value.encode('utf-8') if isinstance(data, bytes) else value.decode('utf-8')
+
+        # This makes the operation atomic...
+        if await self.cas(key, old_data, data + value, expire, db) is not True:
+            raise KyotoTycoonException('error while storing modified value')
+
+        return True
+
+    async def increment(self, key, delta, expire, db=0):
+        request_dict = {'key': key.encode('utf-8'), 'num': '%d' % delta}
+        if expire:
+            request_dict['xt'] = expire
+
+        res, body = await self._post('/rpc/increment?DB=' + _db_path(db), request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return int(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
+
+    async def increment_double(self, key, delta, expire, db=0):
+        if key is None:
+            raise ValueError('no key specified')
+
+        request_dict = {'key': key.encode('utf-8'), 'num': '%f' % delta}
+        if expire:
+            request_dict['xt'] = expire
+
+        res, body = await self._post('/rpc/increment_double?DB=' + _db_path(db), request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return float(_tsv_to_dict(body, res.getheader('Content-Type', ''))[b'num'])
+
+    async def report(self):
+        res, body = await self._request('GET', '/rpc/report')
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        return dict((k.decode('utf-8'), v.decode('utf-8')) for k, v in res_dict.items())
+
+    async def status(self, db=0):
+        res, body = await self._request('GET', '/rpc/status?DB=' + _db_path(db))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+        return dict((k.decode('utf-8'), v.decode('utf-8')) for k, v in res_dict.items())
+
+    async def clear(self, db=0):
+        res, body = await self._request('GET', '/rpc/clear?DB=' + _db_path(db))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        return True
+
+    async def count(self, db=0):
+        st = await self.status(db)
+        return None if st is None else int(st['count'])
+
+    async def size(self, db=0):
+        st = await self.status(db)
+        return None if st is None else int(st['size'])
+
+    async def play_script(self, name, kv_dict=None, noreply=False):
+        if noreply:
+            raise KyotoTycoonException('no-reply supported under the binary protocol only')
+
+        if kv_dict is None:
+            kv_dict = {}
+
+        rows = []
+        for k, v in kv_dict.items():
+            if not isinstance(v, bytes):
+                raise ValueError('value must be a byte sequence')
+
+            rows.append((b'_' + k.encode('utf-8'), v))
+
+        res, body = await self._request('POST', '/rpc/play_script?name=' + quote(name.encode('utf-8')),
+                                        *_tsv_request(rows))
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        rv = {}
+        res_dict = _tsv_to_dict(body, res.getheader('Content-Type', ''))
+
+        for k, v in res_dict.items():
+            if v is not None:
+                rv[k.decode('utf-8')[1:]] = v
+
+        return rv
+
+    async def _request(self, method, path, body=None, headers=None):
+        if self.pool is None:
+            raise KyotoTycoonException('not connected')
+
+        conn = await self.pool.acquire()
+
+        try:
+            res, body = await conn.request(method, path, body, headers)
+        except BaseException:
+            self.pool.release(conn, False)
+            raise
+
+        self.pool.release(conn, not res.will_close)
+        return res, body
+
+    async def _post(self, path, request_dict):
+        return await self._request('POST', path, *_dict_to_request(request_dict))
+
+    async def _keys_request(self, path, keys, atomic):
+        rows = [(b'atomic', b'')] if atomic else []
+        rows.extend((b'_' + key.encode('utf-8'), b'') for key in keys)
+
+        return await self._request('POST', path, *_tsv_request(rows))
+
+    async def _match(self, path, request_dict):
+        res, body = await self._post(path, request_dict)
+        if res.status != 200:
+            raise KyotoTycoonException('protocol error [%d]' % res.status)
+
+        res_list = _tsv_to_list(body, res.getheader('Content-Type', ''))
+        if len(res_list) == 0 or res_list[-1][0] != b'num':
+            raise KyotoTycoonException('server returned no data')
+
+        res_list.pop()
+        return [k.decode('utf-8')[1:] for k, v in res_list]
+
+    async def _rest_put(self, operation, key, value, expire, db):
+        path = '/%s/%s' % (_db_path(db), quote(key.encode('utf-8')))
+
+        headers = {'X-Kt-Mode': operation}
+        if expire is not None:
+            headers['X-Kt-Xt'] = str(int(time.time()) + expire)
+
+        res, body = await self._request('PUT', path, self.pack(value), headers)
+        return res.status
+
+# EOF - kt_http_async.py
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import socket
+
+from .kt_socket import BufferedReader
+
+# Maximum number of prebuilt request heads kept by each connection...
+MAX_CACHED_HEADS = 256
+
+# Size of the pieces returned when reading a body that ends with the connection...
+_READ_SIZE = 65536
+
+def _header_bytes(value):
+    return value if isinstance(value, bytes) else str(value).encode('latin-1')
+
+
+class HTTPResponse(object):
+    '''
+    A response read from an "HTTPConnection", with just the parts of "httplib.HTTPResponse" used
+    by the HTTP protocol handler. The body must be read (entirely) before the next request.
+
+    '''
+
+    def __init__(self, reader, status, headers, length, will_close):
+        self.reader = reader
+        self.status = status
+        self.headers = headers
+        self.length = length  # ...bytes left in the body, "None" meaning until the connection closes.
+        self.will_close = will_close
+
+        if length == 0:
+            self.reader = None
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def isclosed(self):
+        return self.reader is None
+
+    def read(self, amt=None):
+        if self.reader is None:
+            return b''
+
+        if self.length is None:
+            if amt is None:
+                return b''.join(iter(lambda: self.read(_READ_SIZE), b''))
+
+            data = self.reader.recv(amt)
+            if not data:
+                self.reader = None
+
+            return data
+
+        if amt is None or amt > self.length:
+            amt = self.length
+
+        data = self.reader.read(amt)
+        self.length -= amt
+
+        if not self.length:
+            self.reader = None
+
+        return data
+
+
+class HTTPConnection(object):
+    '''
+    A keep-alive HTTP/1.1 client connection over a plain socket, to use in place of
+    "httplib.HTTPConnection" for talking to a KT server.
+
+    The request line and headers for RPC requests are built once for each method, path (which
+    includes the database) and content type, and then reused as bytes. A request goes out with a
+    single "sendall()" and its response is parsed from a "BufferedReader", only as far as needed
+    to find the status, the headers and the end of the body.
+
+    '''
+
+    def __init__(self, host, port, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.sock = None
+        self.reader = None
+        self.response = None
+        self.method = None
+
+        self.host_header = ('Host: %s:%d\r\n' % (host, port)).encode('latin-1')
+        self.heads = {}
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = BufferedReader(self.sock)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+        self.sock = self.reader = self.response = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self.response is not None and not self.response.isclosed():
+            self.response.read()  # ...the previous response wasn't consumed, skip the rest of it.
+
+        if self.response is not None and self.response.will_close:
+            self.close()
+
+        if self.sock is None:
+            self.connect()
+
+        if body is None:
+            body = b''
+        elif not isinstance(body, bytes):
+            body = body.encode('utf-8')
+
+        data = b''.join((self._head(method, path, headers),
+                         ('Content-Length: %d\r\n\r\n' % len(body)).encode('latin-1'), body))
+
+        self.response = None
+        self.method = method
+
+        try:
+            self.sock.sendall(data)
+        except Exception:
+            self.close()
+            raise
+
+    def getresponse(self):
+        if self.sock is None:
+            raise IOError('no request sent')
+
+        try:
+            self.response = self._read_response()
+        except Exception:
+            self.close()
+            raise
+
+        return self.response
+
+    def _head(self, method, path, headers):
+        '''Return the request line and headers (except "Content-Length") for a request.'''
+
+        # Only RPC paths (with a bounded variety) are worth keeping...
+        cacheable = path.startswith('/rpc/') and (not headers or (len(headers) == 1 and 'Content-Type' in headers))
+
+        if cacheable:
+            key = (method, path, headers['Content-Type'] if headers else None)
+
+            head = self.heads.get(key)
+            if head is not None:
+                return head
+
+        parts = [('%s %s HTTP/1.1\r\n' % (method, path)).encode('latin-1'), self.host_header]
+
+        if headers:
+            for name, value in headers.items():
+                parts.extend((_header_bytes(name), b': ', _header_bytes(value), b'\r\n'))
+
+        head = b''.join(parts)
+
+        if cacheable and len(self.heads) < MAX_CACHED_HEADS:
+            self.heads[key] = head
+
+        return head
+
+    def _read_response(self):
+        reader = self.reader
+
+        try:
+            version, status = reader.readline().split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise IOError('bad status line')
+
+        headers = {}
+        while True:
+            line = reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise IOError('chunked responses are not supported')
+
+        will_close = version == b'HTTP/1.0' or headers.get('connection', '').lower() == 'close'
+
+        if self.method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            length = 0
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+        else:
+            length = None
+            will_close = True
+
+        return HTTPResponse(reader, status, headers, length, will_close)
+
+# EOF - kt_http_socket.py
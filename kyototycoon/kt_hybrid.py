@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+from . import kt_http
+from . import kt_binary
+
+from .kt_common import KT_PACKER_PICKLE, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES
+
+class ProtocolHandler(object):
+    '''
+    Protocol handler holding both a binary and an HTTP connection to the same server.
+
+    Plain and bulk get/set/remove, pipelines and scripts go over the (faster) binary protocol,
+    unless an atomic operation is requested or the database is given by name. Everything else
+    goes over HTTP.
+
+    '''
+
+    def __init__(self, pack_type=KT_PACKER_PICKLE, custom_packer=None):
+        self.binary = kt_binary.ProtocolHandler(pack_type, custom_packer)
+        self.http = kt_http.ProtocolHandler(pack_type, custom_packer)
+
+        self.pack_type = pack_type
+        self.pack = self.binary.pack
+        self.unpack = self.binary.unpack
+
+    def _handler(self, atomic=False, db=0):
+        # The binary protocol does not support atomic operations, nor databases given by name...
+        return self.http if atomic or not isinstance(db, int) else self.binary
+
+    def _records_handler(self, atomic, records):
+        return self.http if atomic or not all(isinstance(record[0], int) for record in records) else self.binary
+
+    def cursor(self):
+        return self.http.cursor()
+
+    def pipeline(self, max_pending=64):
+        return self.binary.pipeline(max_pending)
+
+    def open(self, host, port, timeout):
+        self.binary.open(host, port, timeout)
+
+        try:
+            self.http.open(host, port, timeout)
+        except Exception:
+            self.binary.close()
+            raise
+
+        return True
+
+    def close(self):
+        try:
+            self.binary.close()
+        finally:
+            self.http.close()
+
+        return True
+
+    def echo(self):
+        return self.http.echo()
+
+    def get(self, key, db=0):
+        return self._handler(db=db).get(key, db)
+
+    def get_with_expire(self, key, db=0):
+        return self._handler(db=db).get_with_expire(key, db)
+
+    def check(self, key, db=0):
+        return self.http.check(key, db)
+
+    def seize(self, key, db=0):
+        return self.http.seize(key, db)
+
+    def set_bulk(self, kv_dict, expire, atomic, db=0, noreply=False):
+        return self._handler(atomic, db).set_bulk(kv_dict, expire, atomic, db, noreply)
+
+    def remove_bulk(self, keys, atomic, db=0, noreply=False):
+        return self._handler(atomic, db).remove_bulk(keys, atomic, db, noreply)
+
+    def get_bulk(self, keys, atomic, db=0):
+        return self._handler(atomic, db).get_bulk(keys, atomic, db)
+
+    def get_bulk_with_expire(self, keys, atomic, db=0):
+        return self._handler(atomic, db).get_bulk_with_expire(keys, atomic, db)
+
+    def set_bulk_records(self, records, atomic, noreply=False):
+        records = list(records)
+        return self._records_handler(atomic, records).set_bulk_records(records, atomic, noreply)
+
+    def remove_bulk_records(self, records, atomic, noreply=False):
+        records = list(records)
+        return self._records_handler(atomic, records).remove_bulk_records(records, atomic, noreply)
+
+    def get_bulk_records(self, records, atomic):
+        records = list(records)
+        return self._records_handler(atomic, records).get_bulk_records(records, atomic)
+
+    def iter_get_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                      in_flight=2):
+        return self._handler(atomic, db).iter_get_bulk(keys, atomic, db, chunk_keys, chunk_bytes, in_flight)
+
+    def iter_set_bulk(self, kv_items, expire, atomic, db=0, chunk_keys=KT_CHUNK_KEYS,
+                      chunk_bytes=KT_CHUNK_BYTES, in_flight=2, on_chunk=None):
+        return self._handler(atomic, db).iter_set_bulk(kv_items, expire, atomic, db, chunk_keys, chunk_bytes,
+                                                       in_flight, on_chunk)
+
+    def iter_remove_bulk(self, keys, atomic, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES,
+                         in_flight=2, on_chunk=None):
+        return self._handler(atomic, db).iter_remove_bulk(keys, atomic, db, chunk_keys, chunk_bytes, in_flight,
+                                                          on_chunk)
+
+    def get_int(self, key, db=0):
+        return self.http.get_int(key, db)
+
+    def vacuum(self, db=0):
+        return self.http.vacuum(db)
+
+    def match_prefix(self, prefix, limit, db=0):
+        return self.http.match_prefix(prefix, limit, db)
+
+    def match_regex(self, regex, limit, db=0):
+        return self.http.match_regex(regex, limit, db)
+
+    def match_similar(self, origin, distance, limit, db=0):
+        return self.http.match_similar(origin, distance, limit, db)
+
+    def set(self, key, value, expire, db=0):
+        return self._handler(db=db).set(key, value, expire, db)
+
+    def add(self, key, value, expire, db=0):
+        return self.http.add(key, value, expire, db)
+
+    def cas(self, key, old_val, new_val, expire, db=0):
+        return self.http.cas(key, old_val, new_val, expire, db)
+
+    def remove(self, key, db=0):
+        return self._handler(db=db).remove(key, db)
+
+    def replace(self, key, value, expire, db=0):
+        return self.http.replace(key, value, expire, db)
+
+    def append(self, key, value, expire, db=0):
+        return self.http.append(key, value, expire, db)
+
+    def increment(self, key, delta, expire, db=0):
+        return self.http.increment(key, delta, expire, db)
+
+    def increment_double(self, key, delta, expire, db=0):
+        return self.http.increment_double(key, delta, expire, db)
+
+    def report(self):
+        return self.http.report()
+
+    def status(self, db=0):
+        return self.http.status(db)
+
+    def clear(self, db=0):
+        return self.http.clear(db)
+
+    def count(self, db=0):
+        return self.http.count(db)
+
+    def size(self, db=0):
+        return self.http.size(db)
+
+    def play_script(self, name, kv_dict=None, noreply=False):
+        return self.binary.play_script(name, kv_dict, noreply)
+
+# EOF - kt_hybrid.py
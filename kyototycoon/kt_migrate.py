@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import socket
+import threading
+import time
+
+from collections import deque
+from itertools import groupby
+
+from .kyototycoon import KyotoTycoon
+from .kyotoslave import KyotoSlave, OP_SET, OP_REMOVE, OP_CLEAR
+from .kt_pool import KyotoTycoonPool
+from .kt_scan import ParallelScan
+from .kt_sharded import parse_node
+from .kt_common import KT_PACKER_BYTES, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES
+
+# Expiration time for records that never expire, in transaction log entries...
+_LOG_NO_EXPIRE = 2**40 - 1
+
+
+class Throttle(object):
+    def __init__(self, max_ops=None, max_bytes=None):
+        '''Limit the average rate of operations (per second) and/or bytes (per second) over all callers.'''
+
+        self.max_ops = max_ops
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.ops = 0
+        self.bytes = 0
+
+    def wait(self, ops, num_bytes):
+        '''Account for "ops" operations and "num_bytes" bytes, sleeping as long as needed to stay within limits.'''
+
+        with self.lock:
+            self.ops += ops
+            self.bytes += num_bytes
+
+            elapsed = time.time() - self.start
+            delay = max(self.ops / float(self.max_ops) - elapsed if self.max_ops else 0,
+                        self.bytes / float(self.max_bytes) - elapsed if self.max_bytes else 0)
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Migration(object):
+    def __init__(self, source, target, db=0, target_db=None, cursors=4, partitions=None,
+                       batch_keys=KT_CHUNK_KEYS, batch_bytes=KT_CHUNK_BYTES, in_flight=4,
+                       max_ops=None, max_bytes=None, sid=None, timeout=30, script=None):
+        '''
+        Initialize the migration of all records in database "db" on the "source" server to the
+        "target" server (into "target_db", the same database by default), given as "host:port"
+        strings or "(host, port)" tuples. Values are copied verbatim (without unpacking) along
+        with their expiration times, and keys must be UTF-8 strings.
+
+        Records are read with up to "cursors" connections in parallel, each covering a range of
+        keys (split at the keys in "partitions", or found automatically for databases ordered by
+        key), see "kt_scan.ParallelScan". With "script" (see "kt_scan.SCAN_SCRIPT") batches are
+        read with a single request each, instead of a cursor. Records are written in bulk requests
+        of up to "batch_keys" keys (and roughly "batch_bytes" bytes) with "in_flight" of them
+        pipelined. The total rate can be limited to "max_ops" records and/or "max_bytes" bytes
+        per second.
+
+        Writes made to the source while copying can be replayed on the target by following its
+        transaction log as a replication slave with ID "sid" (see "tail()" and "run()").
+
+        '''
+
+        self.source = parse_node(source)[1:3]
+        self.target = parse_node(target)[1:3]
+        self.db = db
+        self.target_db = db if target_db is None else target_db
+
+        self.cursors = cursors
+        self.partitions = partitions
+        self.batch_keys = batch_keys
+        self.batch_bytes = batch_bytes
+        self.in_flight = in_flight
+        self.throttle = Throttle(max_ops, max_bytes)
+        self.sid = sid
+        self.timeout = timeout
+        self.script = script
+
+        self.lock = threading.Lock()
+        self.slave = None
+        self.saved = None  # ...the checkpoint for all writes known to have been made.
+        self.stopped = False
+
+        self.copied = 0
+        self.copied_bytes = 0
+        self.replayed = 0
+
+    def run(self, follow=False):
+        '''
+        Copy all records, then replay the writes made to the source meanwhile. With "follow",
+        keep replaying new writes until "stop()" is called.
+
+        '''
+
+        start = time.time()
+        self.copy()
+
+        return self.tail(start, None if follow else time.time())
+
+    def copy(self, checkpoint=None):
+        '''
+        Copy all records from the source to the target, returning the number of records copied.
+        An interrupted copy can be resumed by giving its last "checkpoint()".
+
+        '''
+
+        pool = self._open_source_pool()
+        target = self._open_target()
+
+        copied = 0
+        pipeline = target.pipeline(self.in_flight)
+        pending = deque()
+
+        try:
+            scan = self._scan(pool, checkpoint)
+
+            records = []
+            batch_bytes = 0
+
+            for key, value, expire in scan:
+                records.append((self.target_db, key, value, None if expire is None else -expire))
+                batch_bytes += len(key) + len(value)
+
+                if len(records) >= self.batch_keys or batch_bytes >= self.batch_bytes:
+                    copied += self._write(pipeline, pending, records, batch_bytes, scan)
+                    records = []
+                    batch_bytes = 0
+
+            if records:
+                copied += self._write(pipeline, pending, records, batch_bytes, scan)
+
+            while pending:
+                self._confirm(pending)
+
+            self.saved = scan.checkpoint()
+        finally:
+            pool.close()
+            target.close()
+
+        return copied
+
+    def tail(self, since, until=None):
+        '''
+        Replay the writes made to the source since the "since" timestamp (in seconds since the
+        epoch), until the source's transaction log reaches the "until" timestamp (or until
+        "stop()" is called), returning the number of writes replayed.
+
+        Replaying writes that are already on the target is harmless, so "since" can be safely
+        set a bit earlier than needed. Only databases given by index can be followed.
+
+        '''
+
+        if self.sid is None:
+            raise ValueError('a replication SID is required to follow the source')
+
+        target = self._open_target()
+        self.slave = KyotoSlave(self.sid, self.source[0], self.source[1], self.timeout)
+
+        entries = []
+        replayed = 0
+
+        try:
+            try:
+                for entry in self.slave.consume(since, heartbeats=True):
+                    if entry is not None and entry['db'] == self.db:
+                        entries.append(entry)
+
+                    if entries and (entry is None or len(entries) >= self.batch_keys):
+                        replayed += self._replay(target, entries)
+                        entries = []
+
+                    if until is not None and self.slave.last_ts >= until:
+                        break
+            except Exception:
+                if not self.stopped:
+                    raise
+
+            if entries:
+                replayed += self._replay(target, entries)
+        finally:
+            if not self.stopped:
+                self._close_slave()
+
+            target.close()
+
+        return replayed
+
+    def stop(self):
+        '''Stop following the source (from another thread).'''
+
+        self.stopped = True
+        self._close_slave()
+
+        return True
+
+    def stats(self):
+        '''Return the number of records (and bytes) copied, and the number of writes replayed.'''
+
+        with self.lock:
+            return {'copied': self.copied, 'copied_bytes': self.copied_bytes, 'replayed': self.replayed}
+
+    def checkpoint(self):
+        '''
+        Return the progress of the copy up to the last write known to have been made on the
+        target (or "None"), to resume it with "copy()" (e.g. after saving it as JSON).
+
+        '''
+
+        return self.saved
+
+    def ranges(self):
+        '''Return the "(start, end)" key ranges scanned in parallel, "None" meaning the first/last record.'''
+
+        pool = self._open_source_pool()
+
+        try:
+            return self._scan(pool).ranges()
+        finally:
+            pool.close()
+
+    def _scan(self, pool, checkpoint=None):
+        return ParallelScan(pool, self.cursors, self.partitions, self.db, self.batch_keys, self.script,
+                            with_expire=True, checkpoint=checkpoint)
+
+    def _write(self, pipeline, pending, records, batch_bytes, scan):
+        '''Queue a bulk write, waiting for the oldest one when too many are in flight.'''
+
+        self.throttle.wait(len(records), batch_bytes)
+
+        # Everything handed out by the scan so far is in this write or in earlier ones...
+        pending.append((pipeline.set_bulk_records(records), scan.checkpoint()))
+        pipeline.flush()
+
+        if len(pending) >= self.in_flight:
+            self._confirm(pending)
+
+        with self.lock:
+            self.copied += len(records)
+            self.copied_bytes += batch_bytes
+
+        return len(records)
+
+    def _confirm(self, pending):
+        reply, checkpoint = pending.popleft()
+        reply.result()
+
+        self.saved = checkpoint
+
+    def _replay(self, target, entries):
+        '''Apply transaction log entries to the target, in order, with consecutive ones of the same kind in bulk.'''
+
+        for op, group in groupby(entries, lambda entry: entry['op']):
+            group = list(group)
+
+            if op == OP_SET:
+                records = [(self.target_db, entry['key'].decode('utf-8'), entry['value'],
+                            None if entry['expires'] >= _LOG_NO_EXPIRE else -entry['expires'])
+                           for entry in group]
+                self.throttle.wait(len(records), sum(len(entry['key']) + len(entry['value']) for entry in group))
+                target.set_bulk_records(records)
+            elif op == OP_REMOVE:
+                records = [(self.target_db, entry['key'].decode('utf-8')) for entry in group]
+                self.throttle.wait(len(records), sum(len(entry['key']) for entry in group))
+                target.remove_bulk_records(records)
+            elif op == OP_CLEAR:
+                target.clear(self.target_db)
+
+        with self.lock:
+            self.replayed += len(entries)
+
+        return len(entries)
+
+    def _close_slave(self):
+        if getattr(self.slave, 'socket', None) is None:
+            return  # ...never connected.
+
+        try:
+            self.slave.close()
+        except socket.error:
+            pass  # ...already disconnected.
+
+    def _open_source_pool(self):
+        # Cursors (and "status()") need HTTP...
+        return KyotoTycoonPool(False, KT_PACKER_BYTES, None, self.source[0], self.source[1], self.timeout,
+                               min_size=0, max_size=self.cursors)
+
+    def _open_target(self):
+        target = KyotoTycoon(hybrid=True, pack_type=KT_PACKER_BYTES)  # ...also needs HTTP for "clear()".
+        target.open(self.target[0], self.target[1], self.timeout)
+        return target
+
+# EOF - kt_migrate.py
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .kyototycoon import KyotoTycoon
+from .kt_error import KyotoTycoonException
+from .kt_common import KT_PACKER_PICKLE
+from .kt_coalesce import SingleFlight
+from .kt_scan import ParallelScan, DEFAULT_SCAN_BATCH
+
+# Methods whose results outlive the call, and can't be proxied with a connection per call...
+_UNPOOLED_METHODS = frozenset(['open', 'connect', 'close', 'cursor', 'pipeline', 'scan',
+                               'iter_get_bulk', 'iter_set_bulk', 'iter_remove_bulk',
+                               'iter_match_prefix', 'iter_match_regex', 'iter_match_similar'])
+
+class ConnectionStats(object):
+    '''Usage metrics for a single pooled connection.'''
+
+    def __init__(self):
+        self.created = time.time()
+        self.last_used = self.created  # ...last checkin (or health check).
+
+        self.checkouts = 0
+        self.errors = 0
+        self.busy_time = 0.0  # ...seconds spent checked out.
+
+        self.checkout_time = None
+
+    def as_dict(self):
+        return {'created': self.created, 'last_used': self.last_used, 'checkouts': self.checkouts,
+                'errors': self.errors, 'busy_time': self.busy_time, 'busy': self.checkout_time is not None}
+
+
+class KyotoTycoonPool(object):
+    def __init__(self, binary=False, pack_type=KT_PACKER_PICKLE, custom_packer=None,
+                       host='127.0.0.1', port=1978, timeout=30, min_size=1, max_size=8,
+                       checkout_timeout=None, idle_timeout=300, check_interval=30, hybrid=False,
+                       cache=None, coalesce=None):
+        '''
+        Initialize a thread-safe pool of (at most "max_size") KyotoTycoon objects, all created
+        with the same "binary", "hybrid", packing, "cache" and "coalesce" options (with the cache
+        and the in-flight requests shared by all of them).
+
+        Connections are created on demand and kept open for reuse, closing those left idle for
+        more than "idle_timeout" seconds as long as at least "min_size" remain. When all are
+        in use, checkouts wait up to "checkout_timeout" seconds (forever if "None") for one to
+        be returned. Connections idle for more than "check_interval" seconds are checked with
+        "echo()" before being handed out, replacing the ones found broken.
+
+        Besides "checkout()"/"checkin()" and "connection()", all (single request) KyotoTycoon
+        methods can be called directly on the pool, using a pooled connection for each call.
+
+        '''
+
+        if not (0 <= min_size <= max_size) or max_size < 1:
+            raise ValueError('pool size limits must satisfy 0 <= min_size <= max_size (and max_size > 0)')
+
+        self.binary = binary
+        self.hybrid = hybrid
+        self.cache = cache
+        self.coalesce = SingleFlight() if coalesce is True else coalesce
+        self.pack_type = pack_type
+        self.custom_packer = custom_packer
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self.lock = threading.Condition()
+        self.connections = {}  # ...all pooled connections and their metrics.
+        self.idle = []  # ...least recently used first.
+        self.opening = 0
+        self.closed = False
+
+        # Pool-wide metrics...
+        self.waits = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self.failed_checks = 0
+
+        for i in range(min_size):
+            kt = self._open()
+            self.connections[kt] = ConnectionStats()
+            self.idle.append(kt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in _UNPOOLED_METHODS or not callable(getattr(KyotoTycoon, name, None)):
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+        def pooled_call(*args, **kwargs):
+            with self.connection() as kt:
+                return getattr(kt, name)(*args, **kwargs)
+
+        pooled_call.__name__ = name
+        pooled_call.__doc__ = getattr(KyotoTycoon, name).__doc__
+
+        return pooled_call
+
+    @contextmanager
+    def connection(self, timeout=None):
+        '''Check out a connection for the duration of a "with" block.'''
+
+        kt = self.checkout(timeout)
+
+        try:
+            yield kt
+        except KyotoTycoonException:
+            # An error reply from the server, but the connection can still be used...
+            self.checkin(kt, error=True)
+            raise
+        except BaseException:
+            # The connection may have been left in the middle of a request...
+            self.checkin(kt, broken=True)
+            raise
+
+        self.checkin(kt)
+
+    def checkout(self, timeout=None):
+        '''
+        Take a connection from the pool, waiting up to "timeout" seconds if all are in use
+        (defaults to the pool's "checkout_timeout"). Must be returned with "checkin()".
+
+        '''
+
+        if timeout is None:
+            timeout = self.checkout_timeout
+
+        deadline = None if timeout is None else time.time() + timeout
+        self._evict()
+
+        while True:
+            kt, stale = self._take(deadline)
+
+            if kt is None:  # ...a new connection is due.
+                try:
+                    kt = self._open()
+                except Exception:
+                    with self.lock:
+                        self.opening -= 1
+                        self.lock.notify()
+                    raise
+
+                stats = ConnectionStats()
+                with self.lock:
+                    self.opening -= 1
+                    self.connections[kt] = stats
+            else:
+                stats = self.connections[kt]
+
+                if stale and not self._check(kt):
+                    with self.lock:
+                        self.failed_checks += 1
+                        self._discard(kt)
+                    continue
+
+            stats.checkouts += 1
+            stats.checkout_time = time.time()
+
+            return kt
+
+    def checkin(self, kt, broken=False, error=False):
+        '''Return a connection to the pool (closing it instead if "broken").'''
+
+        now = time.time()
+
+        with self.lock:
+            stats = self.connections.get(kt)
+            if stats is None or stats.checkout_time is None:
+                raise KyotoTycoonException('connection does not belong to the pool or was not checked out')
+
+            stats.busy_time += now - stats.checkout_time
+            stats.checkout_time = None
+            stats.last_used = now
+
+            if broken or error:
+                stats.errors += 1
+
+            if broken or self.closed:
+                self._discard(kt)
+            else:
+                self.idle.append(kt)
+
+            self.lock.notify()
+
+        self._evict()
+
+    def close(self):
+        '''Close all idle connections, and the remaining ones as soon as they're returned.'''
+
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+
+            for kt in idle:
+                self._discard(kt)
+
+            self.lock.notify_all()
+
+        return True
+
+    def parallel_scan(self, workers=None, partitions=None, db=0, batch_size=DEFAULT_SCAN_BATCH, script=None,
+                            with_expire=False, checkpoint=None):
+        '''
+        Scan all records in the database with up to "workers" (by default "max_size") pooled
+        connections at once, each reading its own key range. Returns a "kt_scan.ParallelScan"
+        object, which yields the records when iterated over and keeps track of the progress of
+        each range, so that the scan can be resumed from a checkpoint.
+
+        '''
+
+        return ParallelScan(self, workers or self.max_size, partitions, db, batch_size, script,
+                            with_expire, checkpoint)
+
+    def stats(self):
+        '''Return pool-wide metrics, along with a list of metrics for each connection.'''
+
+        with self.lock:
+            return {'size': len(self.connections), 'idle': len(self.idle), 'min_size': self.min_size,
+                    'max_size': self.max_size, 'waits': self.waits, 'timeouts': self.timeouts,
+                    'evictions': self.evictions, 'failed_checks': self.failed_checks,
+                    'connections': [stats.as_dict() for stats in self.connections.values()]}
+
+    def _take(self, deadline):
+        '''Return an idle connection (and whether it needs checking), or "None" when one should be opened.'''
+
+        with self.lock:
+            waited = False
+
+            while True:
+                if self.closed:
+                    raise KyotoTycoonException('connection pool is closed')
+
+                if self.idle:
+                    kt = self.idle.pop()  # ...the most recently used, least likely to be broken.
+                    stale = time.time() - self.connections[kt].last_used > self.check_interval
+                    return kt, stale
+
+                if len(self.connections) + self.opening < self.max_size:
+                    self.opening += 1
+                    return None, False
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    self.timeouts += 1
+                    raise KyotoTycoonException('timed out waiting for a connection')
+
+                if not waited:
+                    self.waits += 1
+                    waited = True
+
+                self.lock.wait(remaining)
+
+    def _check(self, kt):
+        try:
+            kt.echo()
+        except Exception:
+            return False
+
+        self.connections[kt].last_used = time.time()
+        return True
+
+    def _evict(self):
+        '''Close connections idle for too long, keeping at least "min_size" in the pool.'''
+
+        evict_before = time.time() - self.idle_timeout
+
+        with self.lock:
+            while (self.idle and len(self.connections) > self.min_size and
+                   self.connections[self.idle[0]].last_used < evict_before):
+                self.evictions += 1
+                self._discard(self.idle.pop(0))
+
+    def _discard(self, kt):
+        '''Remove a connection from the pool and close it (must hold the lock).'''
+
+        del self.connections[kt]
+
+        try:
+            kt.close()
+        except Exception:
+            pass  # ...it's gone anyway.
+
+    def _open(self):
+        kt = KyotoTycoon(self.binary, self.pack_type, self.custom_packer,
+                         hybrid=self.hybrid, cache=self.cache, coalesce=self.coalesce)
+        kt.open(self.host, self.port, self.timeout)
+
+        return kt
+
+# EOF - kt_pool.py
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+import time
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from .kyototycoon import KyotoTycoon
+from .kt_pool import KyotoTycoonPool
+from .kt_error import KyotoTycoonException
+from .kt_common import KT_PACKER_PICKLE
+from .kt_sharded import parse_node
+
+# How far behind the master (in seconds) a replica may be and still serve reads, by default...
+DEFAULT_MAX_LAG = 5.0
+
+# How long (in seconds) to wait for a replica's state to be checked, by default...
+DEFAULT_CHECK_TIMEOUT = 2.0
+
+# Number of recent requests whose latencies are kept for each server, by default...
+DEFAULT_LATENCY_WINDOW = 1000
+
+# Operations that only read records, and can be sent to a replica (or hedged)...
+_READ_METHODS = frozenset(['get', 'get_with_expire', 'check', 'get_int', 'get_bulk', 'get_bulk_records',
+                           'match_prefix', 'match_regex', 'match_similar'])
+
+def replication_lag(report):
+    '''Return the replication delay (in seconds) from a "report()" dictionary, or "None" if not a replica.'''
+
+    delay = report.get('repl_delay')
+    return float(delay) if delay is not None else None
+
+
+class LatencyTracker(object):
+    '''The latencies of the most recent requests to a single server.'''
+
+    def __init__(self, window=DEFAULT_LATENCY_WINDOW, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+        # Sorted samples, only refreshed every now and then (as sorting isn't cheap)...
+        self.sorted = []
+        self.stale = 0
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.stale += 1
+
+    def percentile(self, percent):
+        '''Return the latency (in seconds) for the given percentile, or "None" without enough samples.'''
+
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+
+            if not self.sorted or self.stale * 20 >= len(self.samples):
+                self.sorted = sorted(self.samples)
+                self.stale = 0
+
+            return self.sorted[min(len(self.sorted) - 1, int(len(self.sorted) * percent / 100.0))]
+
+
+class Replica(object):
+    '''The connection pool for a single server, and what's known about its state.'''
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool  # ...also holds the address, used for checks.
+        self.latency = LatencyTracker()
+
+        self.lag = None
+        self.available = False
+        self.checked = 0  # ...never.
+
+        self.reads = 0
+        self.errors = 0
+
+    def usable(self, max_lag):
+        return self.available and (max_lag is None or (self.lag is not None and self.lag <= max_lag))
+
+    def as_dict(self):
+        return {'lag': self.lag, 'available': self.available, 'checked': self.checked,
+                'reads': self.reads, 'errors': self.errors,
+                'latency_p50': self.latency.percentile(50), 'latency_p99': self.latency.percentile(99)}
+
+
+class ReplicatedKyotoTycoon(object):
+    def __init__(self, master, replicas, binary=False, pack_type=KT_PACKER_PICKLE, custom_packer=None,
+                       timeout=30, max_lag=DEFAULT_MAX_LAG, check_interval=5, pool_size=8, hybrid=False,
+                       hedge_percentile=None, hedge_workers=16, check_timeout=DEFAULT_CHECK_TIMEOUT):
+        '''
+        Initialize a client for a master server and its (read-only) replication slaves, given
+        as "host:port" strings or "(host, port)" tuples.
+
+        Writes (and anything else not listed in "_READ_METHODS") go to the master, while reads
+        are spread over the replicas whose replication delay is at most "max_lag" seconds. The
+        delay comes from the "repl_delay" field of each replica's "report()" (over HTTP), which
+        is refreshed every "check_interval" seconds by a background thread, waiting at most
+        "check_timeout" seconds for each replica (the first checks are made before returning).
+        When there's no such replica, or a replica fails to answer, reads go to the master instead. With "max_lag=None" the replication
+        delay isn't taken into account (but replicas must still be reachable).
+
+        Each server is accessed through its own "KyotoTycoonPool" (of at most "pool_size"
+        connections, with the same "binary", "hybrid" and packing options).
+
+        With "hedge_percentile" (e.g. 95) reads are hedged: when a replica hasn't answered after
+        that percentile of its recent latencies, the same read is also sent to another replica
+        (or the master, if there's no other) and the first answer wins. Reads are then made from
+        a pool of "hedge_workers" threads, so hedging only pays off if stalls are much longer
+        than the cost of handing requests over to another thread.
+
+        Note: Reads from replicas may not see the latest writes (made within "max_lag" seconds).
+              Cursors, pipelines and scripts are only available on the master, see "master".
+
+        '''
+
+        if not replicas:
+            raise ValueError('at least one replica is required')
+
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+
+        def open_pool(node):
+            name, host, port, weight = parse_node(node)
+            return name, KyotoTycoonPool(binary, pack_type, custom_packer, host, port, timeout,
+                                         min_size=0, max_size=pool_size, hybrid=hybrid)
+
+        self.master = open_pool(master)[1]
+        self.master_latency = LatencyTracker()
+        self.replicas = [Replica(*open_pool(node)) for node in replicas]
+
+        self.lock = threading.Lock()
+        self.next = 0  # ...round-robin over usable replicas.
+
+        self.hedge_percentile = hedge_percentile
+        self.workers = ThreadPool(hedge_workers) if hedge_percentile is not None else None
+
+        self.master_reads = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+        # Replicas are checked in parallel, so that one not answering doesn't delay the others...
+        self.checks = ThreadPool(len(self.replicas))
+        self.closed = threading.Event()
+        self._check_all()
+
+        self.checker = threading.Thread(target=self._run_checks, name='ReplicaChecker')
+        self.checker.daemon = True
+        self.checker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+        if name not in _READ_METHODS:
+            return getattr(self.master, name)
+
+        def read_call(*args, **kwargs):
+            return self._read(name, *args, **kwargs)
+
+        read_call.__name__ = name
+        return read_call
+
+    def close(self):
+        '''Stop checking the replicas and close the connections to all servers.'''
+
+        self.closed.set()
+        self.checker.join()
+        self.checks.terminate()
+
+        self.master.close()
+
+        for replica in self.replicas:
+            replica.pool.close()
+
+        if self.workers is not None:
+            self.workers.terminate()
+
+        return True
+
+    def stats(self):
+        '''Return counters for reads sent to the master and hedged reads, along with the state of each replica.'''
+
+        with self.lock:
+            return {'master_reads': self.master_reads, 'hedges': self.hedges, 'hedges_won': self.hedges_won,
+                    'master_latency_p50': self.master_latency.percentile(50),
+                    'master_latency_p99': self.master_latency.percentile(99),
+                    'replicas': dict((replica.name, replica.as_dict()) for replica in self.replicas)}
+
+    def _read(self, name, *args, **kwargs):
+        replica = self._replica()
+
+        if replica is not None:
+            try:
+                if self.workers is None:
+                    return self._attempt(replica, name, args, kwargs)
+
+                return self._hedged(replica, name, args, kwargs)
+            except (KyotoTycoonException, NotImplementedError):
+                raise  # ...the master wouldn't do any better.
+            except Exception:
+                pass  # ...unreachable, fall back to the master.
+
+        return self._attempt(None, name, args, kwargs)
+
+    def _attempt(self, replica, name, args, kwargs):
+        '''Make a read from a replica (or the master, when "None"), keeping track of its latency.'''
+
+        start = time.time()
+
+        if replica is None:
+            with self.lock:
+                self.master_reads += 1
+
+            result = getattr(self.master, name)(*args, **kwargs)
+            self.master_latency.add(time.time() - start)
+            return result
+
+        try:
+            result = getattr(replica.pool, name)(*args, **kwargs)
+        except (KyotoTycoonException, NotImplementedError):
+            raise
+        except Exception:
+            # Unreachable, so leave it alone until the next check...
+            with self.lock:
+                replica.available = False
+                replica.errors += 1
+            raise
+
+        replica.latency.add(time.time() - start)
+
+        with self.lock:
+            replica.reads += 1
+
+        return result
+
+    def _hedged(self, replica, name, args, kwargs):
+        '''Make a read from a replica, repeating it elsewhere if it takes longer than usual.'''
+
+        outcomes = Queue()
+
+        def attempt(target):
+            try:
+                outcomes.put((target, True, self._attempt(target, name, args, kwargs)))
+            except BaseException as e:
+                outcomes.put((target, False, e))
+
+        self.workers.apply_async(attempt, (replica,))
+        pending = 1
+
+        delay = replica.latency.percentile(self.hedge_percentile)
+
+        try:
+            outcome = outcomes.get(timeout=delay) if delay is not None else outcomes.get()
+        except Empty:
+            with self.lock:
+                usable = [other for other in self.replicas if other is not replica and other.usable(self.max_lag)]
+                hedge = usable[self.next % len(usable)] if usable else None  # ...or the master.
+                self.hedges += 1
+
+            self.workers.apply_async(attempt, (hedge,))
+            pending += 1
+
+            outcome = outcomes.get()
+
+        # A failed read still gives the other one a chance...
+        pending -= 1
+        while not outcome[1] and pending:
+            outcome = outcomes.get()
+            pending -= 1
+
+        target, ok, result = outcome
+        if not ok:
+            raise result
+
+        if target is not replica:
+            with self.lock:
+                self.hedges_won += 1
+
+        return result
+
+    def _replica(self):
+        '''Return the next replica able to serve reads, or "None" if there isn't one.'''
+
+        with self.lock:
+            usable = [replica for replica in self.replicas if replica.usable(self.max_lag)]
+            if not usable:
+                return None
+
+            self.next = (self.next + 1) % len(usable)
+            return usable[self.next]
+
+    def _run_checks(self):
+        while not self.closed.wait(self.check_interval):
+            self._check_all()
+
+    def _check_all(self):
+        self.checks.map(self._check, self.replicas)
+
+    def _check(self, replica):
+        pool = replica.pool
+
+        # The binary protocol has no "report()", so checks always use a (short lived) HTTP connection...
+        try:
+            with KyotoTycoon(binary=False) as kt:
+                kt.open(pool.host, pool.port, self.check_timeout)
+                lag = replication_lag(kt.report())
+        except Exception:
+            with self.lock:
+                replica.available = False
+                replica.checked = time.time()
+                replica.errors += 1
+            return
+
+        with self.lock:
+            replica.lag = lag
+            replica.available = True
+            replica.checked = time.time()
+
+# EOF - kt_replicated.py
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import os
+import re
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from .kt_error import KyotoTycoonException
+
+# Number of records fetched per request when scanning, by default...
+DEFAULT_SCAN_BATCH = 1000
+
+# Name of the server-side procedure used to fetch several records per request, by default...
+DEFAULT_SCAN_SCRIPT = 'scan_batch'
+
+# Number of matching keys fetched per request when paging through matches, by default...
+DEFAULT_MATCH_PAGE = 1000
+
+# Name of the server-side procedure used to page through matching keys, by default...
+DEFAULT_MATCH_SCRIPT = 'match_page'
+
+# Records examined per request (for each matching key asked for) when paging through matches...
+_MATCH_SCAN_FACTOR = 100
+
+# Kyoto Cabinet database types that keep records ordered by key (and can be split into key ranges)...
+ORDERED_DB_TYPES = frozenset([0x11, 0x22, 0x31, 0x41])
+
+# The procedure above, to be included in the script given to "ktserver -scr"...
+SCAN_SCRIPT = '''
+-- return up to "max" records of database "db" (by index or name),
+-- starting at "key" (or the first record), as output records named
+-- "k<n>", "v<n>" and "x<n>" (if expiring) for n = 1..count, along with
+-- "count" and the key to start the next batch at in "next" (unless at
+-- the end)
+function scan_batch(inmap, outmap)
+   local kt = __kyototycoon__
+   local sdb
+   if not inmap.db or tonumber(inmap.db) then
+      sdb = kt.dbs[(tonumber(inmap.db) or 0) + 1]
+   else
+      sdb = kt.dbs[inmap.db]
+   end
+   local max = tonumber(inmap.max) or 1000
+   if not sdb then
+      return kt.RVEINVALID
+   end
+   local cur = sdb:cursor()
+   local count = 0
+   if cur:jump(inmap.key) then
+      while count < max do
+         local key, value, xt = cur:get(true)
+         if not key then
+            break
+         end
+         count = count + 1
+         outmap["k" .. count] = key
+         outmap["v" .. count] = value
+         if xt and xt < 1099511627775 then
+            outmap["x" .. count] = string.format("%d", xt)
+         end
+      end
+      local key = cur:get_key()
+      if key then
+         outmap.next = key
+      end
+   end
+   cur:disable()
+   outmap.count = tostring(count)
+   return kt.RVSUCCESS
+end
+'''
+
+# The procedure for paging through matching keys, also to be included in that script...
+MATCH_SCRIPT = '''
+-- return up to "max" keys of database "db" (by index or name) matching
+-- "pattern" as a prefix, regular expression or similar string (within
+-- distance "range"), according to "mode", as output records named "k<n>"
+-- for n = 1..count, starting at "key" (or the first record, or the
+-- prefix) and examining at most "scan" records, along with the key to
+-- resume at in "next" (unless at the end)
+function match_page(inmap, outmap)
+   local kt = __kyototycoon__
+   local mdb
+   if not inmap.db or tonumber(inmap.db) then
+      mdb = kt.dbs[(tonumber(inmap.db) or 0) + 1]
+   else
+      mdb = kt.dbs[inmap.db]
+   end
+   local mode = inmap.mode
+   local pattern = inmap.pattern
+   local max = tonumber(inmap.max) or 1000
+   local scan = tonumber(inmap.scan) or max * 100
+   local range = tonumber(inmap.range) or 0
+   if not mdb or not pattern then
+      return kt.RVEINVALID
+   end
+   local dbtype = tonumber(mdb:status()["type"])
+   local ordered = dbtype == 0x11 or dbtype == 0x22 or dbtype == 0x31 or dbtype == 0x41
+   local cur = mdb:cursor()
+   local found
+   if inmap.key then
+      found = cur:jump(inmap.key)
+      if not found then
+         cur:disable()
+         return kt.RVENOREC
+      end
+   elseif mode == "prefix" and ordered then
+      found = cur:jump(pattern)
+   else
+      found = cur:jump()
+   end
+   local count = 0
+   local scanned = 0
+   local finished = not found
+   while not finished and count < max and scanned < scan do
+      local key = cur:get_key()
+      if not key then
+         finished = true
+      elseif mode == "prefix" and ordered and key:sub(1, #pattern) ~= pattern then
+         finished = true
+      else
+         local matched
+         if mode == "prefix" then
+            matched = key:sub(1, #pattern) == pattern
+         elseif mode == "regex" then
+            matched = kt.regex(key, pattern)
+         else
+            matched = kt.levdist(key, pattern, true) <= range
+         end
+         if matched then
+            count = count + 1
+            outmap["k" .. count] = key
+         end
+         scanned = scanned + 1
+         cur:step()
+      end
+   end
+   if not finished then
+      local key = cur:get_key()
+      if key and not (mode == "prefix" and ordered and key:sub(1, #pattern) ~= pattern) then
+         outmap.next = key
+      end
+   end
+   cur:disable()
+   outmap.count = tostring(count)
+   return kt.RVSUCCESS
+end
+'''
+
+def _db_param(db):
+    return str(db).encode('ascii') if isinstance(db, int) else db.encode('utf-8')
+
+def script_batches(core, script, key=None, batch_size=DEFAULT_SCAN_BATCH, db=0, with_expire=False):
+    '''
+    Yield lists of up to "batch_size" records from "key" (or the first record) onwards, fetched
+    with the "SCAN_SCRIPT" procedure through a protocol handler ("core"). Records are "(key, value)"
+    pairs, or "(key, value, expire)" tuples with "with_expire".
+
+    Note: Each batch starts with a jump to the record following the previous batch, so a scan
+          on a database not ordered by key can't go on if that record is removed meanwhile.
+
+    '''
+
+    while True:
+        kv_dict = {'db': _db_param(db), 'max': str(batch_size).encode('ascii')}
+        if key is not None:
+            kv_dict['key'] = key.encode('utf-8')
+
+        out = core.play_script(script, kv_dict)
+
+        batch = []
+        for i in range(1, int(out.get('count', b'0')) + 1):
+            record = (out['k%d' % i].decode('utf-8'), core.unpack(out['v%d' % i]))
+
+            if with_expire:
+                expire = out.get('x%d' % i)
+                record += (int(expire) if expire is not None else None,)
+
+            batch.append(record)
+
+        if batch:
+            yield batch
+
+        if 'next' not in out:
+            return
+
+        key = out['next'].decode('utf-8')
+
+def record_batches(kt, key=None, batch_size=DEFAULT_SCAN_BATCH, db=0, script=None, with_expire=False):
+    '''
+    Yield lists of records from "key" (or the first record) onwards, read through a KyotoTycoon
+    object "kt" with the "script" procedure (see "script_batches()") or, without one, a cursor.
+
+    '''
+
+    if script is not None:
+        for batch in script_batches(kt.core, script, key, batch_size, db, with_expire):
+            yield batch
+
+        return
+
+    cursor = kt.cursor()
+    try:
+        for batch in cursor.iter_batches(batch_size, key, db, prefetch=False, with_expire=with_expire):
+            yield batch
+    finally:
+        cursor.delete()
+
+def match_keys(kt, mode, pattern, distance=0, limit=None, page_size=DEFAULT_MATCH_PAGE, db=0, script=None):
+    '''
+    Yield the keys matching "pattern" through a KyotoTycoon object "kt", where "mode" is one of
+    "prefix", "regex" or "similar" (within "distance"), stopping after "limit" keys if given.
+
+    With "script" (see "MATCH_SCRIPT") keys are fetched "page_size" at a time, each request
+    examining a bounded number of records and resuming at the key where the previous one
+    stopped. Without one, keys are read with a cursor (HTTP protocol only) and matched here,
+    with Python's regular expressions standing in for the server's. Prefix matches only read
+    the keys under the prefix when the database is ordered by key.
+
+    '''
+
+    if mode not in ('prefix', 'regex', 'similar'):
+        raise ValueError('unknown match mode: %s' % mode)
+
+    if pattern is None:
+        raise ValueError('no match pattern specified')
+
+    if script is not None:
+        keys = _script_matches(kt, script, mode, pattern, distance, page_size, db)
+    else:
+        keys = _cursor_matches(kt, mode, pattern, distance, db)
+
+    try:
+        for count, key in enumerate(keys, 1):
+            yield key
+
+            if limit and count >= limit:
+                break
+    finally:
+        keys.close()
+
+def _script_matches(kt, script, mode, pattern, distance, page_size, db):
+    kv_dict = {'db': _db_param(db), 'mode': mode.encode('ascii'), 'pattern': pattern.encode('utf-8'),
+               'range': str(distance or 0).encode('ascii'), 'max': str(page_size).encode('ascii'),
+               'scan': str(page_size * _MATCH_SCAN_FACTOR).encode('ascii')}
+
+    while True:
+        out = kt.play_script(script, kv_dict)
+
+        for i in range(1, int(out.get('count', b'0')) + 1):
+            yield out['k%d' % i].decode('utf-8')
+
+        if 'next' not in out:
+            return
+
+        kv_dict['key'] = out['next']
+
+def _cursor_matches(kt, mode, pattern, distance, db):
+    if mode == 'prefix':
+        ordered = int(kt.status(db).get('type', 0)) in ORDERED_DB_TYPES
+        matches = lambda key: key.startswith(pattern)
+    elif mode == 'regex':
+        ordered = False
+        matches = re.compile(pattern).search
+    else:
+        ordered = False
+        matches = lambda key: _levdist(key, pattern) <= (distance or 0)
+
+    with kt.cursor() as cursor:
+        if not cursor.jump(pattern if ordered else None, db=db):
+            return
+
+        while True:
+            key = cursor.get_key(step=True)
+            if key is None or (ordered and not key.startswith(pattern)):
+                return
+
+            if matches(key):
+                yield key
+
+def _levdist(a, b):
+    '''Return the Levenshtein distance between two strings (in characters).'''
+
+    previous = list(range(len(b) + 1))
+
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+
+        previous = current
+
+    return previous[-1]
+
+def prefetched(batches):
+    '''
+    Iterate over "batches", fetching the next one in a background thread while the caller works
+    on the current one. Whatever "batches" uses must not be used by the caller meanwhile.
+
+    '''
+
+    batches = iter(batches)
+    fetched = {}
+
+    def fetch():
+        try:
+            fetched['batch'] = next(batches, None)
+        except BaseException as e:
+            fetched['error'] = e
+
+    thread = threading.Thread(target=fetch, name='prefetch')
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            thread.join()
+
+            if 'error' in fetched:
+                raise fetched.pop('error')
+
+            batch = fetched.pop('batch')
+            if batch is None:
+                return
+
+            thread = threading.Thread(target=fetch, name='prefetch')
+            thread.daemon = True
+            thread.start()
+
+            yield batch
+    finally:
+        thread.join()  # ...never leave a request half done.
+
+def split_key_range(first, last, parts):
+    '''Return up to "parts - 1" keys splitting the range between "first" and "last" into roughly equal parts.'''
+
+    if first >= last or parts < 2:
+        return []
+
+    prefix = os.path.commonprefix([first, last])
+    low = ord(first[len(prefix)]) if len(first) > len(prefix) else 0
+    high = ord(last[len(prefix)])
+
+    points = (low + (high - low) * i // parts for i in range(1, parts))
+
+    # Surrogates can't be encoded as UTF-8 by themselves, use the first code point above them...
+    points = sorted(set(0xe000 if 0xd800 <= point <= 0xdfff else point for point in points))
+    return [prefix + u'%c' % point for point in points if low < point <= high]
+
+def find_boundaries(kt, parts, db=0):
+    '''
+    Return up to "parts - 1" existing keys splitting a database into key ranges, or none if the
+    database isn't ordered by key. The first and last keys give evenly spaced split points, and
+    each one is replaced by the first key actually found at or after it, so that no range ends
+    up empty. This uses a cursor (HTTP protocol only).
+
+    '''
+
+    if parts < 2 or int(kt.status(db).get('type', 0)) not in ORDERED_DB_TYPES:
+        return []  # ...there are no key ranges to speak of.
+
+    with kt.cursor() as cursor:
+        if not cursor.jump_back(db=db):
+            return []
+
+        last = cursor.get_key()
+
+        if not cursor.jump(db=db):
+            return []
+
+        first = cursor.get_key()
+
+        boundaries = []
+        for point in split_key_range(first, last, parts):
+            if not cursor.jump(point, db=db):
+                break
+
+            key = cursor.get_key()
+            if key is not None and key > (boundaries[-1] if boundaries else first):
+                boundaries.append(key)
+
+    return boundaries
+
+
+class Partition(object):
+    '''A key range scanned by "ParallelScan", and how far the scan has gone.'''
+
+    def __init__(self, start=None, end=None, last=None, count=0, done=False):
+        self.start = start  # ...first key ("None" for the first record).
+        self.end = end  # ...excluded ("None" for past the last record).
+        self.last = last  # ...the key of the last record handed out.
+        self.count = count
+        self.done = done
+
+    def as_dict(self):
+        return {'start': self.start, 'end': self.end, 'last': self.last, 'count': self.count, 'done': self.done}
+
+
+class ParallelScan(object):
+    def __init__(self, pool, workers=4, partitions=None, db=0, batch_size=DEFAULT_SCAN_BATCH, script=None,
+                       with_expire=False, checkpoint=None):
+        '''
+        Initialize a scan over all records of a database, split into key ranges that are read
+        concurrently by up to "workers" threads, each on its own connection from "pool" (a
+        "KyotoTycoonPool"). Iterating over the scan yields records from all ranges as they
+        arrive, interleaved, as "(key, value)" pairs (or "(key, value, expire)" tuples with
+        "with_expire").
+
+        Ranges are split at the keys in "partitions" or, for databases ordered by key, found by
+        sampling (see "find_boundaries()"). Other databases are scanned as a single range.
+
+        Each range is read in batches of "batch_size" records, with the "script" procedure (see
+        "SCAN_SCRIPT") or, without one, with a cursor (HTTP protocol only).
+
+        The progress of each range is available from "progress()", and a scan can be resumed
+        where it was left off by passing a "checkpoint()" (e.g. saved as JSON) of an earlier one
+        as "checkpoint". A record counts as done once the caller asks for the next one, so after
+        resuming at most the last record handed out in each range may be seen twice. On databases
+        not ordered by key, the scan can't be resumed if that record was removed meanwhile (an
+        exception is raised).
+
+        '''
+
+        self.pool = pool
+        self.workers = workers
+        self.db = db
+        self.batch_size = batch_size
+        self.script = script
+        self.with_expire = with_expire
+
+        if checkpoint is not None:
+            self.partitions = [Partition(**partition) for partition in checkpoint['partitions']]
+        else:
+            if partitions is not None:
+                boundaries = sorted(partitions)
+            else:
+                with pool.connection() as kt:
+                    boundaries = find_boundaries(kt, workers, db)
+
+            self.partitions = [Partition(start, end) for start, end in zip([None] + boundaries, boundaries + [None])]
+
+    def __iter__(self):
+        pending = [partition for partition in self.partitions if not partition.done]
+        if not pending:
+            return
+
+        # Holds finished batches, as "(partition, batch, error)" with "batch=None" when a worker is done...
+        results = Queue(2 * self.workers)
+        stopped = threading.Event()
+
+        workers = ThreadPool(min(self.workers, len(pending)))
+        for partition in pending:
+            workers.apply_async(self._scan_partition, (partition, results, stopped))
+
+        running = len(pending)
+
+        try:
+            while running:
+                partition, batch, error = results.get()
+
+                if batch is None:
+                    running -= 1
+
+                    if error is not None:
+                        raise error
+
+                    partition.done = True
+                    continue
+
+                for record in batch:
+                    yield record
+
+                    partition.last = record[0]
+                    partition.count += 1
+        finally:
+            stopped.set()
+
+            while running:  # ...let workers finish their current batch.
+                if results.get()[1] is None:
+                    running -= 1
+
+            workers.terminate()
+
+    def ranges(self):
+        '''Return the "(start, end)" key ranges scanned, "None" meaning the first/last record.'''
+
+        return [(partition.start, partition.end) for partition in self.partitions]
+
+    def progress(self):
+        '''Return the state of each key range, as a list of dictionaries.'''
+
+        return [partition.as_dict() for partition in self.partitions]
+
+    def checkpoint(self):
+        '''Return the state of the scan, to resume it later (see "__init__()").'''
+
+        return {'db': self.db, 'partitions': self.progress()}
+
+    def _scan_partition(self, partition, results, stopped):
+        error = None
+
+        try:
+            if not stopped.is_set():
+                with self.pool.connection() as kt:
+                    self._read_partition(kt, partition, results, stopped)
+        except BaseException as e:
+            error = e
+
+        results.put((partition, None, error))
+
+    def _read_partition(self, kt, partition, results, stopped):
+        resume = partition.last  # ...already handed out.
+        start = partition.start if resume is None else resume
+
+        batches = record_batches(kt, start, self.batch_size, self.db, self.script, self.with_expire)
+        found = resume is None
+
+        try:
+            for batch in batches:
+                found = True
+
+                if resume is not None:
+                    if batch[0][0] == resume:
+                        batch = batch[1:]
+
+                    resume = None
+
+                records = [record for record in batch if partition.end is None or record[0] < partition.end]
+                if records:
+                    results.put((partition, records, None))
+
+                if len(records) < len(batch) or stopped.is_set():
+                    break
+        finally:
+            batches.close()
+
+        # Jumping to a removed record only fails (instead of landing past it) when not ordered...
+        if not found and int(kt.status(self.db).get('type', 0)) not in ORDERED_DB_TYPES:
+            raise KyotoTycoonException('cannot resume scan, record "%s" no longer exists' % resume)
+
+# EOF - kt_scan.py
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import struct
+
+from bisect import bisect
+from collections import OrderedDict
+from hashlib import md5
+from multiprocessing.pool import ThreadPool
+
+from .kt_pool import KyotoTycoonPool
+from .kt_common import KT_PACKER_PICKLE, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES, \
+                       chunked, \
+                       key_size
+
+# Points on the hash ring for each node (multiplied by its weight), by default...
+DEFAULT_VNODES = 160
+
+# Operations on a single record, sent to the node holding that record...
+_KEYED_METHODS = frozenset(['set', 'add', 'replace', 'append', 'increment', 'increment_double', 'cas',
+                            'remove', 'get', 'get_with_expire', 'check', 'seize', 'get_int'])
+
+def _hash(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    return md5(data).digest()
+
+
+def parse_node(node):
+    '''Return the "(name, host, port, weight)" for a "host:port" string or a "(host, port[, weight])" tuple.'''
+
+    if isinstance(node, str):
+        host, port = node.rsplit(':', 1)
+        node = (host, int(port))
+
+    host, port, weight = tuple(node) + (1,) * (3 - len(node))
+    return '%s:%d' % (host, port), host, port, weight
+
+
+class HashRing(object):
+    def __init__(self, weights, vnodes=DEFAULT_VNODES):
+        '''
+        Initialize a consistent hash ring over the nodes in "weights" (a dictionary of node
+        names and integer weights). Each node is given "vnodes * weight" points on the ring,
+        so adding or removing a node only moves the keys between it and its neighbours.
+
+        '''
+
+        if not weights:
+            raise ValueError('at least one node is required')
+
+        points = []
+        for node, weight in weights.items():
+            if weight < 1:
+                raise ValueError('node weights must be positive integers')
+
+            # Each digest gives four points on the ring (as with "ketama")...
+            for i in range((vnodes * weight + 3) // 4):
+                digest = _hash('%s-%d' % (node, i))
+                points.extend((point, node) for point in struct.unpack('<4I', digest))
+
+        points.sort()
+
+        self.points = [point for point, node in points]
+        self.nodes = [node for point, node in points]
+
+    def node(self, key):
+        '''Return the name of the node responsible for "key".'''
+
+        point = struct.unpack('<I', _hash(key)[:4])[0]
+        return self.nodes[bisect(self.points, point) % len(self.points)]
+
+    def split(self, keys, key=None):
+        '''Group items (keys by default, or anything "key" can extract one from) by node.'''
+
+        groups = OrderedDict()
+        for item in keys:
+            groups.setdefault(self.node(item if key is None else key(item)), []).append(item)
+
+        return groups
+
+
+class ShardedKyotoTycoon(object):
+    def __init__(self, nodes, binary=False, pack_type=KT_PACKER_PICKLE, custom_packer=None,
+                       timeout=30, vnodes=DEFAULT_VNODES, pool_size=8, workers=None, hybrid=False):
+        '''
+        Initialize a client for records spread over several KT servers, given as a list of
+        "host:port" strings or "(host, port)" or "(host, port, weight)" tuples.
+
+        Keys are assigned to servers by consistent hashing (see "HashRing"), and each server
+        is accessed through its own "KyotoTycoonPool" (of at most "pool_size" connections, with
+        the same "binary", "hybrid" and packing options). Bulk operations are split by server
+        and sent in parallel (from up to "workers" threads), merging their results. Operations
+        not tied to a key (e.g. "count()" or "match_prefix()") are sent to all servers.
+
+        Note: With "atomic", bulk operations are atomic on each server, not as a whole. Cursors,
+              pipelines and scripts are only available on a single server, see "shard()".
+
+        '''
+
+        weights = OrderedDict()
+        addresses = {}
+
+        for node in nodes:
+            name, host, port, weight = parse_node(node)
+            weights[name] = weight
+            addresses[name] = (host, port)
+
+        self.ring = HashRing(weights, vnodes)
+        self.atomic = not (binary or hybrid)
+
+        self.shards = OrderedDict()
+        try:
+            for name, (host, port) in addresses.items():
+                self.shards[name] = KyotoTycoonPool(binary, pack_type, custom_packer, host, port, timeout,
+                                                    min_size=0, max_size=pool_size, hybrid=hybrid)
+        except Exception:
+            self.close()
+            raise
+
+        self.workers = ThreadPool(workers or len(self.shards))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        if name not in _KEYED_METHODS:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+        def keyed_call(key, *args, **kwargs):
+            return getattr(self.shard(key), name)(key, *args, **kwargs)
+
+        keyed_call.__name__ = name
+        return keyed_call
+
+    def shard(self, key):
+        '''Return the connection pool for the server holding "key".'''
+
+        return self.shards[self.ring.node(key)]
+
+    def close(self):
+        '''Close the connections to all servers.'''
+
+        for pool in self.shards.values():
+            pool.close()
+
+        if hasattr(self, 'workers'):
+            self.workers.terminate()
+
+        return True
+
+    def stats(self):
+        '''Return the connection pool metrics for each server.'''
+
+        return dict((name, pool.stats()) for name, pool in self.shards.items())
+
+    def echo(self):
+        '''Test the connection to all servers.'''
+
+        return all(self._all('echo'))
+
+    def report(self):
+        '''Get a server information report for each server, by name.'''
+
+        return dict(zip(self.shards.keys(), self._all('report')))
+
+    def status(self, db=0):
+        '''Get status information for the database on each server, by name.'''
+
+        return dict(zip(self.shards.keys(), self._all('status', db)))
+
+    def clear(self, db=0):
+        '''Remove all records in the database, on all servers.'''
+
+        return all(self._all('clear', db))
+
+    def count(self, db=0):
+        '''Number of records in the database, over all servers.'''
+
+        return sum(self._all('count', db))
+
+    def size(self, db=0):
+        '''Current database size (in bytes), over all servers.'''
+
+        return sum(self._all('size', db))
+
+    def vacuum(self, db=0):
+        '''Scan the database on all servers and eliminate regions of expired records.'''
+
+        return all(self._all('vacuum', db))
+
+    def set_bulk(self, kv_dict, expire=None, atomic=None, db=0, noreply=False):
+        '''Set the values for several records at once (see "KyotoTycoon.set_bulk()").'''
+
+        calls = [(node, 'set_bulk', (dict((key, kv_dict[key]) for key in keys), expire,
+                                     self._atomic(atomic), db, noreply))
+                 for node, keys in self.ring.split(kv_dict).items()]
+
+        return self._sum(self._run(calls), noreply)
+
+    def remove_bulk(self, keys, atomic=None, db=0, noreply=False):
+        '''Remove several records at once (see "KyotoTycoon.set_bulk()" for the meaning of "noreply").'''
+
+        calls = [(node, 'remove_bulk', (node_keys, self._atomic(atomic), db, noreply))
+                 for node, node_keys in self.ring.split(keys).items()]
+
+        return self._sum(self._run(calls), noreply)
+
+    def get_bulk(self, keys, atomic=None, db=0):
+        '''Retrieve the values for several records at once.'''
+
+        calls = [(node, 'get_bulk', (node_keys, self._atomic(atomic), db))
+                 for node, node_keys in self.ring.split(keys).items()]
+
+        results = {}
+        for values in self._run(calls):
+            results.update(values)
+
+        return results
+
+    def set_bulk_records(self, records, atomic=None, noreply=False):
+        '''Set several records at once, given as "(db, key, value, expire)" tuples (binary protocol only).'''
+
+        calls = [(node, 'set_bulk_records', (node_records, self._atomic(atomic), noreply))
+                 for node, node_records in self.ring.split(records, lambda record: record[1]).items()]
+
+        return self._sum(self._run(calls), noreply)
+
+    def remove_bulk_records(self, records, atomic=None, noreply=False):
+        '''Remove several records at once, given as "(db, key)" tuples (binary protocol only).'''
+
+        calls = [(node, 'remove_bulk_records', (node_records, self._atomic(atomic), noreply))
+                 for node, node_records in self.ring.split(records, lambda record: record[1]).items()]
+
+        return self._sum(self._run(calls), noreply)
+
+    def get_bulk_records(self, records, atomic=None):
+        '''Retrieve several records at once, given as "(db, key)" tuples (binary protocol only).'''
+
+        calls = [(node, 'get_bulk_records', (node_records, self._atomic(atomic)))
+                 for node, node_records in self.ring.split(records, lambda record: record[1]).items()]
+
+        return [record for node_records in self._run(calls) for record in node_records]
+
+    def iter_get_bulk(self, keys, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES):
+        '''
+        Retrieve the values for any number of records, yielding "(key, value)" pairs as they arrive.
+
+        The keys are split into chunks (see "KyotoTycoon.iter_get_bulk()"), and each chunk into
+        parallel requests, one for each server involved.
+
+        '''
+
+        for chunk in chunked(keys, chunk_keys, chunk_bytes):
+            for item in self.get_bulk(chunk, atomic, db).items():
+                yield item
+
+    def iter_set_bulk(self, kv_items, expire=None, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS,
+                            chunk_bytes=KT_CHUNK_BYTES):
+        '''
+        Set the values for any number of records (a dictionary or an iterable of "(key, value)" pairs),
+        yielding the number of records set for each chunk (only keys count towards "chunk_bytes").
+
+        '''
+
+        if isinstance(kv_items, dict):
+            kv_items = kv_items.items()
+
+        for chunk in chunked(kv_items, chunk_keys, chunk_bytes, lambda kv: key_size(kv[0])):
+            yield self.set_bulk(dict(chunk), expire, atomic, db)
+
+    def iter_remove_bulk(self, keys, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES):
+        '''Remove any number of records, yielding the number of records removed for each chunk.'''
+
+        for chunk in chunked(keys, chunk_keys, chunk_bytes):
+            yield self.remove_bulk(chunk, atomic, db)
+
+    def match_prefix(self, prefix, limit=None, db=0):
+        '''Get keys matching a prefix string, from all servers.'''
+
+        return self._merge_sorted(self._all('match_prefix', prefix, limit, db), limit)
+
+    def match_regex(self, regex, limit=None, db=0):
+        '''Get keys matching a ragular expression string, from all servers.'''
+
+        return self._merge_sorted(self._all('match_regex', regex, limit, db), limit)
+
+    def match_similar(self, origin, distance=0, limit=None, db=0):
+        '''Get keys similar to the origin string, from all servers (in no particular order).'''
+
+        keys = [key for node_keys in self._all('match_similar', origin, distance, limit, db) for key in node_keys]
+        return keys[:limit] if limit else keys
+
+    def _atomic(self, atomic):
+        return self.atomic if atomic is None else atomic
+
+    def _all(self, name, *args):
+        return self._run([(node, name, args) for node in self.shards])
+
+    def _run(self, calls):
+        '''Make "(node, method, args)" calls, in parallel, returning their results in order.'''
+
+        if len(calls) < 2:  # ...no need for other threads.
+            return [getattr(self.shards[node], name)(*args) for node, name, args in calls]
+
+        return self.workers.map(lambda call: getattr(self.shards[call[0]], call[1])(*call[2]), calls)
+
+    def _sum(self, counts, noreply):
+        return None if noreply else sum(counts)
+
+    def _merge_sorted(self, node_keys, limit):
+        keys = sorted(key for keys in node_keys for key in keys)
+        return keys[:limit] if limit else keys
+
+# EOF - kt_sharded.py
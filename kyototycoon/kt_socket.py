@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+# Receive buffer size, enough to hold many small records at once...
+DEFAULT_BUFFER_SIZE = 65536
+
+class BufferedReader(object):
+    '''
+    Read fields from a socket through a reusable receive buffer.
+
+    Data is received with "recv_into()" straight into a preallocated buffer, so reading a record
+    made of several small fields costs (at most) one system call instead of one per field. Fixed
+    size headers are parsed in place with "struct.unpack_from()", and variable size fields are
+    copied out of the buffer exactly once.
+
+    '''
+
+    def __init__(self, sock, bufsize=DEFAULT_BUFFER_SIZE):
+        self.socket = sock
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+
+        self.start = 0  # ...first unread byte.
+        self.end = 0  # ...one past the last received byte.
+
+    def read(self, bytecnt):
+        '''Return the next "bytecnt" bytes from the socket.'''
+
+        if bytecnt > len(self.buffer):
+            return self._read_large(bytecnt)
+
+        self._fill(bytecnt)
+
+        data = self.view[self.start:self.start + bytecnt].tobytes()
+        self.start += bytecnt
+
+        return data
+
+    def unpack(self, fmt):
+        '''Parse the next "fmt.size" bytes from the socket with the "struct.Struct" object "fmt".'''
+
+        self._fill(fmt.size)
+
+        values = fmt.unpack_from(self.buffer, self.start)
+        self.start += fmt.size
+
+        return values
+
+    def readline(self):
+        '''Return the next line from the socket, including its "\\n" (lines must fit the buffer).'''
+
+        searched = 0  # ...bytes already known not to contain a newline.
+        while True:
+            newline = self.buffer.find(b'\n', self.start + searched, self.end)
+            if newline >= 0:
+                break
+
+            searched = self.end - self.start
+            if searched >= len(self.buffer):
+                raise IOError('line too long')
+
+            self._fill(searched + 1)  # ...may move the unread bytes, hence the relative offset.
+
+        line = self.view[self.start:newline + 1].tobytes()
+        self.start = newline + 1
+
+        return line
+
+    def recv(self, bytecnt):
+        '''Return up to "bytecnt" bytes, waiting only if none are buffered ("b''" at the end of the stream).'''
+
+        if self.start == self.end:
+            return self.socket.recv(bytecnt)
+
+        data = self.view[self.start:min(self.end, self.start + bytecnt)].tobytes()
+        self.start += len(data)
+
+        return data
+
+    def _fill(self, bytecnt):
+        '''Make sure at least "bytecnt" (no larger than the buffer) bytes are buffered.'''
+
+        available = self.end - self.start
+        if available >= bytecnt:
+            return
+
+        if self.start + bytecnt > len(self.buffer):
+            # Move the unread bytes to the beginning of the buffer to make room...
+            self.buffer[:available] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = available
+
+        while self.end - self.start < bytecnt:
+            recv = self.socket.recv_into(self.view[self.end:])
+            if not recv:
+                raise IOError('no data while reading')
+
+            self.end += recv
+
+    def _read_large(self, bytecnt):
+        '''Read a field that doesn't fit the buffer directly into its own storage.'''
+
+        data = bytearray(bytecnt)
+        data_view = memoryview(data)
+
+        available = self.end - self.start
+        data_view[:available] = self.view[self.start:self.end]
+        self.start = self.end = 0
+
+        read = available
+        while read < bytecnt:
+            recv = self.socket.recv_into(data_view[read:])
+            if not recv:
+                raise IOError('no data while reading')
+
+            read += recv
+
+        return bytes(data)
+
+# EOF - kt_socket.py
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+
+import threading
+import time
+
+from collections import OrderedDict
+
+# Maximum number of records waiting to be written, by default...
+DEFAULT_BUFFER_ITEMS = 1000
+
+# Marks a record waiting to be removed (instead of set)...
+_REMOVED = object()
+
+class WriteBehind(object):
+    def __init__(self, kt, max_items=DEFAULT_BUFFER_ITEMS, max_age=1.0, noreply=False, on_error=None):
+        '''
+        Initialize a write-behind buffer for "set()" and "remove()" calls on "kt".
+
+        Writes are buffered and sent to the server together through the bulk operations, once
+        "max_items" records are waiting, or the oldest write has been waiting for "max_age"
+        seconds (from a background thread, unless "None"), or on "flush()". Repeated writes to
+        the same record are coalesced, so that only the latest one is sent.
+
+        Failed writes are dropped, with "on_error(exception, records)" being called for them if
+        specified, where "records" is a list of "(db, key)" pairs. With "noreply" (binary protocol
+        only) the server isn't asked to reply, so write failures can't be noticed.
+
+        Note: Buffered writes must be flushed before discarding this object, which also stops
+              the background thread, with "close()" (or use it in a "with" statement). Both
+              the background thread and callers use "kt", but never at the same time. It must
+              not be used for anything else concurrently (unless it's a pool).
+
+        '''
+
+        if max_items < 1:
+            raise ValueError('the buffer must hold at least one record')
+
+        self.kt = kt
+        self.max_items = max_items
+        self.max_age = max_age
+        self.noreply = noreply
+        self.on_error = on_error
+
+        self.pending = OrderedDict()  # ...by "(db, key)".
+        self.flushing = {}  # ...records being written right now.
+        self.first_write = None
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.wakeup = threading.Event()  # ...set on the first write after a flush.
+
+        # Whether the record-level bulk operations are supported (binary protocol)...
+        self.records_supported = True
+
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.last_error = None
+
+        self.thread = None
+        if max_age is not None:
+            self.thread = threading.Thread(target=self._run, name='WriteBehind')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def set(self, key, value, expire=None, db=0):
+        '''Set the value for a record (eventually).'''
+
+        # Expiration is made absolute, as the record may only be written later...
+        expire = None if expire is None else -(int(time.time()) + expire)
+        self._buffer(key, db, (value, expire))
+
+    def remove(self, key, db=0):
+        '''Remove a record (eventually).'''
+
+        self._buffer(key, db, _REMOVED)
+
+    def get(self, key, db=0):
+        '''Retrieve the value for a record, taking into account any writes not yet sent.'''
+
+        with self.lock:
+            write = self.pending.get((db, key), self.flushing.get((db, key)))
+
+        if write is None:
+            with self.flush_lock:
+                return self.kt.get(key, db=db)
+
+        return None if write is _REMOVED else write[0]
+
+    def flush(self):
+        '''Send all buffered writes, returning "False" if any of them had to be dropped.'''
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, OrderedDict()
+                self.flushing = batch
+                self.first_write = None
+
+            try:
+                return self._write(batch) if batch else True
+            finally:
+                with self.lock:
+                    self.flushing = {}
+
+    def close(self):
+        '''Stop the background thread and send all buffered writes.'''
+
+        self.closed.set()
+        self.wakeup.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        return self.flush()
+
+    def stats(self):
+        '''Return counters for buffered, coalesced, flushed and dropped writes.'''
+
+        with self.lock:
+            return {'pending': len(self.pending), 'writes': self.writes, 'coalesced': self.coalesced,
+                    'flushes': self.flushes, 'flushed': self.flushed, 'dropped': self.dropped}
+
+    def _buffer(self, key, db, write):
+        now = time.time()
+
+        with self.lock:
+            self.writes += 1
+
+            if self.pending.pop((db, key), None) is not None:
+                self.coalesced += 1
+
+            self.pending[(db, key)] = write
+
+            if self.first_write is None:
+                self.first_write = now
+                self.wakeup.set()
+
+            due = (len(self.pending) >= self.max_items or
+                   (self.max_age is not None and now - self.first_write >= self.max_age))
+
+        if due:
+            self.flush()
+
+    def _run(self):
+        while not self.closed.is_set():
+            with self.lock:
+                first_write = self.first_write
+
+            if first_write is None:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            delay = first_write + self.max_age - time.time()
+            if delay > 0:
+                self.closed.wait(delay)
+                continue
+
+            self.flush()
+
+    def _write(self, batch):
+        sets = [(db, key, write[0], write[1]) for (db, key), write in batch.items() if write is not _REMOVED]
+        removes = [(db, key) for (db, key), write in batch.items() if write is _REMOVED]
+
+        if self.records_supported:
+            try:
+                sets_ok = not sets or self._call(sets, self.kt.set_bulk_records, sets, False, self.noreply)
+                removes_ok = not removes or self._call(removes, self.kt.remove_bulk_records, removes, False,
+                                                       self.noreply)
+                return sets_ok and removes_ok
+            except NotImplementedError:
+                self.records_supported = False
+
+        # The plain bulk operations take a single database (and expiration) for all records, and
+        # without the record-level operations there's no "noreply" support (HTTP protocol)...
+        ok = True
+
+        set_groups = OrderedDict()
+        for db, key, value, expire in sets:
+            set_groups.setdefault((db, expire), {})[key] = value
+
+        for (db, expire), kv_dict in set_groups.items():
+            records = [(db, key) for key in kv_dict]
+            ok = self._call(records, self.kt.set_bulk, kv_dict, expire, False, db) and ok
+
+        remove_groups = OrderedDict()
+        for db, key in removes:
+            remove_groups.setdefault(db, []).append(key)
+
+        for db, keys in remove_groups.items():
+            records = [(db, key) for key in keys]
+            ok = self._call(records, self.kt.remove_bulk, keys, False, db) and ok
+
+        return ok
+
+    def _call(self, records, function, *args):
+        try:
+            function(*args)
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            with self.lock:
+                self.dropped += len(records)
+                self.last_error = e
+
+            if self.on_error is not None:
+                self.on_error(e, [(record[0], record[1]) for record in records])
+
+            return False
+
+        with self.lock:
+            self.flushes += 1
+            self.flushed += len(records)
+
+        return True
+
+# EOF - kt_writebehind.py
@@ -11,6 +11,7 @@ import struct
 import time
 
 from .kt_error import KyotoTycoonException
+from .kt_socket import BufferedReader
 
 MB_REPL = 0xb1
 MB_SYNC = 0xb0
@@ -19,6 +20,11 @@ OP_SET = 0xa1
 OP_REMOVE = 0xa2
 OP_CLEAR = 0xa5
 
+# Precompiled log fields...
+_MAGIC = struct.Struct('!B')
+_ENTRY_HEADER = struct.Struct('!BQ')
+_ENTRY_SIZE = struct.Struct('!I')
+
 def _read_varnum(data):
     value = 0
 
@@ -67,35 +73,56 @@ class KyotoSlave(object):
         self.port = port
         self.timeout = timeout
 
-    def consume(self, timestamp=None):
-        '''Yield all available transaction log entries starting at "timestamp".'''
+        # Timestamp (in seconds) of the latest log position seen from the master...
+        self.last_ts = None
+
+    def consume(self, timestamp=None, heartbeats=False):
+        '''
+        Yield all available transaction log entries starting at "timestamp".
+
+        Each entry carries its log timestamp in "ts" (seconds since the epoch), which can be
+        used as the "timestamp" to resume from later. While waiting for new entries, the
+        master periodically reports its current position, and the latest one seen from
+        either source is kept in "last_ts". With "heartbeats", "None" is also yielded for
+        each of these reports, giving the caller a chance to act while no entries arrive.
+
+        '''
 
         self.socket = socket.create_connection((self.host, self.port), self.timeout)
+        self.reader = BufferedReader(self.socket)
 
         start_ts = int(time.time() if timestamp is None else timestamp) * 10**9
 
         # Ask the server for all available transaction log entries since "start_ts"...
         self._write(struct.pack('!BIQH', MB_REPL, 0x00, start_ts, self.sid))
 
-        magic, = struct.unpack('B', self._read(1))
+        magic, = self.reader.unpack(_MAGIC)
         if magic != MB_REPL:
             raise KyotoTycoonException('bad response [%s]' % hex(magic))
 
+        self.last_ts = start_ts / 10.0**9
+
         while True:
-            magic, ts = struct.unpack('!BQ', self._read(9))
+            magic, ts = self.reader.unpack(_ENTRY_HEADER)
             if magic == MB_SYNC:  # ...the head of the transaction log has been reached.
+                self.last_ts = ts / 10.0**9
                 self._write(struct.pack('B', MB_REPL))
+
+                if heartbeats:
+                    yield None
+
                 continue
 
             if magic != MB_REPL:
                 raise KyotoTycoonException('bad response [%s]' % hex(magic))
 
-            log_size, = struct.unpack('!I', self._read(4))
+            log_size, = self.reader.unpack(_ENTRY_SIZE)
             entry = _decode_log_entry(self._read(log_size))
 
             if entry['sid'] == self.sid:  # ...this must never happen!
-                raise KyotoTycoonException('bad log entry [sid=%d]' % sid)
+                raise KyotoTycoonException('bad log entry [sid=%d]' % self.sid)
 
+            entry['ts'] = self.last_ts = ts / 10.0**9
             yield entry
 
     def close(self):
@@ -107,16 +134,6 @@ class KyotoSlave(object):
         self.socket.sendall(data)
 
     def _read(self, bytecnt):
-        buf = []
-        read = 0
-        while read < bytecnt:
-            recv = self.socket.recv(bytecnt - read)
-            if not recv:
-                raise IOError('no data while reading')
-
-            buf.append(recv)
-            read += len(recv)
-
-        return b''.join(buf)
+        return self.reader.read(bytecnt)
 
 # EOF - kyotoslave.py
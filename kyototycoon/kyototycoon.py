@@ -12,15 +12,37 @@ import warnings
 
 from . import kt_http
 from . import kt_binary
+from . import kt_hybrid
+from . import kt_cache
+from . import kt_coalesce
+from . import kt_scan
 
-from .kt_common import KT_PACKER_PICKLE
+from .kt_common import KT_PACKER_PICKLE, \
+                       KT_CHUNK_KEYS, \
+                       KT_CHUNK_BYTES
 
 class KyotoTycoon(object):
     def __init__(self, binary=False, pack_type=KT_PACKER_PICKLE,
-                       custom_packer=None, exceptions=True):
+                       custom_packer=None, exceptions=True, hybrid=False, cache=None,
+                       coalesce=None):
         '''
         Initialize a "Binary Protocol" or "HTTP Protocol" KyotoTycoon object.
 
+        With "hybrid" both a binary and an HTTP connection are kept, and each operation uses the
+        faster protocol that supports it: get/set/remove (plain and bulk), pipelines and scripts
+        go over the binary protocol, everything else over HTTP. Bulk operations are non-atomic by
+        default (as with the binary protocol), and go over HTTP when "atomic=True" is given.
+
+        With "cache" (a "kt_cache.LocalCache" object) reads are served from an in-process cache
+        when possible, and writes made through this object invalidate the records they touch.
+        Writes made through pipelines, cursors, scripts or other clients are not seen by the
+        cache, so give it a "ttl" if that matters. Cached values are shared, don't modify them.
+
+        With "coalesce" (a "kt_coalesce.SingleFlight" object, or "True" for a new one) identical
+        concurrent reads (get, get_int and match_*) share a single request and result. This is
+        only useful when the object is shared between threads (with a lock), or when several
+        objects (e.g. those in a pool) share the same "SingleFlight" object.
+
         Note: The default packer uses pickle protocol v2, which is the highest
               version that's still compatible with both Python 2 and 3. If you
               require a different version, specify a custom packer object.
@@ -31,13 +53,24 @@ class KyotoTycoon(object):
             # Relying on separate error states is bad form and should be avoided...
             raise DeprecationWarning('not raising exceptions on error has been removed')
 
-        if binary:
+        if hybrid:
+            self.atomic = False  # ...keeping bulk operations on the binary protocol.
+            self.core = kt_hybrid.ProtocolHandler(pack_type, custom_packer)
+        elif binary:
             self.atomic = False  # The binary protocol does not support atomic operations.
             self.core = kt_binary.ProtocolHandler(pack_type, custom_packer)
         else:
             self.atomic = True
             self.core = kt_http.ProtocolHandler(pack_type, custom_packer)
 
+        self.coalesce = kt_coalesce.SingleFlight() if coalesce is True else coalesce
+        if self.coalesce is not None:
+            self.core = kt_coalesce.ProtocolHandler(self.core, self.coalesce)
+
+        self.cache = cache
+        if cache is not None:
+            self.core = kt_cache.ProtocolHandler(self.core, cache)
+
     def __enter__(self):
         return self
 
@@ -65,6 +98,11 @@ class KyotoTycoon(object):
 
         return self.core.close()
 
+    def echo(self):
+        '''Check that the server is alive and responding.'''
+
+        return self.core.echo()
+
     def report(self):
         '''Get a server information report.'''
 
@@ -135,6 +173,11 @@ class KyotoTycoon(object):
 
         return self.core.get(key, db)
 
+    def get_with_expire(self, key, db=0):
+        '''Retrieve the value for a record, along with its expiration time (epoch seconds or "None").'''
+
+        return self.core.get_with_expire(key, db)
+
     def check(self, key, db=0):
         '''Check that a record exists in the database.'''
 
@@ -150,21 +193,91 @@ class KyotoTycoon(object):
 
         return self.core.get_int(key, db)
 
-    def set_bulk(self, kv_dict, expire=None, atomic=None, db=0):
-        '''Set the values for several records at once.'''
+    def set_bulk(self, kv_dict, expire=None, atomic=None, db=0, noreply=False):
+        '''
+        Set the values for several records at once.
+
+        With "noreply" (binary protocol only) the server is asked not to send a reply, and
+        "None" is returned immediately instead of the number of records set. Any errors are
+        silently ignored in this case.
 
-        return self.core.set_bulk(kv_dict, expire, self.atomic if atomic is None else atomic, db)
+        '''
 
-    def remove_bulk(self, keys, atomic=None, db=0):
-        '''Remove several records at once.'''
+        return self.core.set_bulk(kv_dict, expire, self.atomic if atomic is None else atomic, db, noreply)
 
-        return self.core.remove_bulk(keys, self.atomic if atomic is None else atomic, db)
+    def remove_bulk(self, keys, atomic=None, db=0, noreply=False):
+        '''Remove several records at once (see "set_bulk()" for the meaning of "noreply").'''
+
+        return self.core.remove_bulk(keys, self.atomic if atomic is None else atomic, db, noreply)
 
     def get_bulk(self, keys, atomic=None, db=0):
         '''Retrieve the values for several records at once.'''
 
         return self.core.get_bulk(keys, self.atomic if atomic is None else atomic, db)
 
+    def set_bulk_records(self, records, atomic=None, noreply=False):
+        '''
+        Set several records at once, given as "(db, key, value, expire)" tuples (binary protocol only).
+
+        Unlike "set_bulk()", each record carries its own database and expiration time (or "None"),
+        so records for several databases and with mixed expiration times take a single request.
+
+        '''
+
+        return self.core.set_bulk_records(records, self.atomic if atomic is None else atomic, noreply)
+
+    def remove_bulk_records(self, records, atomic=None, noreply=False):
+        '''Remove several records at once, given as "(db, key)" tuples (binary protocol only).'''
+
+        return self.core.remove_bulk_records(records, self.atomic if atomic is None else atomic, noreply)
+
+    def get_bulk_records(self, records, atomic=None):
+        '''
+        Retrieve several records at once, given as "(db, key)" tuples (binary protocol only).
+
+        Returns a list of "(db, key, value, expire)" tuples for the records that exist, where
+        "expire" is the absolute expiration time (in seconds since the epoch) or "None".
+
+        '''
+
+        return self.core.get_bulk_records(records, self.atomic if atomic is None else atomic)
+
+    def iter_get_bulk(self, keys, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES):
+        '''
+        Retrieve the values for any number of records, yielding "(key, value)" pairs as they arrive.
+
+        The keys (any iterable) are split into requests of at most "chunk_keys" keys and roughly
+        "chunk_bytes" bytes, so memory usage and server load per request stay bounded. With the
+        binary protocol a couple of requests are kept in flight to hide the network latency.
+
+        Note: When "atomic" is used, each request is atomic on its own, not the whole operation.
+
+        '''
+
+        return self.core.iter_get_bulk(keys, self.atomic if atomic is None else atomic, db,
+                                       chunk_keys, chunk_bytes)
+
+    def iter_set_bulk(self, kv_items, expire=None, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS,
+                            chunk_bytes=KT_CHUNK_BYTES):
+        '''
+        Set the values for any number of records (a dictionary or an iterable of "(key, value)" pairs),
+        yielding the number of records set by each of the requests it's split into.
+
+        '''
+
+        return self.core.iter_set_bulk(kv_items, expire, self.atomic if atomic is None else atomic, db,
+                                       chunk_keys, chunk_bytes)
+
+    def iter_remove_bulk(self, keys, atomic=None, db=0, chunk_keys=KT_CHUNK_KEYS, chunk_bytes=KT_CHUNK_BYTES):
+        '''
+        Remove any number of records, yielding the number of records removed by each of the
+        requests it's split into.
+
+        '''
+
+        return self.core.iter_remove_bulk(keys, self.atomic if atomic is None else atomic, db,
+                                          chunk_keys, chunk_bytes)
+
     def vacuum(self, db=0):
         '''Scan the database and eliminate regions of expired records.'''
 
@@ -185,20 +298,87 @@ class KyotoTycoon(object):
 
         return self.core.match_similar(origin, distance, limit, db)
 
+    def iter_match_prefix(self, prefix, limit=None, db=0, page_size=kt_scan.DEFAULT_MATCH_PAGE, script=None):
+        '''
+        Yield keys matching a prefix string, without holding them all in memory at once.
+
+        With "script" (the name given on the server to the procedure in "kt_scan.MATCH_SCRIPT")
+        keys are fetched "page_size" at a time, with either protocol, and each request examines
+        a bounded number of records. Otherwise they're read with a cursor (HTTP protocol only),
+        taking a request per key. The same goes for "iter_match_regex()" and "iter_match_similar()".
+
+        '''
+
+        return kt_scan.match_keys(self, 'prefix', prefix, None, limit, page_size, db, script)
+
+    def iter_match_regex(self, regex, limit=None, db=0, page_size=kt_scan.DEFAULT_MATCH_PAGE, script=None):
+        '''Yield keys matching a regular expression string (see "iter_match_prefix()").'''
+
+        return kt_scan.match_keys(self, 'regex', regex, None, limit, page_size, db, script)
+
+    def iter_match_similar(self, origin, distance=0, limit=None, db=0, page_size=kt_scan.DEFAULT_MATCH_PAGE,
+                                 script=None):
+        '''Yield keys similar to the origin string (see "iter_match_prefix()").'''
+
+        return kt_scan.match_keys(self, 'similar', origin, distance, limit, page_size, db, script)
+
     def cursor(self):
         '''Obtain a new (uninitialized) record cursor.'''
 
         return self.core.cursor()
 
-    def play_script(self, name, kv_dict=None):
+    def scan(self, key=None, batch_size=kt_scan.DEFAULT_SCAN_BATCH, db=0, script=None, prefetch=True,
+                   with_expire=False):
+        '''
+        Yield all (key,value) pairs starting at a record (first record if "None"), in forward scan
+        order, fetching "batch_size" records at a time. With "with_expire" (key,value,expire)
+        tuples are yielded instead, where "expire" is in seconds since the epoch (or "None").
+
+        With "script" (the name given on the server to the procedure in "kt_scan.SCAN_SCRIPT")
+        each batch takes a single request, with either protocol. Otherwise batches are read with
+        a cursor (HTTP protocol only), taking a request per record. With "prefetch" the next batch
+        is fetched in a background thread while the current one is being used, so this object
+        must not be used for anything else until the scan is done (or the generator is closed).
+
+        '''
+
+        batches = kt_scan.record_batches(self, key, batch_size, db, script, with_expire)
+
+        if prefetch:
+            batches = kt_scan.prefetched(batches)
+
+        try:
+            for batch in batches:
+                for record in batch:
+                    yield record
+        finally:
+            batches.close()
+
+    def pipeline(self, max_pending=64):
+        '''
+        Obtain a new request pipeline (binary protocol only).
+
+        Requests queued on the pipeline return "PendingReply" handles immediately and are sent
+        to the server together, with their replies read back in order. This avoids paying the
+        network round trip for every single request. At most "max_pending" requests are allowed
+        to remain unanswered at any time.
+
+        '''
+
+        return self.core.pipeline(max_pending)
+
+    def play_script(self, name, kv_dict=None, noreply=False):
         '''
         Call a procedure of the scripting language extension.
 
         Because the input/output of server-side scripts may use a mix of formats, and unlike all
         other methods, no implicit packing/unpacking is done to either input or output values.
 
+        With "noreply" (binary protocol only) the procedure's output is discarded by the server,
+        and "None" is returned immediately.
+
         '''
 
-        return self.core.play_script(name, kv_dict)
+        return self.core.play_script(name, kv_dict, noreply)
 
 # EOF - kyototycoon.py
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# kt_migrate.py - copy a database between servers, then catch up on writes.
+#
+# Copyright (c) 2015 Carlos Rodrigues <cefrodrigues@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+from __future__ import print_function
+from __future__ import division
+
+#from __future__ import unicode_literals
+
+
+import config
+
+import sys
+import os, os.path
+import json
+
+from time import time
+from getopt import getopt, GetoptError
+
+from kyototycoon import Migration
+
+
+def print_usage():
+    """Output the proper usage syntax for this program."""
+
+    print("USAGE: %s -s <host:port> -t <host:port> [--db=<n>] [--target-db=<n>] [--cursors=<n>]" % os.path.basename(sys.argv[0]))
+    print("       [--max-ops=<n>] [--max-mbytes=<n>] [--script=<name>] [--checkpoint=<file>] [--sid=<sid> [--follow]]")
+
+
+def parse_args():
+    """Parse and enforce command-line arguments."""
+
+    try:
+        options, _ = getopt(sys.argv[1:], "s:t:", ["db=", "target-db=", "cursors=", "max-ops=",
+                                                   "max-mbytes=", "script=", "checkpoint=", "sid=", "follow"])
+    except GetoptError as e:
+        print("error: %s." % e, file=sys.stderr)
+        print_usage()
+        sys.exit(1)
+
+    source = None
+    target = None
+    settings = { "db": 0, "target_db": None, "cursors": 4, "max_ops": None, "max_bytes": None, "script": None, "sid": None }
+    checkpoint_file = None
+    follow = False
+
+    for option, value in options:
+        if option in ("-s"):
+            source = value.strip()
+        elif option in ("-t"):
+            target = value.strip()
+        elif option in ("--db"):
+            settings["db"] = int(value)
+        elif option in ("--target-db"):
+            settings["target_db"] = int(value)
+        elif option in ("--cursors"):
+            settings["cursors"] = int(value)
+        elif option in ("--max-ops"):
+            settings["max_ops"] = int(value)
+        elif option in ("--max-mbytes"):
+            settings["max_bytes"] = int(float(value) * 1024 * 1024)
+        elif option in ("--script"):
+            settings["script"] = value.strip()
+        elif option in ("--checkpoint"):
+            checkpoint_file = value.strip()
+        elif option in ("--sid"):
+            settings["sid"] = int(value)
+        elif option in ("--follow"):
+            follow = True
+
+    if source is None or target is None:
+        print("error: source or target server missing.", file=sys.stderr)
+        print_usage()
+        sys.exit(1)
+
+    if follow and settings["sid"] is None:
+        print("error: following the source requires a slave SID.", file=sys.stderr)
+        print_usage()
+        sys.exit(1)
+
+    return (source, target, settings, checkpoint_file, follow)
+
+
+def main():
+    source, target, settings, checkpoint_file, follow = parse_args()
+
+    migration = Migration(source, target, **settings)
+    start = time()
+
+    checkpoint = None
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+
+    try:
+        try:
+            if checkpoint is not None:
+                print("Resuming copy of %d key range(s) from %s to %s..." % (len(checkpoint["partitions"]), source, target))
+            else:
+                print("Copying %d key range(s) from %s to %s..." % (len(migration.ranges()), source, target))
+
+            copied = migration.copy(checkpoint)
+            print("Copied %d records in %.1f seconds." % (copied, time() - start))
+        finally:
+            if checkpoint_file is not None and migration.checkpoint() is not None:
+                with open(checkpoint_file, "w") as f:
+                    json.dump(migration.checkpoint(), f)
+
+        if settings["sid"] is not None:
+            print("Replaying writes made since the copy started%s..." % (" (Control-C to stop)" if follow else ""))
+            replayed = migration.tail(start, None if follow else time())
+            print("Replayed %d writes." % replayed)
+
+    except KeyboardInterrupt:
+        print("Exiting on Control-C...")
+        migration.stop()
+
+    stats = migration.stats()
+    print("Total: %d records (%.1f MB) copied, %d writes replayed." % (stats["copied"], stats["copied_bytes"] / (1024 * 1024),
+                                                                       stats["replayed"]))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF - kt_migrate.py
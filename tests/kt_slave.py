@@ -88,7 +88,7 @@ def main():
 
     try:
         for entry in slave.consume(time()):
-            print("[%s] [SID=%s/DB=%d/OP=%s] %s" % (strftime("%Y-%m-%d %H:%M:%S", localtime(time())),
+            print("[%s] [SID=%s/DB=%d/OP=%s] %s" % (strftime("%Y-%m-%d %H:%M:%S", localtime(entry["ts"])),
                                                     entry["sid"], entry["db"], hex(entry["op"]),
                                                     op_name[entry["op"]]))
 
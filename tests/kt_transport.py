@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# kt_transport.py - compare the HTTP transports of the python-kyototycoon library.
+#
+# Copyright (c) 2014 Carlos Rodrigues <cefrodrigues@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+from __future__ import print_function
+from __future__ import division
+
+
+import config
+
+import sys
+import os, os.path
+
+from time import time
+from getopt import getopt, GetoptError
+
+from kyototycoon import kt_http
+from kyototycoon.kt_http_socket import HTTPConnection
+from kyototycoon import KT_PACKER_BYTES
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+
+NUM_ITERATIONS = 5000
+BULK_KEYS = 100
+
+
+def print_usage():
+    """Output the proper usage syntax for this program."""
+
+    print("USAGE: %s [-s <host:port>] [-n <iterations>]" % os.path.basename(sys.argv[0]))
+
+
+def parse_args():
+    """Parse and enforce command-line arguments."""
+
+    try:
+        options, _ = getopt(sys.argv[1:], "s:n:", ["server=", "iterations="])
+    except GetoptError as e:
+        print("error: %s." % e, file=sys.stderr)
+        print_usage()
+        sys.exit(1)
+
+    server = { "host": "127.0.0.1", "port": 1978 }
+    iterations = NUM_ITERATIONS
+
+    for option, value in options:
+        if option in ("-s", "--server"):
+            fields = value.strip().split(":")
+            server["host"] = fields[0].strip()
+
+            if len(fields) > 1:
+                server["port"] = int(fields[1])
+        elif option in ("-n", "--iterations"):
+            iterations = int(value)
+
+    return (server, iterations)
+
+
+def main():
+    server, iterations = parse_args()
+
+    keys = ["transport-%d" % i for i in range(BULK_KEYS)]
+    records = dict((key, b"value") for key in keys)
+
+    operations = (("echo()", lambda db: db.echo()),
+                  ("set()", lambda db: db.set(keys[0], b"value", None, 0)),
+                  ("get()", lambda db: db.get(keys[0], 0)),
+                  ("check()", lambda db: db.check(keys[0], 0)),
+                  ("get_bulk(%d)" % BULK_KEYS, lambda db: db.get_bulk(keys, True, 0)))
+
+    print("Running %d iterations for each operation..." % iterations)
+
+    header = "%-14s | %-10s | %-7s | %-14s | %-7s" % \
+             ("Operation", "Transport", "Elapsed", "Iteration Rate", "Speedup")
+    print(header)
+    print("=" * len(header))
+
+    for name, operation in operations:
+        baseline = None
+
+        for transport, connection_class in (("httplib", httplib.HTTPConnection),
+                                            ("socket", HTTPConnection)):
+            db = kt_http.ProtocolHandler(KT_PACKER_BYTES, None, connection_class)
+            db.open(server["host"], server["port"], 2)
+
+            db.set_bulk(records, None, True, 0)
+            operation(db)  # ...connect before starting the clock.
+
+            start = time()
+
+            for i in range(iterations):
+                operation(db)
+
+            duration = time() - start
+            rate = iterations / duration
+            baseline = baseline or duration
+
+            print("%-14s | %-10s | %5.2f s | %10.2f ips | %6.2fx" %
+                  (name, transport, duration, rate, baseline / duration))
+
+            db.remove_bulk(keys, True, 0)
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF - kt_transport.py
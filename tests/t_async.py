@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import unittest
+import kyototycoon
+from kyototycoon import KyotoTycoon, KyotoTycoonException
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+@unittest.skipIf(not hasattr(kyototycoon, 'AsyncKyotoTycoon'), 'requires Python 3.5 or later')
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = kyototycoon.AsyncKyotoTycoon(binary=True)
+        self.wait(self.kt_bin_handle.open(port=11978))
+
+        self.kt_async_http_handle = kyototycoon.AsyncKyotoTycoon(binary=False)
+        self.wait(self.kt_async_http_handle.open(port=11978))
+
+    def tearDown(self):
+        self.wait(self.kt_async_http_handle.close())
+        self.wait(self.kt_bin_handle.close())
+        self.loop.close()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_binary(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        self.assertTrue(self.wait(self.kt_bin_handle.set('key', 'value')))
+        self.assertEqual(self.wait(self.kt_bin_handle.get('key')), 'value')
+        self.assertEqual(self.wait(self.kt_bin_handle.get('missing')), None)
+
+        self.assertEqual(self.wait(self.kt_bin_handle.set_bulk({'a': 1, 'b': 2})), 2)
+        self.assertEqual(self.wait(self.kt_bin_handle.get_bulk(['a', 'b', 'c'])), {'a': 1, 'b': 2})
+        self.assertEqual(self.wait(self.kt_bin_handle.remove_bulk(['a', 'c'])), 1)
+        self.assertTrue(self.wait(self.kt_bin_handle.remove('b')))
+        self.assertFalse(self.wait(self.kt_bin_handle.remove('b')))
+
+        self.assertEqual(self.wait(self.kt_bin_handle.play_script('echo', {'key': b'abc'})), {'key': b'abc'})
+        self.assertRaises(KyotoTycoonException, self.wait, self.kt_bin_handle.play_script('no_such_procedure'))
+
+    def test_binary_concurrent(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        sets = [self.kt_bin_handle.set('key%d' % i, i) for i in range(500)]
+        self.assertEqual(self.wait(asyncio.gather(*sets)), [True] * 500)
+
+        gets = [self.kt_bin_handle.get('key%d' % i) for i in range(500)]
+        self.assertEqual(self.wait(asyncio.gather(*gets)), list(range(500)))
+
+        self.assertEqual(self.wait(self.kt_bin_handle.set_bulk({'x': 1}, noreply=True)), None)
+        self.assertEqual(self.wait(self.kt_bin_handle.get('x')), 1)
+        self.assertEqual(self.kt_http_handle.count(), 501)
+
+    def test_http(self):
+        kt = self.kt_async_http_handle
+        self.assertTrue(self.wait(kt.clear()))
+
+        self.assertTrue(self.wait(kt.set('key', 'value')))
+        self.assertEqual(self.wait(kt.get('key')), 'value')
+        self.assertEqual(self.wait(kt.get('missing')), None)
+        self.assertTrue(self.wait(kt.check('key')))
+        self.assertRaises(KyotoTycoonException, self.wait, kt.add('key', 'other'))
+        self.assertTrue(self.wait(kt.replace('key', 'other')))
+        self.assertFalse(self.wait(kt.replace('missing', 'other')))
+        self.assertTrue(self.wait(kt.append('key', '!')))
+        self.assertEqual(self.wait(kt.seize('key')), 'other!')
+        self.assertEqual(self.wait(kt.count()), 0)
+
+        self.assertEqual(self.wait(kt.increment('counter', 5)), 5)
+        self.assertEqual(self.wait(kt.increment('counter', -2)), 3)
+        self.assertEqual(self.wait(kt.get_int('counter')), 3)
+        self.assertEqual(self.wait(kt.increment_double('double', 1.5)), 1.5)
+
+        self.assertTrue(self.wait(kt.cas('key', new_val='one')))
+        self.assertRaises(KyotoTycoonException, self.wait, kt.cas('key', old_val='two', new_val='three'))
+
+        self.assertEqual(self.wait(kt.set_bulk({'a/1': 1, 'a/2': 2, 'b': 3})), 3)
+        self.assertEqual(self.wait(kt.get_bulk(['a/1', 'b', 'c'])), {'a/1': 1, 'b': 3})
+        self.assertEqual(sorted(self.wait(kt.match_prefix('a/'))), ['a/1', 'a/2'])
+        self.assertEqual(self.wait(kt.remove_bulk(['a/1', 'c'])), 1)
+        self.assertTrue(self.wait(kt.remove('b')))
+        self.assertFalse(self.wait(kt.remove('b')))
+
+        self.assertEqual(self.wait(kt.play_script('echo', {'key': b'abc'})), {'key': b'abc'})
+        self.assertRaises(KyotoTycoonException, self.wait, kt.play_script('no_such_procedure'))
+        self.assertTrue('count' in self.wait(kt.status()))
+
+    def test_http_concurrent(self):
+        kt = self.kt_async_http_handle
+        self.assertTrue(self.wait(kt.clear()))
+
+        sets = [kt.set('key%d' % i, i) for i in range(100)]
+        self.assertEqual(self.wait(asyncio.gather(*sets)), [True] * 100)
+
+        gets = [kt.get('key%d' % i) for i in range(100)]
+        self.assertEqual(self.wait(asyncio.gather(*gets)), list(range(100)))
+        self.assertEqual(self.kt_http_handle.count(), 100)
+
+    def test_http_cursor(self):
+        kt = self.kt_async_http_handle
+        self.assertTrue(self.wait(kt.clear()))
+        self.assertEqual(self.wait(kt.set_bulk(dict(('key%d' % i, i) for i in range(10)))), 10)
+
+        async def scan():
+            records = []
+            async with kt.cursor() as cur:
+                async for key, value in cur:
+                    records.append((key, value))
+
+            return records
+
+        async def remove_first():
+            cur = kt.cursor()
+            self.assertTrue(await cur.jump())
+            self.assertEqual(await cur.seize(), {'key': 'key0', 'value': 0})
+            self.assertEqual(await cur.get_key(), 'key1')
+            self.assertTrue(await cur.delete())
+
+        self.assertEqual(self.wait(scan()), [('key%d' % i, i) for i in range(10)])
+        self.wait(remove_first())
+        self.assertEqual(self.wait(kt.count()), 9)
+
+    def test_get_batcher(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertEqual(self.kt_http_handle.set_bulk(dict(('key%d' % i, i) for i in range(10))), 10)
+
+        for kt in (self.kt_bin_handle, self.kt_async_http_handle):
+            batcher = kyototycoon.AsyncGetBatcher(kt, max_keys=8)
+
+            gets = [batcher.get('key%d' % (i % 12)) for i in range(20)]
+            checks = [batcher.check('key%d' % i) for i in (0, 11)]
+
+            self.assertEqual(self.wait(asyncio.gather(*gets)), [i % 12 if i % 12 < 10 else None for i in range(20)])
+            self.assertEqual(self.wait(asyncio.gather(*checks)), [True, False])
+            self.assertEqual(batcher.stats()['batches'], 4)
+
+            # Fetches are kept alive while running, and forgotten afterwards...
+            self.wait(asyncio.sleep(0))
+            self.assertEqual(batcher.fetches, set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import threading
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonException, GetBatcher
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+        self.kt_bin_handle.close()
+
+    def test_get_batcher(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertEqual(self.kt_http_handle.set_bulk(dict(('key%d' % i, i) for i in range(50))), 50)
+
+        for kt in (self.kt_http_handle, self.kt_bin_handle):
+            with GetBatcher(kt, window=0.01, max_keys=25) as batcher:
+                results = {}
+                errors = []
+
+                def worker(n):
+                    try:
+                        for i in range(n, 60, 10):
+                            results['key%d' % i] = (batcher.get('key%d' % i), batcher.check('key%d' % i))
+                    except Exception as e:
+                        errors.append(e)
+
+                threads = [threading.Thread(target=worker, args=(n,)) for n in range(10)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+                self.assertEqual(errors, [])
+                self.assertEqual(len(results), 60)
+
+                for i in range(60):
+                    self.assertEqual(results['key%d' % i], (i, True) if i < 50 else (None, False))
+
+                stats = batcher.stats()
+                self.assertEqual(stats['requests'], 120)
+                self.assertTrue(stats['batches'] < 120)
+
+    def test_get_batcher_close(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.set('key', 'value'))
+
+        batcher = GetBatcher(self.kt_bin_handle, window=1.0)
+        requests = [batcher.submit('key'), batcher.submit('missing')]
+
+        # Queued requests are still sent when closing...
+        self.assertTrue(batcher.close())
+        self.assertEqual([r.result(0) for r in requests], [(True, 'value'), (False, None)])
+        self.assertRaises(KyotoTycoonException, batcher.get, 'key')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import time
+import unittest
+from kyototycoon import KyotoTycoon, LocalCache
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+
+    def test_get_with_expire(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.set('key', 'value', 60))
+        self.assertTrue(self.kt_http_handle.set('forever', 'value'))
+
+        with KyotoTycoon(binary=True).connect(port=11978) as kt_bin_handle:
+            for kt in (self.kt_http_handle, kt_bin_handle):
+                value, expire = kt.get_with_expire('key')
+                self.assertEqual(value, 'value')
+                self.assertTrue(abs(expire - (time.time() + 60)) < 5)
+
+                self.assertEqual(kt.get_with_expire('forever'), ('value', None))
+                self.assertEqual(kt.get_with_expire('missing'), (None, None))
+
+    def test_cache(self):
+        for binary in (False, True):
+            self.assertTrue(self.kt_http_handle.clear())
+
+            cache = LocalCache(max_items=3)
+            kt = KyotoTycoon(binary=binary, cache=cache)
+            kt.open(port=11978)
+
+            self.assertTrue(kt.set('key', 'value'))
+            self.assertEqual(kt.get('key'), 'value')
+            self.assertEqual(kt.get('key'), 'value')
+            self.assertEqual(kt.get('missing'), None)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+            # Changes made by other clients aren't seen...
+            self.assertTrue(self.kt_http_handle.set('key', 'other'))
+            self.assertEqual(kt.get('key'), 'value')
+
+            # ...but changes made through the same client are.
+            self.assertTrue(kt.set('key', 'new'))
+            self.assertEqual(kt.get('key'), 'new')
+            self.assertTrue(kt.remove('key'))
+            self.assertEqual(kt.get('key'), None)
+
+            # Only records missing from the cache are requested...
+            self.assertEqual(kt.set_bulk({'a': 1, 'b': 2, 'c': 3}), 3)
+            self.assertEqual(kt.get('a'), 1)
+            self.assertEqual(self.kt_http_handle.remove_bulk(['a']), 1)
+            self.assertEqual(kt.get_bulk(['a', 'b', 'c', 'd']), {'a': 1, 'b': 2, 'c': 3})
+            self.assertEqual(len(cache), 3)
+
+            self.assertEqual(kt.set_bulk({'x': 1, 'y': 2}), 2)
+            self.assertEqual(kt.get_bulk(['x', 'y']), {'x': 1, 'y': 2})
+            self.assertEqual(cache.evictions, 2)
+            self.assertEqual(kt.get('a'), None)
+            self.assertEqual(len(cache), 3)
+
+            if not binary:
+                self.assertTrue(kt.clear())
+                self.assertEqual(len(cache), 0)
+
+            kt.close()
+
+    def test_cache_expire(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        cache = LocalCache(ttl=0.2)
+        kt = KyotoTycoon(binary=False, cache=cache)
+        kt.open(port=11978)
+
+        self.assertTrue(kt.set('key', 'value'))
+        self.assertEqual(kt.get('key'), 'value')
+        self.assertTrue(self.kt_http_handle.set('key', 'other'))
+        self.assertEqual(kt.get('key'), 'value')
+
+        time.sleep(0.3)
+        self.assertEqual(kt.get('key'), 'other')
+        self.assertEqual(cache.stats()['expirations'], 1)
+        kt.close()
+
+    def test_iter_bulk_invalidation(self):
+        for binary in (False, True):
+            self.assertTrue(self.kt_http_handle.clear())
+            self.assertEqual(self.kt_http_handle.set_bulk(dict(('key%d' % i, 'old') for i in range(6))), 6)
+
+            cache = LocalCache()
+            kt = KyotoTycoon(binary=binary, cache=cache)
+            kt.open(port=11978)
+
+            reader = KyotoTycoon(binary=False, cache=cache)
+            reader.open(port=11978)
+
+            # Read between chunks, while the next ones are already taken (or even sent)...
+            results = kt.iter_set_bulk([('key%d' % i, 'new') for i in range(6)], chunk_keys=2)
+            self.assertEqual(next(results), 2)
+            self.assertEqual(reader.get('key1'), 'new')
+            self.assertEqual(reader.get('key4'), 'old')
+            self.assertEqual(list(results), [2, 2])
+
+            self.assertEqual([reader.get('key%d' % i) for i in range(6)], ['new'] * 6)
+
+            results = kt.iter_remove_bulk(['key%d' % i for i in range(6)], chunk_keys=2)
+            self.assertEqual(next(results), 2)
+            self.assertEqual(reader.get('key0'), None)
+            self.assertEqual(reader.get('key4'), 'new')
+            results.close()  # ...stopping early still invalidates the chunks taken.
+
+            self.assertEqual(reader.get('key4'), self.kt_http_handle.get('key4'))
+            reader.close()
+            kt.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import threading
+import time
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonPool, SingleFlight
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_get(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return {'key': key}
+
+        results = []
+        def worker():
+            results.append(flight.do(('get', 'key'), slow_get, 'key'))
+
+        threads = [threading.Thread(target=worker) for i in range(10)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+
+        for t in threads[1:]:
+            t.start()
+
+        # Give the other threads a chance to join the request in flight...
+        for i in range(50):
+            if flight.stats()['coalesced'] == 9:
+                break
+            time.sleep(0.01)
+
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(calls, ['key'])
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(flight.stats(), {'calls': 10, 'coalesced': 9, 'in_flight': 0})
+
+    def test_single_flight_invalidate(self):
+        flight = SingleFlight()
+        inner = []
+
+        def reader():
+            # A write made meanwhile keeps later reads from joining this one...
+            if not inner:
+                inner.append(True)
+                flight.invalidate()
+                inner.append(flight.do('key', lambda: 'new'))
+
+            return 'old'
+
+        self.assertEqual(flight.do('key', reader), 'old')
+        self.assertEqual(inner[1], 'new')
+        self.assertEqual(flight.stats()['coalesced'], 0)
+
+    def test_pool_coalesce(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.set('key', 'value'))
+
+        with KyotoTycoonPool(port=11978, max_size=4, coalesce=True) as pool:
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(pool.get('key'))) for i in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            self.assertEqual(results, ['value'] * 20)
+            self.assertEqual(pool.coalesce.stats()['calls'], 20)
+
+            self.assertTrue(pool.set('key', 'other'))
+            self.assertEqual(pool.get('key'), 'other')
+            self.assertEqual(pool.match_prefix('ke'), ['key'])
+
+    def test_handler(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.set('key', 'value', db=1))
+
+        flight = SingleFlight()
+        with KyotoTycoon(binary=False, coalesce=flight).connect(port=11978) as kt:
+            self.assertEqual(kt.core.get('key', db=1), 'value')
+            self.assertEqual(kt.core.get('key', 0), None)
+
+            # Chunked writes invalidate reads in flight as each request is made...
+            generation = flight.generation
+            results = kt.iter_set_bulk([('key%d' % i, 'value') for i in range(4)], chunk_keys=2)
+            self.assertEqual(flight.generation, generation)
+
+            self.assertEqual(next(results), 2)
+            self.assertEqual(flight.generation, generation + 1)
+
+            results.close()
+            self.assertEqual(flight.generation, generation + 2)
+
+            self.assertEqual(list(kt.iter_remove_bulk(['key0', 'key1'])), [2])
+            self.assertEqual(flight.generation, generation + 4)
+
+if __name__ == '__main__':
+    unittest.main()
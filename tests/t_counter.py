@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Kyoto Tycoon should be started like this:
+#   $ ktserver -scr t_script.lua '%' '%'
+
+import config
+import unittest
+from kyototycoon import KyotoTycoon, CounterAggregator, KyotoTycoonException
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+        self.kt_bin_handle.close()
+
+    def test_counter_aggregator(self):
+        for kt, script in ((self.kt_http_handle, 'increment_bulk'), (self.kt_bin_handle, 'increment_bulk'),
+                           (self.kt_http_handle, None)):
+            self.assertTrue(self.kt_http_handle.clear())
+            self.assertTrue(self.kt_http_handle.clear(db=1))
+
+            with CounterAggregator(kt, max_age=60, script=script) as counters:
+                for i in range(100):
+                    counters.increment('hits')
+                    counters.increment('misses', 2, db=1)
+                    counters.increment_double('latency', 0.5)
+
+                self.assertEqual(len(counters), 3)
+                self.assertEqual(self.kt_http_handle.check('hits'), False)
+                self.assertRaises(ValueError, counters.increment, 'latency')
+
+                totals = counters.flush()
+                self.assertEqual(totals, {(0, 'hits'): 100, (1, 'misses'): 200, (0, 'latency'): 50.0})
+                self.assertEqual(len(counters), 0)
+
+                counters.increment('hits', 5)
+                self.assertEqual(counters.get('hits'), 105)
+                self.assertEqual(counters.get('latency', double=True), 50.0)
+                self.assertEqual(counters.get('misses', db=1), 200)
+
+                counters.increment('hits', -10)
+
+            # Sent when leaving the "with" block...
+            self.assertEqual(self.kt_http_handle.increment('hits', 0), 95)
+
+            stats = counters.stats()
+            self.assertEqual(stats['increments'], 302)
+            self.assertEqual(stats['unsent'], 0)
+            self.assertEqual(stats['dropped'], 0)
+
+    def test_max_unsent(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        with CounterAggregator(self.kt_bin_handle, max_age=60, max_unsent=10) as counters:
+            for i in range(25):
+                counters.increment('counter%d' % (i % 3))
+
+            self.assertEqual(counters.stats()['unsent'], 5)
+            self.assertEqual(self.kt_http_handle.increment('counter0', 0), 7)
+
+    def test_dropped_increments(self):
+        errors = []
+
+        kt = KyotoTycoon(binary=True)
+        kt.open(port=11978)
+        kt.close()  # ...all increments will fail.
+
+        counters = CounterAggregator(kt, max_age=60, on_error=lambda e, counters: errors.append(sorted(counters)))
+        counters.increment('a')
+        counters.increment('a')
+        counters.increment('b', db=1)
+
+        self.assertEqual(counters.flush(), {})
+        self.assertEqual(counters.stats()['dropped'], 3)
+        self.assertTrue(counters.last_error is not None)
+        self.assertEqual(errors, [[(0, 'a'), (1, 'b')]])
+
+        counters.close()
+
+        # The error for this call is raised, even if "last_error" changes meanwhile...
+        aggregator = CounterAggregator(kt, max_age=60)
+        aggregator.on_error = lambda e, counters: setattr(aggregator, 'last_error', None)
+        aggregator.increment('c')
+        self.assertRaises((KyotoTycoonException, IOError), aggregator.get, 'c')
+
+        aggregator.close()
+
+if __name__ == '__main__':
+    unittest.main()
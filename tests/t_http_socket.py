@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+#
+# This test does not require a KT server.
+#
+
+import config
+import socket
+import unittest
+from kyototycoon.kt_socket import BufferedReader
+from kyototycoon.kt_http_socket import HTTPConnection
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = HTTPConnection('localhost', 11978)
+        self.conn.sock, self.server = socket.socketpair()
+        self.conn.reader = BufferedReader(self.conn.sock)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def receive(self, size):
+        data = b''
+        while len(data) < size:
+            data += self.server.recv(size - len(data))
+
+        return data
+
+    def test_request(self):
+        headers = {'Content-Type': 'text/tab-separated-values'}
+        expected = (b'POST /rpc/get_bulk?DB=0 HTTP/1.1\r\nHost: localhost:11978\r\n'
+                    b'Content-Type: text/tab-separated-values\r\nContent-Length: 4\r\n\r\n_a\t\n')
+
+        for i in range(2):
+            self.conn.request('POST', '/rpc/get_bulk?DB=0', b'_a\t\n', headers)
+            self.assertEqual(self.receive(len(expected)), expected)
+
+            self.server.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nabc')
+            self.assertEqual(self.conn.getresponse().read(), b'abc')
+
+        # The same head is reused for the same RPC path...
+        self.assertEqual(len(self.conn.heads), 1)
+
+        self.conn.request('PUT', '/0/key', b'value', {b'X-Kt-Mode': b'add'})
+        expected = b'PUT /0/key HTTP/1.1\r\nHost: localhost:11978\r\nX-Kt-Mode: add\r\nContent-Length: 5\r\n\r\nvalue'
+        self.assertEqual(self.receive(len(expected)), expected)
+        self.assertEqual(len(self.conn.heads), 1)
+
+    def test_response(self):
+        self.conn.request('GET', '/rpc/echo')
+        self.server.sendall(b'HTTP/1.1 450 Logical Inconsistency\r\nContent-Type: text/plain\r\n'
+                            b'X-Kt-Xt: 123\r\nContent-Length: 10\r\n\r\n0123456789')
+
+        res = self.conn.getresponse()
+        self.assertEqual(res.status, 450)
+        self.assertEqual(res.getheader('x-kt-xt'), '123')
+        self.assertEqual(res.getheader('Content-Type'), 'text/plain')
+        self.assertEqual(res.getheader('Missing', 'default'), 'default')
+        self.assertFalse(res.will_close)
+
+        self.assertEqual(res.read(4), b'0123')
+        self.assertEqual(res.read(100), b'456789')
+        self.assertEqual(res.read(), b'')
+
+        # Unread bodies are skipped before the next request...
+        self.conn.request('DELETE', '/0/key')
+        self.server.sendall(b'HTTP/1.1 204 No Content\r\n\r\n'
+                            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nabc'
+                            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nxy')
+
+        self.assertEqual(self.conn.getresponse().status, 204)
+
+        self.conn.request('GET', '/rpc/echo')
+        self.assertEqual(self.conn.getresponse().status, 200)
+
+        self.conn.request('GET', '/rpc/echo')
+        self.assertEqual(self.conn.getresponse().read(), b'xy')
+
+    def test_close(self):
+        self.conn.request('GET', '/rpc/echo')
+        self.receive(len(b'GET /rpc/echo HTTP/1.1\r\nHost: localhost:11978\r\nContent-Length: 0\r\n\r\n'))
+
+        self.server.sendall(b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nuntil the end')
+        self.server.close()
+
+        res = self.conn.getresponse()
+        self.assertTrue(res.will_close)
+        self.assertEqual(res.read(), b'until the end')
+
+        self.conn.close()
+        self.assertEqual(self.conn.sock, None)
+
+    def test_bad_response(self):
+        self.conn.request('GET', '/rpc/echo')
+        self.server.sendall(b'garbage\r\n\r\n')
+
+        self.assertRaises(IOError, self.conn.getresponse)
+        self.assertEqual(self.conn.sock, None)  # ...the next request reconnects.
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonException
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_handle = KyotoTycoon(hybrid=True)
+        self.kt_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_handle.close()
+
+    def test_routing(self):
+        core = self.kt_handle.core
+        self.assertTrue(self.kt_handle.clear())
+
+        # Binary protocol...
+        self.assertTrue(self.kt_handle.set('key', 'value'))
+        self.assertEqual(self.kt_handle.get('key'), 'value')
+        self.assertEqual(self.kt_handle.set_bulk({'a': 1, 'b': 2}), 2)
+        self.assertEqual(self.kt_handle.get_bulk(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(self.kt_handle.play_script('echo', {'key': b'abc'}), {'key': b'abc'})
+
+        with self.kt_handle.pipeline() as pipe:
+            reply = pipe.get('a')
+        self.assertEqual(reply.result(), 1)
+
+        # HTTP protocol...
+        self.assertEqual(self.kt_handle.count(), 3)
+        self.assertTrue(self.kt_handle.check('key'))
+        self.assertTrue(self.kt_handle.cas('key', 'value', 'other'))
+        self.assertEqual(sorted(self.kt_handle.match_prefix('ke')), ['key'])
+        self.assertEqual(self.kt_handle.get_bulk(['a', 'key'], atomic=True), {'a': 1, 'key': 'other'})
+
+        with self.kt_handle.cursor() as cur:
+            self.assertEqual(sorted(k for k, v in cur), ['a', 'b', 'key'])
+
+        self.assertEqual(self.kt_handle.increment('counter', 5), 5)
+
+        self.assertTrue(self.kt_handle.remove('key'))
+        self.assertFalse(self.kt_handle.check('key'))
+        self.assertEqual(self.kt_handle.remove_bulk(['a', 'b'], atomic=True), 2)
+        self.assertEqual(self.kt_handle.count(), 1)
+
+    def test_named_database(self):
+        # Databases given by name go over HTTP (no such database here)...
+        name = 'missing.kch'
+
+        self.assertRaises(KyotoTycoonException, self.kt_handle.get, 'key', db=name)
+        self.assertRaises(KyotoTycoonException, self.kt_handle.get_with_expire, 'key', db=name)
+        self.assertRaises(KyotoTycoonException, self.kt_handle.set, 'key', 'value', db=name)
+        self.assertFalse(self.kt_handle.remove('key', db=name))
+
+        self.assertRaises(KyotoTycoonException, self.kt_handle.get_bulk, ['key'], db=name)
+        self.assertRaises(KyotoTycoonException, self.kt_handle.set_bulk, {'key': 'value'}, db=name)
+        self.assertRaises(KyotoTycoonException, self.kt_handle.remove_bulk, ['key'], db=name)
+        self.assertRaises(KyotoTycoonException, lambda: list(self.kt_handle.iter_get_bulk(['key'], db=name)))
+        self.assertRaises(KyotoTycoonException, lambda: list(self.kt_handle.iter_set_bulk({'key': 'value'}, db=name)))
+
+        # ...where records with their own database aren't supported.
+        self.assertRaises(NotImplementedError, self.kt_handle.get_bulk_records, [(0, 'key'), (name, 'key')])
+        self.assertEqual(self.kt_handle.get_bulk_records([(0, 'missing')]), [])
+
+        # The connections are still in sync afterwards...
+        self.assertTrue(self.kt_handle.set('key', 'value'))
+        self.assertEqual(self.kt_handle.get('key'), 'value')
+
+if __name__ == '__main__':
+    unittest.main()
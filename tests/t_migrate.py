@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import threading
+import time
+import unittest
+from kyototycoon import KyotoTycoon, Migration, KT_PACKER_BYTES, OP_SET, OP_REMOVE, OP_CLEAR
+from kyototycoon.kt_scan import split_key_range
+from t_nearcache import FakeMaster, _log_entry
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_handle = KyotoTycoon(binary=False)
+        self.kt_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_handle.close()
+
+    def test_split_key_range(self):
+        self.assertEqual(split_key_range('a', 'a', 4), [])
+        self.assertEqual(split_key_range('key0', 'key9', 3), ['key3', 'key6'])
+        self.assertEqual(split_key_range('a', 'b', 4), [])
+        self.assertEqual(split_key_range('', 'z', 2), ['='])
+
+        # Boundaries never fall on (unencodable) surrogate code points...
+        points = split_key_range(u'a\ud000', u'a\uf000', 4)
+        self.assertEqual(points, [u'a\ue000', u'a\ue800'])
+        self.assertEqual([point.encode('utf-8') for point in points], [b'a\xee\x80\x80', b'a\xee\xa0\x80'])
+
+    def test_copy(self):
+        self.assertTrue(self.kt_handle.clear())
+        self.assertTrue(self.kt_handle.clear(db=1))
+
+        data = dict(('key%02d' % i, 'value%d' % i) for i in range(100))
+        self.assertEqual(self.kt_handle.set_bulk(data), 100)
+        self.assertTrue(self.kt_handle.set('expiring', 'value', expire=3600))
+
+        migration = Migration('127.0.0.1:11978', '127.0.0.1:11978', db=0, target_db=1, batch_keys=7,
+                              partitions=['key3', 'key6'], max_ops=500)
+        self.assertEqual(len(migration.ranges()), 3)
+
+        start = time.time()
+        self.assertEqual(migration.copy(), 101)
+        self.assertTrue(time.time() - start >= 0.15)
+
+        self.assertEqual(self.kt_handle.get_bulk(list(data.keys()), db=1), data)
+        value, expire = self.kt_handle.get_with_expire('expiring', db=1)
+        self.assertEqual(value, 'value')
+        self.assertTrue(expire is not None and 3500 < expire - time.time() <= 3600)
+
+        self.assertEqual(migration.stats()['copied'], 101)
+
+        checkpoint = migration.checkpoint()
+        self.assertTrue(all(partition['done'] for partition in checkpoint['partitions']))
+        self.assertEqual(migration.copy(checkpoint), 0)
+
+    def test_copy_resume(self):
+        self.assertTrue(self.kt_handle.clear())
+        self.assertTrue(self.kt_handle.clear(db=1))
+
+        data = dict(('key%02d' % i, 'value%d' % i) for i in range(100))
+        self.assertEqual(self.kt_handle.set_bulk(data), 100)
+
+        # As if interrupted after copying up to "key19" and "key69" in each range...
+        checkpoint = {'db': 0, 'partitions': [
+            {'start': None, 'end': 'key50', 'last': 'key19', 'count': 20, 'done': False},
+            {'start': 'key50', 'end': None, 'last': 'key69', 'count': 20, 'done': False}]}
+
+        migration = Migration('127.0.0.1:11978', '127.0.0.1:11978', db=0, target_db=1, batch_keys=7, cursors=2)
+        self.assertEqual(migration.copy(checkpoint), 60)
+
+        copied = self.kt_handle.match_prefix('key', db=1)
+        self.assertEqual(sorted(copied), ['key%02d' % i for i in list(range(20, 50)) + list(range(70, 100))])
+
+        # Automatic key ranges (the database is ordered by key), with a script...
+        migration = Migration('127.0.0.1:11978', '127.0.0.1:11978', db=0, target_db=1, script='scan_batch')
+        self.assertTrue(len(migration.ranges()) > 1)
+        self.assertEqual(migration.copy(), 100)
+        self.assertEqual(self.kt_handle.count(db=1), 100)
+
+    def test_tail(self):
+        self.assertTrue(self.kt_handle.clear(db=1))
+        self.assertTrue(self.kt_handle.set('stale', 'value', db=1))
+
+        master = FakeMaster()
+        migration = Migration('127.0.0.1:%d' % master.port, '127.0.0.1:11978', db=0, target_db=1, sid=1001)
+
+        thread = threading.Thread(target=migration.tail, args=(time.time(),))
+        thread.daemon = True
+        thread.start()
+
+        try:
+            self.assertTrue(master.connected.wait(5))
+
+            master.send(_log_entry(OP_CLEAR, 0))
+            master.send(_log_entry(OP_SET, 0, b'a', b'x'))
+            master.send(_log_entry(OP_SET, 0, b'b', b'y'))
+            master.send(_log_entry(OP_SET, 1, b'c', b'z'))  # ...another database.
+            master.send(_log_entry(OP_REMOVE, 0, b'b'))
+            master.sync()
+
+            for i in range(50):
+                if migration.stats()['replayed'] == 4:
+                    break
+                time.sleep(0.1)
+
+            self.assertEqual(migration.stats()['replayed'], 4)
+        finally:
+            migration.stop()
+            thread.join(5)
+            master.close()
+
+        self.assertFalse(thread.is_alive())
+
+        kt = KyotoTycoon(binary=False, pack_type=KT_PACKER_BYTES)
+        kt.open(port=11978)
+        self.assertEqual(kt.get_bulk(['a', 'b', 'c', 'stale'], db=1), {'a': b'x'})
+        kt.close()
+
+if __name__ == '__main__':
+    unittest.main()
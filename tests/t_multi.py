@@ -247,5 +247,30 @@ class UnitTest(unittest.TestCase):
         self.assertEqual(self.kt_handle_bin.get('key', db=DB_2), 'value')
         assert self.kt_handle_bin.get('key', db=DB_1) is None
 
+    def test_bulk_records_bin(self):
+        self.assertTrue(self.clear_all())
+
+        records = [(DB_1, 'a', 'xxxx', None),
+                   (DB_2, 'a', 'yyyy', 60),
+                   (DB_2, 'b', 'zzzz', None)]
+        self.assertEqual(self.kt_handle_bin.set_bulk_records(records), 3)
+        self.assertEqual(self.kt_handle_http.count(db=DB_1), 1)
+        self.assertEqual(self.kt_handle_http.count(db=DB_2), 2)
+
+        now = int(time.time())
+        found = self.kt_handle_bin.get_bulk_records([(DB_1, 'a'), (DB_2, 'a'), (DB_1, 'b')])
+        self.assertEqual(len(found), 2)
+
+        found = dict(((db, key), (value, expire)) for db, key, value, expire in found)
+        self.assertEqual(found[(DB_1, 'a')], ('xxxx', None))
+        self.assertEqual(found[(DB_2, 'a')][0], 'yyyy')
+        self.assertTrue(now <= found[(DB_2, 'a')][1] <= now + 61)
+
+        self.assertEqual(self.kt_handle_bin.remove_bulk_records([(DB_1, 'a'), (DB_2, 'b')]), 2)
+        self.assertEqual(self.kt_handle_http.count(db=DB_1), 0)
+        self.assertEqual(self.kt_handle_http.count(db=DB_2), 1)
+
+        self.assertRaises(NotImplementedError, self.kt_handle_http.get_bulk_records, [(DB_1, 'a')])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import socket
+import struct
+import threading
+import time
+import unittest
+from kyototycoon import LocalCache, NearCache, OP_SET, OP_REMOVE, OP_CLEAR
+
+MB_REPL = 0xb1
+MB_SYNC = 0xb0
+
+def _log_entry(op, db, key=b'', value=b''):
+    '''Encode a transaction log entry (keys and values under 128 bytes only).'''
+
+    data = struct.pack('!HHB', 1, db, op)
+
+    if op == OP_REMOVE:
+        data += struct.pack('!B', len(key)) + key
+    elif op == OP_SET:
+        data += struct.pack('!BB', len(key), len(value) + 5) + key + b'\xff' * 5 + value
+
+    return struct.pack('!BQI', MB_REPL, int(time.time() * 10**9), len(data)) + data
+
+class FakeMaster(object):
+    '''A replication master sending whatever entries it's given, and syncing in between.'''
+
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+
+        self.conn = None
+        self.connected = threading.Event()
+
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        self.conn, address = self.listener.accept()
+        self.conn.recv(15)  # ...the replication request.
+        self.conn.sendall(struct.pack('!B', MB_REPL))
+        self.connected.set()
+
+    def send(self, data):
+        self.conn.sendall(data)
+
+    def sync(self):
+        self.conn.sendall(struct.pack('!BQ', MB_SYNC, int(time.time() * 10**9)))
+        self.conn.recv(1)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+        self.listener.close()
+
+class UnitTest(unittest.TestCase):
+    def test_invalidation_race(self):
+        cache = LocalCache()
+
+        # A record read before being changed must not be cached afterwards...
+        version = cache.version
+        cache.invalidate('key')
+        cache.put('key', 'stale', None, 0, version)
+        self.assertEqual(cache.get('key'), (False, None, None))
+
+        version = cache.version
+        cache.put('key', 'fresh', None, 0, version)
+        self.assertEqual(cache.get('key'), (True, 'fresh', None))
+
+        version = cache.version
+        cache.clear()
+        cache.put('key', 'stale', None, 0, version)
+        self.assertEqual(cache.get('key'), (False, None, None))
+
+    def test_near_cache(self):
+        master = FakeMaster()
+        cache = NearCache(sid=2, port=master.port, max_lag=5)
+
+        try:
+            self.assertTrue(master.connected.wait(5))
+            master.sync()
+
+            self.assertTrue(cache.coherent())
+            self.assertTrue(cache.lag() < 5)
+
+            cache.put('a', 1)
+            cache.put('b', 2)
+            cache.put('c', 3, db=1)
+            self.assertEqual(cache.get('a'), (True, 1, None))
+
+            master.send(_log_entry(OP_SET, 0, b'a', b'x'))
+            master.send(_log_entry(OP_REMOVE, 0, b'b'))
+            master.send(_log_entry(OP_CLEAR, 1))
+            master.sync()
+
+            for i in range(50):
+                if cache.log_entries == 3:
+                    break
+                time.sleep(0.1)
+
+            self.assertEqual(cache.stats()['log_entries'], 3)
+            self.assertEqual(len(cache), 0)
+
+            # Nothing is cached when the stream is interrupted...
+            master.close()
+
+            for i in range(50):
+                if not cache.coherent():
+                    break
+                time.sleep(0.1)
+
+            cache.put('a', 1)
+            self.assertEqual(cache.get('a'), (False, None, None))
+            self.assertTrue(cache.stats()['stream_errors'] >= 1)
+        finally:
+            cache.close()
+            master.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonException
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+    def test_pipeline(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        with self.kt_bin_handle.pipeline() as pipe:
+            set_replies = [pipe.set('key%d' % i, i) for i in range(10)]
+            get_replies = [pipe.get('key%d' % i) for i in range(10)]
+            bulk_reply = pipe.get_bulk(['key1', 'key2', 'missing'])
+            remove_reply = pipe.remove('key0')
+
+        self.assertEqual([r.result() for r in set_replies], [True] * 10)
+        self.assertEqual([r.result() for r in get_replies], list(range(10)))
+        self.assertEqual(bulk_reply.result(), {'key1': 1, 'key2': 2})
+        self.assertTrue(remove_reply.result())
+        self.assertEqual(self.kt_http_handle.count(), 9)
+
+    def test_pipeline_max_pending(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        pipe = self.kt_bin_handle.pipeline(max_pending=2)
+        replies = [pipe.set_bulk({'a%d' % i: i, 'b%d' % i: i}) for i in range(5)]
+        self.assertTrue(len(pipe) <= 2)
+
+        results = pipe.execute()
+        self.assertEqual(results, [2] * len(results))
+        self.assertEqual([r.result() for r in replies], [2] * 5)
+        self.assertEqual(self.kt_http_handle.count(), 10)
+
+    def test_pipeline_errors(self):
+        pipe = self.kt_bin_handle.pipeline()
+        bad_reply = pipe.play_script('no_such_procedure')
+        good_reply = pipe.set('key', 'value')
+
+        results = pipe.execute()
+        self.assertTrue(isinstance(results[0], KyotoTycoonException))
+        self.assertRaises(KyotoTycoonException, bad_reply.result)
+        self.assertTrue(good_reply.result())
+
+        self.assertRaises(NotImplementedError, self.kt_http_handle.pipeline)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import threading
+import time
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonPool, KyotoTycoonException
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+
+    def test_echo(self):
+        self.assertTrue(self.kt_http_handle.echo())
+
+        with KyotoTycoon(binary=True).connect(port=11978) as kt_bin_handle:
+            self.assertTrue(kt_bin_handle.echo())
+            self.assertTrue(kt_bin_handle.set('key', 'value'))
+            self.assertEqual(kt_bin_handle.get('key'), 'value')
+
+    def test_pool(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        for binary in (False, True):
+            with KyotoTycoonPool(binary=binary, port=11978, min_size=1, max_size=2) as pool:
+                self.assertEqual(len(pool), 1)
+                self.assertTrue(pool.set('key', binary))
+                self.assertEqual(pool.get('key'), binary)
+                self.assertRaises(AttributeError, getattr, pool, 'cursor')
+
+                with pool.connection() as kt1:
+                    with pool.connection() as kt2:
+                        self.assertTrue(kt1 is not kt2)
+                        self.assertRaises(KyotoTycoonException, pool.checkout, 0.1)
+
+                self.assertEqual(len(pool), 2)
+
+                stats = pool.stats()
+                self.assertEqual(stats['size'], 2)
+                self.assertEqual(stats['idle'], 2)
+                self.assertEqual(stats['timeouts'], 1)
+                self.assertEqual(sum(c['checkouts'] for c in stats['connections']), 4)
+
+    def test_pool_threads(self):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        pool = KyotoTycoonPool(port=11978, min_size=0, max_size=3)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(20):
+                    pool.set('key%d-%d' % (n, i), i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(len(pool) <= 3)
+        self.assertEqual(self.kt_http_handle.count(), 200)
+        pool.close()
+
+    def test_pool_eviction(self):
+        pool = KyotoTycoonPool(binary=True, port=11978, min_size=1, max_size=3, idle_timeout=0.1,
+                               check_interval=0)
+
+        kts = [pool.checkout() for i in range(3)]
+        for kt in kts:
+            pool.checkin(kt)
+        self.assertEqual(len(pool), 3)
+
+        time.sleep(0.2)
+        self.assertTrue(pool.echo())
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.stats()['evictions'], 2)
+
+        # A broken connection is replaced on checkout...
+        kt = pool.checkout()
+        pool.checkin(kt)
+        kt.close()
+        self.assertTrue(pool.echo())
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+        pool.close()
+        self.assertRaises(KyotoTycoonException, pool.checkout)
+
+if __name__ == '__main__':
+    unittest.main()
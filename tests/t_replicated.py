@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import socket
+import threading
+import time
+import unittest
+from kyototycoon import KyotoTycoon, ReplicatedKyotoTycoon
+from kyototycoon.kt_replicated import replication_lag
+
+def _unused_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+
+    return port
+
+class DelayingProxy(object):
+    '''Forward connections to a server, delaying requests by "delay" seconds.'''
+
+    def __init__(self, port):
+        self.port = port
+        self.delay = 0
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.address = '127.0.0.1:%d' % self.listener.getsockname()[1]
+
+        self._start(self._accept)
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, address = self.listener.accept()
+            except socket.error:
+                return
+
+            server = socket.create_connection(('127.0.0.1', self.port))
+            self._start(self._pipe, client, server, True)
+            self._start(self._pipe, server, client, False)
+
+    def _pipe(self, source, destination, delayed):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+
+                if delayed and self.delay:
+                    time.sleep(self.delay)
+
+                destination.sendall(data)
+        except socket.error:
+            pass
+        finally:
+            destination.close()
+
+    def close(self):
+        self.listener.close()
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_handle = KyotoTycoon(binary=False)
+        self.kt_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_handle.close()
+
+    def test_replication_lag(self):
+        self.assertEqual(replication_lag({'repl_delay': '0.250000'}), 0.25)
+        self.assertEqual(replication_lag({'serv_conn_count': '1'}), None)
+
+    def test_replicated(self):
+        # The same server plays the master and a replica, along with an unreachable replica...
+        dead = '127.0.0.1:%d' % _unused_port()
+
+        for binary in (False, True):
+            self.assertTrue(self.kt_handle.clear())
+
+            with ReplicatedKyotoTycoon('127.0.0.1:11978', ['localhost:11978', dead],
+                                       binary=binary, timeout=2, max_lag=None) as kt:
+                self.assertTrue(kt.set('key1', 'abc'))
+                self.assertEqual(kt.set_bulk({'key2': 'def', 'key3': 'ghi'}), 2)
+
+                for i in range(10):
+                    self.assertEqual(kt.get('key1'), 'abc')
+                    self.assertEqual(kt.get_bulk(['key2', 'key3']), {'key2': 'def', 'key3': 'ghi'})
+
+                stats = kt.stats()
+                self.assertEqual(stats['master_reads'], 0)
+                self.assertEqual(stats['replicas']['localhost:11978']['reads'], 20)
+                self.assertEqual(stats['replicas'][dead]['available'], False)
+                self.assertTrue(stats['replicas'][dead]['errors'] >= 1)
+
+                self.assertTrue(kt.remove('key1'))
+                self.assertEqual(kt.get('key1'), None)
+
+            # No replicas left, so reads go to the master...
+            with ReplicatedKyotoTycoon('127.0.0.1:11978', [dead], binary=binary, timeout=2) as kt:
+                self.assertEqual(kt.get('key2'), 'def')
+                self.assertEqual(kt.stats()['master_reads'], 1)
+
+    def test_background_checks(self):
+        # A replica that accepts connections but never answers...
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        blackhole.bind(('127.0.0.1', 0))
+        blackhole.listen(16)
+        silent = '127.0.0.1:%d' % blackhole.getsockname()[1]
+
+        try:
+            self.assertTrue(self.kt_handle.set('key', 'value'))
+
+            with ReplicatedKyotoTycoon('127.0.0.1:11978', ['localhost:11978', silent], max_lag=None,
+                                       check_interval=0.1, check_timeout=0.5) as kt:
+                # Checks made meanwhile don't hold up any read...
+                deadline = time.time() + 1.5
+                while time.time() < deadline:
+                    start = time.time()
+                    self.assertEqual(kt.get('key'), 'value')
+                    self.assertTrue(time.time() - start < 0.25)
+
+                stats = kt.stats()
+                self.assertEqual(stats['master_reads'], 0)
+                self.assertEqual(stats['replicas'][silent]['available'], False)
+                self.assertTrue(stats['replicas'][silent]['errors'] >= 2)
+                self.assertTrue(stats['replicas']['localhost:11978']['checked'] > time.time() - 1)
+        finally:
+            blackhole.close()
+
+    def test_hedged(self):
+        proxy = DelayingProxy(11978)
+
+        try:
+            for binary in (False, True):
+                self.assertTrue(self.kt_handle.set('key', 'value'))
+                proxy.delay = 0
+
+                with ReplicatedKyotoTycoon('127.0.0.1:11978', [proxy.address, 'localhost:11978'], binary=binary,
+                                           max_lag=None, check_interval=60, hedge_percentile=90) as kt:
+                    for i in range(100):
+                        self.assertEqual(kt.get('key'), 'value')
+
+                    before = kt.stats()
+
+                    # One of the replicas stalls, but reads still answer quickly (there are too
+                    # few of them to change the 90th percentile of that replica's latency)...
+                    proxy.delay = 0.5
+
+                    start = time.time()
+                    for i in range(5):
+                        self.assertEqual(kt.get('key'), 'value')
+                        self.assertEqual(kt.get_bulk(['key']), {'key': 'value'})
+
+                    self.assertTrue(time.time() - start < 2.5)
+
+                    stats = kt.stats()
+                    self.assertTrue(stats['hedges'] - before['hedges'] >= 5)
+                    self.assertTrue(stats['hedges_won'] - before['hedges_won'] >= 5)
+                    self.assertEqual(stats['master_reads'], 0)
+                    self.assertTrue(stats['replicas'][proxy.address]['latency_p50'] is not None)
+        finally:
+            proxy.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+#
+# Kyoto Tycoon should be started like this:
+#   $ ktserver -scr t_script.lua '%' '%'
+
+import config
+import json
+import time
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonPool, KyotoTycoonException
+from kyototycoon.kt_scan import find_boundaries
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+        self.records = dict(('key%04d' % i, 'value%d' % i) for i in range(250))
+
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.clear(db=1))
+        self.assertEqual(self.kt_http_handle.set_bulk(self.records), len(self.records))
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+        self.kt_bin_handle.close()
+
+    def test_cursor_iter_batches(self):
+        for prefetch in (False, True):
+            with self.kt_http_handle.cursor() as cur:
+                batches = list(cur.iter_batches(100, prefetch=prefetch))
+
+            self.assertEqual([len(batch) for batch in batches], [100, 100, 50])
+            self.assertEqual(dict(record for batch in batches for record in batch), self.records)
+
+        with self.kt_http_handle.cursor() as cur:
+            batches = list(cur.iter_batches(100, key='key0200'))
+            self.assertEqual([len(batch) for batch in batches], [50])
+            self.assertEqual(batches[0][0], ('key0200', 'value200'))
+
+        with self.kt_http_handle.cursor() as cur:
+            self.assertEqual(list(cur.iter_batches(100, db=1)), [])
+
+        # Batches of exactly "batch_size" records, up to the last...
+        with self.kt_http_handle.cursor() as cur:
+            self.assertEqual([len(batch) for batch in cur.iter_batches(50)], [50] * 5)
+
+        # With the scan script, a single request per batch...
+        with self.kt_http_handle.cursor() as cur:
+            batches = list(cur.iter_batches(100, key='key0100', script='scan_batch'))
+            self.assertEqual([len(batch) for batch in batches], [100, 50])
+            self.assertEqual(batches[0][0], ('key0100', 'value100'))
+
+    def test_cursor_iter_batches_expire(self):
+        self.assertTrue(self.kt_http_handle.clear())
+        self.assertTrue(self.kt_http_handle.set('a', 'x'))
+        self.assertTrue(self.kt_http_handle.set('b', 'y', expire=60))
+
+        with self.kt_http_handle.cursor() as cur:
+            records = [record for batch in cur.iter_batches(10, with_expire=True) for record in batch]
+
+        self.assertEqual([record[:2] for record in records], [('a', 'x'), ('b', 'y')])
+        self.assertEqual(records[0][2], None)
+        self.assertTrue(abs(records[1][2] - (time.time() + 60)) < 5)
+
+    def test_scan_script(self):
+        for kt in (self.kt_http_handle, self.kt_bin_handle):
+            for prefetch in (False, True):
+                records = list(kt.scan(batch_size=100, script='scan_batch', prefetch=prefetch))
+                self.assertEqual(len(records), len(self.records))
+                self.assertEqual(dict(records), self.records)
+
+            records = list(kt.scan('key0240', batch_size=3, script='scan_batch'))
+            self.assertEqual([key for key, value in records], ['key%04d' % i for i in range(240, 250)])
+
+            self.assertEqual(list(kt.scan(script='scan_batch', db=1)), [])
+
+            # Databases can be given by name, but not silently replaced by the first one...
+            self.assertRaises(KyotoTycoonException, lambda: list(kt.scan(script='scan_batch', db='missing.kch')))
+
+    def test_scan_cursor(self):
+        for prefetch in (False, True):
+            records = list(self.kt_http_handle.scan(batch_size=100, prefetch=prefetch))
+            self.assertEqual(len(records), len(self.records))
+            self.assertEqual(dict(records), self.records)
+
+        # Stopping early leaves the handle usable...
+        scan = self.kt_http_handle.scan(batch_size=10)
+        self.assertEqual(next(scan), ('key0000', 'value0'))
+        scan.close()
+
+        self.assertEqual(self.kt_http_handle.get('key0001'), 'value1')
+        self.assertRaises(NotImplementedError, lambda: list(self.kt_bin_handle.scan()))
+
+    def test_iter_match(self):
+        self.assertTrue(self.kt_http_handle.set('other', 'value'))
+        expected = ['key01%02d' % i for i in range(100)]
+
+        for kt, script in ((self.kt_http_handle, None), (self.kt_http_handle, 'match_page'),
+                           (self.kt_bin_handle, 'match_page')):
+            self.assertEqual(sorted(kt.iter_match_prefix('key01', page_size=7, script=script)), expected)
+            self.assertEqual(len(list(kt.iter_match_prefix('key01', limit=10, page_size=7, script=script))), 10)
+            self.assertEqual(list(kt.iter_match_prefix('nothing', script=script)), [])
+            self.assertEqual(list(kt.iter_match_prefix('key', db=1, script=script)), [])
+
+            self.assertEqual(sorted(kt.iter_match_regex('^key01', page_size=7, script=script)), expected)
+            self.assertEqual(list(kt.iter_match_regex('ther', script=script)), ['other'])
+
+            self.assertEqual(sorted(kt.iter_match_similar('key0100', 1, page_size=3, script=script)),
+                             ['key%04d' % i for i in [0, 100, 101, 102, 103, 104, 105, 106, 107, 108, 109,
+                                                      110, 120, 130, 140, 150, 160, 170, 180, 190, 200]])
+
+            self.assertRaises(ValueError, lambda: list(kt.iter_match_prefix(None, script=script)))
+            self.assertRaises(KyotoTycoonException,
+                              lambda: list(kt.iter_match_prefix('key', db='missing.kch', script=script)))
+
+        # Each request examines a bounded number of records, but the scan goes on...
+        self.assertEqual(list(self.kt_bin_handle.iter_match_regex('^other$', page_size=1, script='match_page')),
+                         ['other'])
+
+        self.assertRaises(NotImplementedError, lambda: list(self.kt_bin_handle.iter_match_prefix('key')))
+
+    def test_find_boundaries(self):
+        boundaries = find_boundaries(self.kt_http_handle, 4)
+        self.assertTrue(1 <= len(boundaries) <= 3)
+        self.assertEqual(boundaries, sorted(set(boundaries)))
+        self.assertTrue(all(key in self.records for key in boundaries))
+
+        self.assertEqual(find_boundaries(self.kt_http_handle, 1), [])
+        self.assertEqual(find_boundaries(self.kt_http_handle, 4, db=1), [])
+
+    def test_parallel_scan(self):
+        with KyotoTycoonPool(binary=False, port=11978, max_size=4) as pool:
+            for partitions, script in ((['key0050', 'key0100', 'key0200'], None), (None, None),
+                                       (['key0123'], 'scan_batch')):
+                scan = pool.parallel_scan(partitions=partitions, batch_size=30, script=script)
+                records = list(scan)
+
+                self.assertEqual(len(records), len(self.records))
+                self.assertEqual(dict(records), self.records)
+
+                progress = scan.progress()
+                self.assertEqual(sum(partition['count'] for partition in progress), len(self.records))
+                self.assertTrue(all(partition['done'] for partition in progress))
+
+            scan = pool.parallel_scan(partitions=['key0100'], with_expire=True)
+            self.assertEqual(scan.ranges(), [(None, 'key0100'), ('key0100', None)])
+            self.assertEqual(sorted(scan)[0], ('key0000', 'value0', None))
+
+    def test_parallel_scan_resume(self):
+        with KyotoTycoonPool(binary=False, port=11978, max_size=2) as pool:
+            scan = pool.parallel_scan(partitions=['key0100'], batch_size=20)
+            records = iter(scan)
+            seen = [next(records) for i in range(60)]
+            records.close()
+
+            checkpoint = json.loads(json.dumps(scan.checkpoint()))
+            self.assertEqual(sum(partition['count'] for partition in checkpoint['partitions']), 59)
+            self.assertFalse(any(partition['done'] for partition in checkpoint['partitions']))
+
+            resumed = list(pool.parallel_scan(checkpoint=checkpoint, batch_size=20))
+            self.assertEqual(len(seen) + len(resumed), len(self.records) + 1)  # ...the last one is repeated.
+            self.assertEqual(dict(seen + resumed), self.records)
+
+            self.assertEqual(pool.stats()['size'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
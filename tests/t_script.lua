@@ -49,3 +49,142 @@ function get(inmap, outmap)
    end
    return kt.RVSUCCESS
 end
+
+-- add deltas to several counters at once, with input records named
+-- "i<db>:<key>" (integer) or "d<db>:<key>" (double), returning the
+-- new totals for those counters that could be updated
+function increment_bulk(inmap, outmap)
+   local kt = __kyototycoon__
+   for name, num in pairs(inmap) do
+      local kind, idx, key = string.match(name, "^([id])(%d+):(.*)$")
+      local cdb = kind and kt.dbs[tonumber(idx) + 1]
+      if cdb and kind == "i" then
+         local total = cdb:increment(key, tonumber(num))
+         if total then
+            outmap[name] = string.format("%d", total)
+         end
+      elseif cdb then
+         local total = cdb:increment_double(key, tonumber(num))
+         if total then
+            outmap[name] = string.format("%.17g", total)
+         end
+      end
+   end
+   return kt.RVSUCCESS
+end
+
+-- return up to "max" records of database "db" (by index or name),
+-- starting at "key" (or the first record), as output records named
+-- "k<n>", "v<n>" and "x<n>" (if expiring) for n = 1..count, along with
+-- "count" and the key to start the next batch at in "next" (unless at
+-- the end)
+function scan_batch(inmap, outmap)
+   local kt = __kyototycoon__
+   local sdb
+   if not inmap.db or tonumber(inmap.db) then
+      sdb = kt.dbs[(tonumber(inmap.db) or 0) + 1]
+   else
+      sdb = kt.dbs[inmap.db]
+   end
+   local max = tonumber(inmap.max) or 1000
+   if not sdb then
+      return kt.RVEINVALID
+   end
+   local cur = sdb:cursor()
+   local count = 0
+   if cur:jump(inmap.key) then
+      while count < max do
+         local key, value, xt = cur:get(true)
+         if not key then
+            break
+         end
+         count = count + 1
+         outmap["k" .. count] = key
+         outmap["v" .. count] = value
+         if xt and xt < 1099511627775 then
+            outmap["x" .. count] = string.format("%d", xt)
+         end
+      end
+      local key = cur:get_key()
+      if key then
+         outmap.next = key
+      end
+   end
+   cur:disable()
+   outmap.count = tostring(count)
+   return kt.RVSUCCESS
+end
+
+-- return up to "max" keys of database "db" (by index or name) matching
+-- "pattern" as a prefix, regular expression or similar string (within
+-- distance "range"), according to "mode", as output records named "k<n>"
+-- for n = 1..count, starting at "key" (or the first record, or the
+-- prefix) and examining at most "scan" records, along with the key to
+-- resume at in "next" (unless at the end)
+function match_page(inmap, outmap)
+   local kt = __kyototycoon__
+   local mdb
+   if not inmap.db or tonumber(inmap.db) then
+      mdb = kt.dbs[(tonumber(inmap.db) or 0) + 1]
+   else
+      mdb = kt.dbs[inmap.db]
+   end
+   local mode = inmap.mode
+   local pattern = inmap.pattern
+   local max = tonumber(inmap.max) or 1000
+   local scan = tonumber(inmap.scan) or max * 100
+   local range = tonumber(inmap.range) or 0
+   if not mdb or not pattern then
+      return kt.RVEINVALID
+   end
+   local dbtype = tonumber(mdb:status()["type"])
+   local ordered = dbtype == 0x11 or dbtype == 0x22 or dbtype == 0x31 or dbtype == 0x41
+   local cur = mdb:cursor()
+   local found
+   if inmap.key then
+      found = cur:jump(inmap.key)
+      if not found then
+         cur:disable()
+         return kt.RVENOREC
+      end
+   elseif mode == "prefix" and ordered then
+      found = cur:jump(pattern)
+   else
+      found = cur:jump()
+   end
+   local count = 0
+   local scanned = 0
+   local finished = not found
+   while not finished and count < max and scanned < scan do
+      local key = cur:get_key()
+      if not key then
+         finished = true
+      elseif mode == "prefix" and ordered and key:sub(1, #pattern) ~= pattern then
+         finished = true
+      else
+         local matched
+         if mode == "prefix" then
+            matched = key:sub(1, #pattern) == pattern
+         elseif mode == "regex" then
+            matched = kt.regex(key, pattern)
+         else
+            matched = kt.levdist(key, pattern, true) <= range
+         end
+         if matched then
+            count = count + 1
+            outmap["k" .. count] = key
+         end
+         scanned = scanned + 1
+         cur:step()
+      end
+   end
+   if not finished then
+      local key = cur:get_key()
+      if key and not (mode == "prefix" and ordered and key:sub(1, #pattern) ~= pattern) then
+         outmap.next = key
+      end
+   end
+   cur:disable()
+   outmap.count = tostring(count)
+   return kt.RVSUCCESS
+end
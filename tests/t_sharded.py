@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import unittest
+from kyototycoon import KyotoTycoon, ShardedKyotoTycoon
+from kyototycoon.kt_sharded import HashRing
+
+# Two names for the same server, so records are split between them (and counted twice)...
+NODES = ['127.0.0.1:11978', ('localhost', 11978, 2)]
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_handle = KyotoTycoon(binary=False)
+        self.kt_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_handle.close()
+
+    def test_hash_ring(self):
+        ring = HashRing({'a': 1, 'b': 1, 'c': 2})
+        keys = ['key%d' % i for i in range(10000)]
+
+        groups = ring.split(keys)
+        self.assertEqual(sorted(groups.keys()), ['a', 'b', 'c'])
+        self.assertEqual(sum(len(group) for group in groups.values()), 10000)
+        self.assertTrue(1500 < len(groups['a']) < 3500)
+        self.assertTrue(3500 < len(groups['c']) < 6500)
+
+        # Adding a node only moves keys to that node...
+        bigger = HashRing({'a': 1, 'b': 1, 'c': 2, 'd': 1})
+        moved = [key for key in keys if bigger.node(key) != ring.node(key)]
+        self.assertTrue(0 < len(moved) < 3500)
+        self.assertTrue(all(bigger.node(key) == 'd' for key in moved))
+
+    def test_sharded(self):
+        for binary in (False, True):
+            self.assertTrue(self.kt_handle.clear())
+
+            with ShardedKyotoTycoon(NODES, binary=binary) as kt:
+                self.assertEqual(sorted(kt.shards.keys()), ['127.0.0.1:11978', 'localhost:11978'])
+                self.assertTrue(kt.echo())
+
+                self.assertTrue(kt.set('key', 'value'))
+                self.assertEqual(kt.get('key'), 'value')
+                self.assertEqual(kt.shard('key').get('key'), 'value')
+                self.assertTrue(kt.remove('key'))
+                self.assertEqual(kt.get('key'), None)
+
+                data = dict(('key%d' % i, 'value%d' % i) for i in range(100))
+                self.assertEqual(kt.set_bulk(data), 100)
+                self.assertEqual(kt.get_bulk(list(data.keys()) + ['missing']), data)
+                self.assertEqual(dict(kt.iter_get_bulk(data.keys(), chunk_keys=30)), data)
+
+                if not binary:
+                    self.assertEqual(kt.match_prefix('key1'),
+                                     sorted((['key1'] + ['key1%d' % i for i in range(10)]) * 2))
+                    self.assertEqual(kt.match_prefix('key1', 5), ['key1', 'key1', 'key10', 'key10', 'key11'])
+                    self.assertEqual(len(kt.match_regex('^key9')), 22)
+
+                self.assertEqual(kt.remove_bulk(['key%d' % i for i in range(50)]), 50)
+                self.assertEqual(sum(kt.iter_remove_bulk(['key%d' % i for i in range(40, 60)], chunk_keys=7)), 10)
+
+                if binary:
+                    records = [(0, 'a', 1, None), (0, 'b', 2, None), (0, 'c', 3, None)]
+                    self.assertEqual(kt.set_bulk_records(records), 3)
+                    self.assertEqual(sorted(kt.get_bulk_records([(0, 'a'), (0, 'c')])),
+                                     [(0, 'a', 1, None), (0, 'c', 3, None)])
+                    self.assertEqual(kt.remove_bulk_records([(0, 'a'), (0, 'b'), (0, 'c')]), 3)
+                else:
+                    self.assertEqual(kt.count(), 2 * 40)
+                    self.assertEqual(kt.increment('counter', 5), 5)
+
+                    status = kt.status()
+                    self.assertEqual(sorted(status.keys()), ['127.0.0.1:11978', 'localhost:11978'])
+
+        self.assertRaises(AttributeError, getattr, kt, 'cursor')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@
 
 import config
 import unittest
-from kyototycoon import KyotoTycoon
+from kyototycoon import KyotoTycoon, KyotoTycoonException
 from kyototycoon.kt_binary import KT_PACKER_PICKLE
 
 class UnitTest(unittest.TestCase):
@@ -120,6 +120,19 @@ class UnitTest(unittest.TestCase):
         d = self.kt_handle.get_bulk([], atomic=False)
         self.assertEqual(d, {})
 
+    def test_noreply(self):
+        self.assertTrue(self.kt_handle_http.clear())
+
+        self.assertEqual(self.kt_handle.set_bulk({'a': 1, 'b': 2}, noreply=True), None)
+        self.assertEqual(self.kt_handle.remove_bulk(['a'], noreply=True), None)
+        self.assertEqual(self.kt_handle.play_script('no_such_procedure', noreply=True), None)
+
+        # The connection must still be in sync afterwards...
+        self.assertEqual(self.kt_handle.get_bulk(['a', 'b'], atomic=False), {'b': 2})
+        self.assertEqual(self.kt_handle_http.count(), 1)
+
+        self.assertRaises(KyotoTycoonException, self.kt_handle_http.set_bulk, {'a': 1}, noreply=True)
+
     def test_large_key(self):
         large_key = 'x' * self.LARGE_KEY_LEN
         self.assertTrue(self.kt_handle.set(large_key, 'value'))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+#
+# This test does not require a KT server.
+#
+
+import config
+import socket
+import struct
+import unittest
+from kyototycoon.kt_socket import BufferedReader
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.writer, self.sock = socket.socketpair()
+        self.reader = BufferedReader(self.sock, bufsize=16)
+
+    def tearDown(self):
+        self.writer.close()
+        self.sock.close()
+
+    def test_fields(self):
+        self.writer.sendall(struct.pack('!BI', 0xba, 3) + b'abc' + b'0123456789' * 3)
+
+        self.assertEqual(self.reader.unpack(struct.Struct('!B')), (0xba,))
+        self.assertEqual(self.reader.unpack(struct.Struct('!I')), (3,))
+        self.assertEqual(self.reader.read(3), b'abc')
+
+        # Larger than the buffer itself...
+        self.assertEqual(self.reader.read(30), b'0123456789' * 3)
+
+    def test_compaction(self):
+        for i in range(10):
+            self.writer.sendall(struct.pack('!HI', i, 5) + b'value')
+
+        for i in range(10):
+            self.assertEqual(self.reader.unpack(struct.Struct('!HI')), (i, 5))
+            self.assertEqual(self.reader.read(5), b'value')
+
+    def test_readline(self):
+        self.writer.sendall(b'HTTP/1.1 200\r\nA: b\r\n\r\nrest')
+
+        self.assertEqual(self.reader.readline(), b'HTTP/1.1 200\r\n')
+        self.assertEqual(self.reader.readline(), b'A: b\r\n')
+        self.assertEqual(self.reader.readline(), b'\r\n')
+        self.assertEqual(self.reader.recv(100), b'rest')
+
+        # Longer than the buffer...
+        self.writer.sendall(b'x' * 20 + b'\n')
+        self.assertRaises(IOError, self.reader.readline)
+
+    def test_eof(self):
+        self.writer.sendall(b'ab')
+        self.writer.close()
+
+        self.assertEqual(self.reader.read(1), b'a')
+        self.assertRaises(IOError, self.reader.read, 2)
+
+if __name__ == '__main__':
+    unittest.main()
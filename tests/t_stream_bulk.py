@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import unittest
+from kyototycoon import KyotoTycoon, KyotoTycoonException
+
+NUM_RECORDS = 2500
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+    def _test_stream_bulk(self, kt_handle):
+        self.assertTrue(self.kt_http_handle.clear())
+
+        records = (('key%d' % i, i) for i in range(NUM_RECORDS))
+        counts = list(kt_handle.iter_set_bulk(records, chunk_keys=1000))
+        self.assertEqual(counts, [1000, 1000, 500])
+        self.assertEqual(self.kt_http_handle.count(), NUM_RECORDS)
+
+        keys = ('key%d' % i for i in range(NUM_RECORDS + 100))
+        values = dict(kt_handle.iter_get_bulk(keys, chunk_keys=100))
+        self.assertEqual(len(values), NUM_RECORDS)
+        self.assertEqual(values['key1234'], 1234)
+
+        # Abandoning the iteration must not leave the connection out of sync...
+        items = kt_handle.iter_get_bulk(['key%d' % i for i in range(NUM_RECORDS)], chunk_keys=10)
+        self.assertEqual(len(next(items)), 2)
+        items.close()
+        self.assertEqual(kt_handle.get('key10'), 10)
+
+        counts = kt_handle.iter_set_bulk({'a': 'x' * 100, 'b': 'y' * 100}, chunk_bytes=50)
+        self.assertEqual(list(counts), [1, 1])
+
+        # Keys are measured in (UTF-8) bytes, not characters...
+        counts = kt_handle.iter_remove_bulk([u'\xe9' * 10, u'\xe8' * 10], chunk_bytes=30)
+        self.assertEqual(list(counts), [0, 0])
+
+        keys = ['key%d' % i for i in range(NUM_RECORDS)]
+        self.assertEqual(sum(kt_handle.iter_remove_bulk(keys, chunk_keys=300)), NUM_RECORDS)
+        self.assertEqual(self.kt_http_handle.count(), 2)
+
+    def test_on_chunk(self):
+        for kt_handle in (self.kt_http_handle, self.kt_bin_handle):
+            core = kt_handle.core
+            done = []
+
+            counts = core.iter_set_bulk([('a', 1), ('b', 2), ('c', 3)], None, False, chunk_keys=2,
+                                        on_chunk=done.append)
+            self.assertEqual(next(counts), 2)
+            self.assertEqual(done, [['a', 'b']])
+            self.assertEqual(list(counts), [1])
+            self.assertEqual(done, [['a', 'b'], ['c']])
+
+            # Chunks sent but abandoned are reported too...
+            del done[:]
+            counts = core.iter_remove_bulk(['a', 'b', 'c'], False, chunk_keys=1, in_flight=2, on_chunk=done.append)
+            self.assertEqual(next(counts), 1)
+            counts.close()
+            self.assertEqual(done[0], ['a'])
+            self.assertTrue(len(done) <= 2)
+            self.assertEqual(kt_handle.get('a'), None)
+
+    def test_stream_bulk_http(self):
+        self._test_stream_bulk(self.kt_http_handle)
+
+    def test_stream_bulk_bin(self):
+        self._test_stream_bulk(self.kt_bin_handle)
+        self.assertRaises(KyotoTycoonException, self.kt_bin_handle.iter_get_bulk, ['a'], atomic=True)
+
+if __name__ == '__main__':
+    unittest.main()
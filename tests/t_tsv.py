@@ -6,20 +6,85 @@
 # the BSD license. See COPYING file for license description.
 
 import config
+import io
+import os
 import unittest
-from kyototycoon import KyotoTycoon
+from kyototycoon import KyotoTycoon, KT_PACKER_BYTES
+from kyototycoon.kt_http import _tsv_request, _dict_to_request, _iter_tsv, _url_encode, _b64_encode
 
 class UnitTest(unittest.TestCase):
     def setUp(self):
         self.kt_handle = KyotoTycoon()
         self.kt_handle.open(port=11978)
 
+    def tearDown(self):
+        self.kt_handle.close()
+
     def test_tsv_rpc(self):
         key = 'tabbed\tkey'
         value = 'tabs\tin\tvalue'
 
         self.assertTrue(self.kt_handle.clear())
         self.assertEqual(self.kt_handle.increment(key, 1024), 1024)
+        self.assertEqual(self.kt_handle.increment(key, 1), 1025)
+
+        self.assertTrue(self.kt_handle.set(key, value))
+        self.assertEqual(self.kt_handle.get(key), value)
+        self.assertEqual(self.kt_handle.get_bulk([key]), {key: value})
+        self.assertEqual(self.kt_handle.match_prefix('tabbed\t'), [key])
+        self.assertEqual(self.kt_handle.remove_bulk([key]), 1)
+
+    def test_column_encoding(self):
+        body, headers = _tsv_request([(b'_key', b'value'), (b'atomic', b'')])
+        self.assertEqual(body, b'_key\tvalue\natomic\t\n')
+        self.assertEqual(headers['Content-Type'], 'text/tab-separated-values')
+
+        body, headers = _tsv_request([(b'_key', b'some\ttabbed text, 100%\n')])
+        self.assertEqual(body, b'_key\tsome%09tabbed text, 100%25%0A\n')
+        self.assertTrue(headers['Content-Type'].endswith('colenc=U'))
+
+        body, headers = _tsv_request([(b'_key', b'\x00\x01\x02\t\n\xff')])
+        self.assertEqual(body, b'X2tleQ==\tAAECCQr/\n')
+        self.assertTrue(headers['Content-Type'].endswith('colenc=B'))
+
+        body, headers = _dict_to_request({'DB': 1})
+        self.assertEqual(body, b'DB\t1\n')
+
+    def test_streaming_decoder(self):
+        rows = [(b'_key%d' % i, b'value\x00%d' % i * (i % 7)) for i in range(100)] + [(b'_long', b'x' * 5000)]
+
+        for colenc, encode in (('', lambda x: x), ('; colenc=B', _b64_encode), ('; colenc=U', _url_encode)):
+            body = b''.join(encode(k) + b'\t' + encode(v) + b'\n' for k, v in rows)
+            content_type = 'text/tab-separated-values' + colenc
+
+            for chunk_size in (1, 7, 64, 65536):
+                self.assertEqual(list(_iter_tsv(io.BytesIO(body), content_type, chunk_size)), rows)
+
+        # The last row may not end with a line break, and malformed rows are skipped...
+        body = b'a\t1\nbad row\n\nb\t2'
+        self.assertEqual(list(_iter_tsv(io.BytesIO(body), 'text/tab-separated-values', 3)), [(b'a', b'1'), (b'b', b'2')])
+
+    def test_binary_values(self):
+        kt = KyotoTycoon(pack_type=KT_PACKER_BYTES)
+        kt.open(port=11978)
+
+        values = {'random': os.urandom(4096), 'text': b'line 1\nline 2\t+%', 'plain': b'plain',
+                  'high': u'\u00e1\u00e9\u00ed'.encode('utf-8'), 'empty': b''}
+
+        self.assertTrue(kt.clear())
+
+        for key, value in values.items():
+            self.assertTrue(kt.set(key, value))
+            self.assertEqual(kt.get(key), value)
+
+        self.assertTrue(kt.clear())
+        self.assertEqual(kt.set_bulk(values), len(values))
+        self.assertEqual(kt.get_bulk(list(values.keys())), values)
+
+        # Scripts take the same path, with mixed values...
+        self.assertEqual(kt.play_script('echo', values), values)
+
+        kt.close()
 
 
 if __name__ == '__main__':
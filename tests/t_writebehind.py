@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright 2015, Carlos Rodrigues
+#
+# Redistribution and use of this source code is licensed under
+# the BSD license. See COPYING file for license description.
+
+import config
+import time
+import unittest
+from kyototycoon import KyotoTycoon, WriteBehind
+
+class UnitTest(unittest.TestCase):
+    def setUp(self):
+        self.kt_http_handle = KyotoTycoon(binary=False)
+        self.kt_http_handle.open(port=11978)
+
+        self.kt_bin_handle = KyotoTycoon(binary=True)
+        self.kt_bin_handle.open(port=11978)
+
+    def tearDown(self):
+        self.kt_http_handle.close()
+        self.kt_bin_handle.close()
+
+    def test_write_behind(self):
+        for kt in (self.kt_http_handle, self.kt_bin_handle):
+            self.assertTrue(self.kt_http_handle.clear())
+
+            with WriteBehind(kt, max_items=10, max_age=None) as buffer:
+                buffer.set('a', 'one')
+                buffer.set('a', 'two')
+                buffer.set('b', 'three', expire=60)
+                buffer.set('c', 'four', db=1)
+                buffer.remove('b')
+
+                self.assertEqual(len(buffer), 3)
+                self.assertEqual(buffer.get('a'), 'two')
+                self.assertEqual(buffer.get('b'), None)
+                self.assertEqual(kt.get('a'), None)
+
+                self.assertTrue(buffer.flush())
+                self.assertEqual(len(buffer), 0)
+                self.assertEqual(kt.get('a'), 'two')
+                self.assertEqual(kt.get('b'), None)
+                self.assertEqual(kt.get('c', db=1), 'four')
+
+                stats = buffer.stats()
+                self.assertEqual(stats['writes'], 5)
+                self.assertEqual(stats['coalesced'], 2)
+                self.assertEqual(stats['flushed'], 3)
+                self.assertEqual(stats['dropped'], 0)
+
+                # Flushed once the buffer is full...
+                for i in range(10):
+                    buffer.set('key%d' % i, i)
+
+                self.assertEqual(len(buffer), 0)
+                self.assertEqual(kt.get('key9'), 9)
+
+                buffer.set('d', 'five', expire=60)
+                buffer.remove('a')
+
+            # Flushed when leaving the "with" block...
+            self.assertEqual(kt.get('d'), 'five')
+            self.assertEqual(kt.get('a'), None)
+            self.assertEqual(self.kt_http_handle.count(), 11)
+
+        self.assertTrue(self.kt_http_handle.clear(db=1))
+
+    def test_max_age(self):
+        buffer = WriteBehind(self.kt_bin_handle, max_age=0.1)
+
+        # Flushed by the background thread, without any further writes...
+        buffer.set('e', 'six')
+        buffer.set('f', 'seven')
+        time.sleep(0.5)
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.get('e'), 'six')
+        self.assertEqual(buffer.get('f'), 'seven')
+
+        buffer.set('g', 'eight')
+        buffer.close()
+
+        self.assertFalse(buffer.thread.is_alive())
+        self.assertEqual(self.kt_bin_handle.get('g'), 'eight')
+
+    def test_dropped_writes(self):
+        errors = []
+
+        kt = KyotoTycoon(binary=True)
+        kt.open(port=11978)
+        kt.close()  # ...all writes will fail.
+
+        buffer = WriteBehind(kt, on_error=lambda e, records: errors.append(sorted(records)))
+        buffer.set('g', 'eight')
+        buffer.set('h', 'nine', db=1)
+        buffer.remove('i')
+
+        self.assertFalse(buffer.flush())
+        self.assertEqual(buffer.stats()['dropped'], 3)
+        self.assertTrue(buffer.last_error is not None)
+        self.assertEqual(errors, [[(0, 'g'), (1, 'h')], [(0, 'i')]])
+        self.assertEqual(len(buffer), 0)
+        buffer.close()
+
+if __name__ == '__main__':
+    unittest.main()